@@ -0,0 +1,382 @@
+"""
+Bulk inventory analytics over document history (NumPy).
+
+Postgres does the per-period group-by in one indexed range scan. The
+result (one row per material x period, not per document line) is loaded
+into arrays, and the classification runs as vectorized operations over
+them: a dense material x period demand matrix built with bincount,
+argsort + cumsum for value shares, and mean/std along the period axis.
+50k materials x 104 weeks is ~5M cells, so about 40 MB and well under a
+second of NumPy work.
+
+Computed reports are kept in ReportCache, keyed by window and parameters
+plus a data version (max id of the source table). New documents change
+the version at once. Edits and deletes that keep the max id are picked
+up within ANALYTICS_CACHE_TTL_SECONDS.
+
+Reports: ABC/XYZ per material (AbcXyz) and reorder points with order
+suggestions per (warehouse, material) (Replenishment).
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, time as dtime, timedelta, timezone
+from statistics import NormalDist
+from typing import Callable, Optional
+
+import numpy as np
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .models import Material, StockCurrent
+from .stock_service import current_quantity
+from .utils import EXCHANGE_RATES_UAH, QTY_SCALE
+
+PERIODS = ("week", "month")
+_DAY_US = 86_400_000_000
+
+# Видача по матеріалу за період; вартість у гривні за курсами utils.EXCHANGE_RATES_UAH
+_ISSUE_DEMAND_SQL = text("""
+    SELECT ii.material_id,
+           (EXTRACT(EPOCH FROM date_trunc(CAST(:period AS text), i.date AT TIME ZONE 'UTC')) * 1000000)::bigint,
+           SUM(ii.qty)::float8,
+           SUM(ii.total_price * COALESCE(fx.rate, 1))::float8
+    FROM issue_items ii
+    JOIN issues i ON i.id = ii.issue_id
+    LEFT JOIN unnest(CAST(:codes AS text[]), CAST(:rates AS numeric[])) AS fx(code, rate)
+           ON fx.code = ii.currency
+    WHERE i.date >= :ts_from AND i.date < :ts_to
+      AND (CAST(:warehouse_id AS integer) IS NULL OR ii.warehouse_id = :warehouse_id)
+    GROUP BY 1, 2
+""")
+
+_ISSUE_VERSION_SQL = text("SELECT COALESCE(MAX(id), 0) FROM issue_items")
+
+# Денна видача по парі (склад, матеріал); днів без видачі тут немає — вони нулі
+_PAIR_DAILY_DEMAND_SQL = text("""
+    SELECT ii.warehouse_id, ii.material_id, SUM(ii.qty)::float8
+    FROM issue_items ii
+    JOIN issues i ON i.id = ii.issue_id
+    WHERE i.date >= :ts_from AND i.date < :ts_to
+      AND ii.warehouse_id IS NOT NULL
+      AND (CAST(:warehouse_id AS integer) IS NULL OR ii.warehouse_id = :warehouse_id)
+    GROUP BY ii.warehouse_id, ii.material_id, (i.date AT TIME ZONE 'UTC')::date
+""")
+
+# Останнє надходження від постачальника по кожному матеріалу
+_LAST_SUPPLIER_SQL = text("""
+    SELECT DISTINCT ON (ri.material_id) ri.material_id, r.supplier_id, ri.unit_price, ri.currency
+    FROM receipt_items ri
+    JOIN receipts r ON r.id = ri.receipt_id
+    WHERE r.supplier_id IS NOT NULL
+    ORDER BY ri.material_id, r.date DESC, r.id DESC
+""")
+
+# Кожен рух залишку пише рядок журналу — нова версія = нові рухи
+_LEDGER_VERSION_SQL = text("SELECT COALESCE(MAX(id), 0) FROM stock_ledger")
+
+
+def period_index(ts_us: np.ndarray, period: str) -> np.ndarray:
+    """Epoch µs (UTC) -> sequential period number; weeks start on Monday like date_trunc."""
+    ts_us = np.asarray(ts_us, dtype=np.int64)
+    if period == "month":
+        return ts_us.astype("datetime64[us]").astype("datetime64[M]").astype(np.int64)
+    # 1970-01-01 — четвер, +3 дні зсуває межу тижня на понеділок
+    return np.floor_divide(np.floor_divide(ts_us, _DAY_US) + 3, 7)
+
+
+def window_bounds(date_from: date, date_to: date) -> tuple:
+    """Inclusive calendar dates -> [ts_from, ts_to) as UTC datetimes."""
+    ts_from = datetime.combine(date_from, dtime.min, tzinfo=timezone.utc)
+    ts_to = datetime.combine(date_to + timedelta(days=1), dtime.min, tzinfo=timezone.utc)
+    return ts_from, ts_to
+
+
+def _us(dt: datetime) -> int:
+    return int(dt.timestamp() * 1_000_000)
+
+
+def issue_version(db: Session) -> int:
+    return db.execute(_ISSUE_VERSION_SQL).scalar() or 0
+
+
+def ledger_version(db: Session) -> int:
+    return db.execute(_LEDGER_VERSION_SQL).scalar() or 0
+
+
+def pair_key(warehouse_id, material_id) -> np.ndarray:
+    """(warehouse_id, material_id) -> one sortable int64."""
+    return (np.asarray(warehouse_id, dtype=np.int64) << 32) | np.asarray(material_id, dtype=np.int64)
+
+
+def load_issue_demand(
+    db: Session, ts_from: datetime, ts_to: datetime, period: str, warehouse_id: Optional[int] = None
+):
+    """(material_id, period, qty, value_uah) arrays; one element per material x period with issues."""
+    rows = db.execute(_ISSUE_DEMAND_SQL, {
+        "period": period,
+        "codes": list(EXCHANGE_RATES_UAH),
+        "rates": list(EXCHANGE_RATES_UAH.values()),
+        "ts_from": ts_from,
+        "ts_to": ts_to,
+        "warehouse_id": warehouse_id,
+    }).all()
+    data = np.array(rows, dtype=np.float64).reshape(-1, 4)
+    return (
+        data[:, 0].astype(np.int64),
+        period_index(data[:, 1].astype(np.int64), period),
+        data[:, 2],
+        data[:, 3],
+    )
+
+
+class AbcXyz:
+    """
+    ABC за часткою вартості видачі, XYZ за коефіцієнтом варіації попиту по періодах.
+
+    ABC: materials sorted by issue value, descending. A material is A while
+    the cumulative share before it is below a_share, then B below b_share,
+    else C. So the material that crosses a threshold still belongs to the
+    upper class.
+    XYZ: CV = std / mean of issued qty over all periods of the window,
+    including periods with no issues (population std). X if CV <= x_cv,
+    Y if CV <= y_cv, else Z.
+    Only materials with at least one issue in the window are classified.
+    """
+
+    def __init__(self, material_id, period, qty, value, n_periods: int,
+                 a_share: float, b_share: float, x_cv: float, y_cv: float):
+        ids, inv = np.unique(material_id, return_inverse=True)
+        m = ids.size
+        demand = np.bincount(inv * n_periods + period, weights=qty, minlength=m * n_periods)
+        demand = demand.reshape(m, n_periods)
+
+        self.material_id = ids
+        self.value = np.bincount(inv, weights=value, minlength=m)
+        self.qty = demand.sum(axis=1)
+        self.active_periods = np.count_nonzero(demand, axis=1)
+        self.mean = demand.mean(axis=1)
+        std = demand.std(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.cv = np.where(self.mean > 0, std / self.mean, np.inf)
+
+        total = self.value.sum()
+        self.share = self.value / total if total > 0 else np.zeros(m)
+        # порядок за спаданням вартості; при рівності — за id
+        self.order = np.lexsort((ids, -self.value))
+        cumulative = np.empty(m)
+        cumulative[self.order] = np.cumsum(self.share[self.order])
+        self.cumulative = cumulative
+        before = cumulative - self.share
+        self.abc = np.where(before < a_share, "A", np.where(before < b_share, "B", "C"))
+        self.xyz = np.where(self.cv <= x_cv, "X", np.where(self.cv <= y_cv, "Y", "Z"))
+        self.total_value = float(total)
+        self.n_periods = n_periods
+
+    def select(self, cls: Optional[str] = None) -> np.ndarray:
+        """Positions (in value order) of materials in class cls: "A", "AX", ... or all."""
+        order = self.order
+        if cls:
+            keep = self.abc[order] == cls[0]
+            if len(cls) > 1:
+                keep &= self.xyz[order] == cls[1]
+            order = order[keep]
+        return order
+
+    def matrix(self) -> dict:
+        """Кількість матеріалів і вартість у кожній клітинці ABC x XYZ."""
+        out = {}
+        for a in "ABC":
+            for x in "XYZ":
+                m = (self.abc == a) & (self.xyz == x)
+                out[a + x] = {"materials": int(m.sum()), "value": round(float(self.value[m].sum()), 2)}
+        return out
+
+
+def abc_xyz(
+    db: Session, date_from: date, date_to: date, period: str, warehouse_id: Optional[int],
+    a_share: float, b_share: float, x_cv: float, y_cv: float,
+) -> AbcXyz:
+    ts_from, ts_to = window_bounds(date_from, date_to)
+    first = int(period_index(np.array([_us(ts_from)]), period)[0])
+    last = int(period_index(np.array([_us(ts_to) - 1]), period)[0])
+    material_id, pidx, qty, value = load_issue_demand(db, ts_from, ts_to, period, warehouse_id)
+    return AbcXyz(material_id, pidx - first, qty, value, last - first + 1, a_share, b_share, x_cv, y_cv)
+
+
+class Replenishment:
+    """
+    Точка замовлення і рекомендована кількість для кожної пари (склад, матеріал).
+
+    Over a lookback of n days, with d = mean daily issued qty and
+    sigma = std of daily qty (days without issues count as 0):
+        safety stock  = z(service_level) * sigma * sqrt(lead_time_days)
+        reorder point = max(d * lead_time_days + safety stock, Material.min_stock)
+        order-up-to   = reorder point + d * review_days
+    A pair is suggested when available (quantity - reserved + unfolded
+    journal deltas) <= reorder point, for order-up-to - available, rounded
+    up to 0.0001. The supplier and price come from the material's last
+    receipt with a supplier. Without one, Material.price is used and
+    supplier_id is None.
+    Lead time is a parameter. Receipts carry no order date, so the history
+    has nothing to measure it from.
+    """
+
+    def __init__(self, stock, demand, suppliers, lookback_days: int,
+                 lead_time_days: float, review_days: float, service_level: float):
+        # stock: (warehouse_id, material_id, available, min_stock, price, currency)
+        # stock_current без унікального ключа — дублікати пар сумуємо
+        keys, first, inv = np.unique(pair_key(stock[0], stock[1]), return_index=True, return_inverse=True)
+        n = keys.size
+        self.warehouse_id = np.asarray(stock[0], dtype=np.int64)[first]
+        self.material_id = np.asarray(stock[1], dtype=np.int64)[first]
+        self.available = np.bincount(inv, weights=stock[2], minlength=n)
+        min_stock = np.asarray(stock[3], dtype=np.float64)[first]
+
+        # demand: (warehouse_id, material_id, qty за день) -> суми по парі
+        dkeys = pair_key(demand[0], demand[1])
+        pos = np.searchsorted(keys, dkeys)
+        pos = np.minimum(pos, max(n - 1, 0))
+        known = (keys[pos] == dkeys) if n else np.zeros(dkeys.size, dtype=bool)
+        qty = np.asarray(demand[2], dtype=np.float64)[known]
+        s1 = np.bincount(pos[known], weights=qty, minlength=n)
+        s2 = np.bincount(pos[known], weights=qty * qty, minlength=n)
+        self.daily_demand = s1 / lookback_days
+        self.daily_std = np.sqrt(np.maximum(s2 / lookback_days - self.daily_demand ** 2, 0))
+
+        z = NormalDist().inv_cdf(service_level)
+        self.safety_stock = z * self.daily_std * np.sqrt(lead_time_days)
+        self.reorder_point = np.maximum(self.daily_demand * lead_time_days + self.safety_stock, min_stock)
+        self.order_up_to = self.reorder_point + self.daily_demand * review_days
+        need = np.where(self.available <= self.reorder_point, self.order_up_to - self.available, 0)
+        self.suggested_qty = np.ceil(np.maximum(need, 0) * QTY_SCALE - 1e-6) / QTY_SCALE
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.days_of_cover = np.where(self.daily_demand > 0, self.available / self.daily_demand, np.inf)
+
+        # постачальник і ціна: останнє надходження, інакше ціна з довідника
+        sup_material, sup_id, sup_price, sup_currency = suppliers
+        self.supplier_id = np.full(n, -1, dtype=np.int64)
+        self.unit_price = np.asarray(stock[4], dtype=np.float64)[first]
+        self.currency = np.asarray(stock[5], dtype=object)[first]
+        if len(sup_material):
+            spos = np.minimum(np.searchsorted(sup_material, self.material_id), len(sup_material) - 1)
+            found = sup_material[spos] == self.material_id
+            self.supplier_id[found] = sup_id[spos[found]]
+            self.unit_price[found] = sup_price[spos[found]]
+            self.currency[found] = sup_currency[spos[found]]
+
+        # рекомендації: за постачальником, далі склад, матеріал
+        suggested = np.flatnonzero(self.suggested_qty > 0)
+        self.suggested = suggested[np.lexsort((
+            self.material_id[suggested], self.warehouse_id[suggested], self.supplier_id[suggested]
+        ))]
+        self.pairs = n
+
+    def select(self, only_suggested: bool = True) -> np.ndarray:
+        if only_suggested:
+            return self.suggested
+        return np.lexsort((self.material_id, self.warehouse_id))
+
+    def drafts(self) -> list:
+        """Чернетки надходжень по постачальниках (формат ReceiptCreate без document_number)."""
+        out = []
+        idx = self.suggested
+        if idx.size == 0:
+            return out
+        suppliers = self.supplier_id[idx]
+        starts = np.flatnonzero(np.r_[True, suppliers[1:] != suppliers[:-1]])
+        for group in np.split(idx, starts[1:]):
+            supplier_id = int(self.supplier_id[group[0]])
+            items = [
+                {
+                    "material_id": int(self.material_id[i]),
+                    "warehouse_id": int(self.warehouse_id[i]),
+                    "qty": round(float(self.suggested_qty[i]), 4),
+                    "unit_price": round(float(self.unit_price[i]), 2),
+                    "currency": self.currency[i] or "UAH",
+                }
+                for i in group
+            ]
+            out.append({"supplier_id": supplier_id if supplier_id >= 0 else None, "items": items})
+        return out
+
+
+def replenishment(
+    db: Session, lookback_days: int, lead_time_days: float, review_days: float,
+    service_level: float, warehouse_id: Optional[int] = None,
+) -> Replenishment:
+    today = datetime.now(timezone.utc).date()
+    ts_from, ts_to = window_bounds(today - timedelta(days=lookback_days - 1), today)
+
+    q = (
+        select(
+            StockCurrent.warehouse_id,
+            StockCurrent.material_id,
+            current_quantity() - StockCurrent.reserved_quantity,
+            Material.min_stock,
+            Material.price,
+            Material.currency,
+        )
+        .join(Material, Material.id == StockCurrent.material_id)
+        .where(Material.is_active.is_(True))
+    )
+    if warehouse_id:
+        q = q.where(StockCurrent.warehouse_id == warehouse_id)
+    rows = db.execute(q).all()
+    stock = (
+        np.array([r[0] for r in rows], dtype=np.int64),
+        np.array([r[1] for r in rows], dtype=np.int64),
+        np.array([r[2] for r in rows], dtype=np.float64),
+        np.array([r[3] for r in rows], dtype=np.float64),
+        np.array([r[4] for r in rows], dtype=np.float64),
+        np.array([r[5] for r in rows], dtype=object),
+    )
+
+    data = np.array(db.execute(_PAIR_DAILY_DEMAND_SQL, {
+        "ts_from": ts_from, "ts_to": ts_to, "warehouse_id": warehouse_id,
+    }).all(), dtype=np.float64).reshape(-1, 3)
+    demand = (data[:, 0].astype(np.int64), data[:, 1].astype(np.int64), data[:, 2])
+
+    rows = db.execute(_LAST_SUPPLIER_SQL).all()
+    suppliers = (
+        np.array([r[0] for r in rows], dtype=np.int64),
+        np.array([r[1] for r in rows], dtype=np.int64),
+        np.array([r[2] for r in rows], dtype=np.float64),
+        np.array([r[3] for r in rows], dtype=object),
+    )
+    return Replenishment(stock, demand, suppliers, lookback_days, lead_time_days, review_days, service_level)
+
+
+class ReportCache:
+    """Thread-safe LRU of computed reports with a TTL."""
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._items: OrderedDict = OrderedDict()  # key -> (monotonic, value)
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute: Callable):
+        """Returns (value, hit)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self._items.move_to_end(key)
+                return entry[1], True
+        # рахуємо поза локом: інші вікна не чекають на важкий звіт
+        value = compute()
+        with self._lock:
+            self._items[key] = (time.monotonic(), value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return value, False
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+reports = ReportCache(settings.ANALYTICS_CACHE_SIZE, settings.ANALYTICS_CACHE_TTL_SECONDS)
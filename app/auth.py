@@ -1,12 +1,17 @@
-import json
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
 import requests
-from jose import jwt
+from jose import jwk, jwt
 from jose.exceptions import JWTError, ExpiredSignatureError
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from functools import lru_cache
 from .config import settings
-from typing import Union, List
+from typing import Optional, Union, List
+
+log = logging.getLogger(__name__)
 
 if getattr(settings, "AUTH_DISABLED", False):
     def get_current_user_dummy(*args, **kwargs):
@@ -42,37 +47,133 @@ if getattr(settings, "AUTH_DISABLED", False):
     
 auth_scheme = HTTPBearer()
 
-@lru_cache()
+
+class JWKSCache:
+    """
+    Public keys from the Auth0 JWKS, pre-parsed into jose Key objects per kid.
+    Refreshed by a background thread every JWKS_TTL_SECONDS; an unknown kid
+    schedules an early refresh (at most once per JWKS_MIN_REFRESH_SECONDS).
+    Only a cold cache is ever fetched on the request path.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self._keys: dict = {}
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self) -> None:
+        with self._lock:
+            r = requests.get(self.url, timeout=5)
+            r.raise_for_status()
+            keys = {}
+            for k in r.json().get("keys", []):
+                if k.get("kid") and k.get("kty") == "RSA":
+                    keys[k["kid"]] = jwk.construct(k, algorithm=k.get("alg", "RS256"))
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="jwks-refresh", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(timeout=settings.JWKS_TTL_SECONDS)
+            self._wake.clear()
+            try:
+                self.refresh()
+            except Exception as e:
+                log.warning("JWKS refresh failed: %s", e)
+            # не частіше ніж раз на JWKS_MIN_REFRESH_SECONDS, навіть при потоці невідомих kid
+            time.sleep(settings.JWKS_MIN_REFRESH_SECONDS)
+
+    def get(self, kid: str):
+        if not self._keys:
+            try:
+                self.refresh()
+            except Exception:
+                raise HTTPException(status_code=503, detail="Unable to fetch JWKS")
+        key = self._keys.get(kid)
+        if key is None:
+            self._wake.set()
+        return key
+
+
+jwks_cache = JWKSCache(settings.AUTH0_JWKS_URL or f"https://{settings.AUTH0_DOMAIN}/.well-known/jwks.json")
+
+
+class VerifiedTokenCache:
+    """Bounded LRU of verified claims keyed by sha256(token); entries die at token exp."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token: str) -> Optional[dict]:
+        k = self._key(token)
+        with self._lock:
+            hit = self._items.get(k)
+            if hit is None:
+                return None
+            payload, exp = hit
+            if exp <= time.time():
+                del self._items[k]
+                return None
+            self._items.move_to_end(k)
+            return payload
+
+    def put(self, token: str, payload: dict) -> None:
+        exp = payload.get("exp")
+        if not isinstance(exp, (int, float)) or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._items[self._key(token)] = (payload, float(exp))
+            self._items.move_to_end(self._key(token))
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+
+token_cache = VerifiedTokenCache(settings.TOKEN_CACHE_SIZE)
+
+
 def get_jwks():
-    jwks_url = f"https://{settings.AUTH0_DOMAIN}/.well-known/jwks.json"
-    r = requests.get(jwks_url, timeout=5)
-    r.raise_for_status()
-    return r.json()
+    """Raw view of the cached key set (kid -> jose Key)."""
+    return jwks_cache._keys
+
 
 # helper: find the correct key from jwks by kid
 def get_public_key_for_token(token: str):
-    unverified_header = jwt.get_unverified_header(token)
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except JWTError as e:
+        raise HTTPException(status_code=401, detail=f"Token invalid: {str(e)}")
     kid = unverified_header.get("kid")
     if not kid:
         raise HTTPException(status_code=401, detail="Invalid token header: kid missing")
-    jwks = get_jwks()
-    key = None
-    for k in jwks.get("keys", []):
-        if k.get("kid") == kid:
-            key = k
-            break
+    key = jwks_cache.get(kid)
     if key is None:
         raise HTTPException(status_code=401, detail="Appropriate JWK not found")
-    # python-jose can decode using the JWK directly (pass the dict via json.dumps)
     return key
 
 
 def verify_jwt(token: str):
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
     key = get_public_key_for_token(token)
     try:
         payload = jwt.decode(
             token,
-            key=json.dumps(key),
+            key=key,
             algorithms=["RS256"],
             audience=settings.AUTH0_AUDIENCE,
             issuer=f"https://{settings.AUTH0_DOMAIN}/",
@@ -81,6 +182,7 @@ def verify_jwt(token: str):
         raise HTTPException(status_code=401, detail="Token expired")
     except JWTError as e:
         raise HTTPException(status_code=401, detail=f"Token invalid: {str(e)}")
+    token_cache.put(token, payload)
     return payload
 
 
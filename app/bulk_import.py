@@ -0,0 +1,272 @@
+"""
+Масове завантаження довідників (materials, clients, suppliers) з CSV/XLSX.
+
+The upload is read row by row and never loaded into memory at once. Each
+row is validated with the same Create schema as the single-item POST.
+Valid rows are streamed with COPY, in batches of COPY_BATCH_ROWS, into a
+temporary staging table. Set-based checks then run on the staging table:
+duplicate keys in the file (the last row wins) and unknown category_id.
+One merge statement finishes the import: it updates existing rows by
+key (code for materials, name for clients/suppliers) and inserts the
+rest. The whole file is one transaction. Only columns present in the
+file header are updated on existing rows. Missing columns and blank
+cells keep their current values, and defaults apply to new rows only.
+Values that would not fit their column (numeric precision, int4,
+varchar length) are reported per row before COPY.
+
+Returns a report with inserted/updated counts and per-row errors. A row
+with errors is skipped, and the remaining rows are still imported.
+"""
+import csv
+import io
+import re
+from decimal import Decimal
+from typing import Iterator, Tuple
+
+import psycopg2
+from fastapi import HTTPException, UploadFile
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from .schemas import ClientCreate, MaterialCreate, SupplierCreate
+
+COPY_BATCH_ROWS = 10_000
+MAX_REPORTED_ERRORS = 1000
+
+
+class Entity:
+    def __init__(self, table: str, schema: type, key: str, columns: dict):
+        self.table = table
+        self.schema: type[BaseModel] = schema
+        self.key = key
+        self.columns = columns  # ім'я -> тип колонки staging-таблиці
+        self.staging = f"import_{table}"
+
+
+ENTITIES = {
+    "materials": Entity("materials", MaterialCreate, "code", {
+        "code": "varchar(64)",
+        "name": "varchar(255)",
+        "unit": "varchar(32)",
+        "weight_per_unit": "numeric(18, 6)",
+        "description": "text",
+        "price": "numeric(14, 2)",
+        "currency": "varchar(3)",
+        "min_stock": "numeric(18, 4)",
+        "category_id": "integer",
+        "is_active": "boolean",
+    }),
+    "clients": Entity("clients", ClientCreate, "name", {"name": "varchar(255)", "contact_info": "text"}),
+    "suppliers": Entity("suppliers", SupplierCreate, "name", {"name": "varchar(255)", "contact_info": "text"}),
+}
+
+
+# ---------- reading ----------
+def _normalize(header) -> list:
+    return [str(h or "").strip().lower() for h in header]
+
+
+def _csv_rows(upload: UploadFile) -> Tuple[list, Iterator[list]]:
+    stream = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+    sample = stream.read(4096)
+    stream.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(stream, dialect)
+    return _normalize(next(reader, [])), reader
+
+
+def _xlsx_rows(upload: UploadFile) -> Tuple[list, Iterator[list]]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise HTTPException(status_code=400, detail="XLSX import requires openpyxl; upload CSV instead")
+    # read_only — рядки читаються потоково, без завантаження всього аркуша
+    sheet = load_workbook(upload.file, read_only=True, data_only=True).active
+    rows = sheet.iter_rows(values_only=True)
+    return _normalize(next(rows, ())), rows
+
+
+def read_rows(upload: UploadFile) -> Tuple[list, Iterator[list]]:
+    """(header, iterator of raw rows) for a CSV or XLSX upload."""
+    name = (upload.filename or "").lower()
+    if name.endswith(".xlsx"):
+        return _xlsx_rows(upload)
+    if name.endswith((".csv", ".txt")) or not name:
+        return _csv_rows(upload)
+    raise HTTPException(status_code=400, detail="Unsupported file type: use .csv or .xlsx")
+
+
+# ---------- range checks ----------
+INT4_MAX = 2**31 - 1
+_NUMERIC = re.compile(r"numeric\((\d+), (\d+)\)")
+_VARCHAR = re.compile(r"varchar\((\d+)\)")
+
+
+def _column_errors(entity: Entity, item: dict) -> list:
+    """Значення, що пройшли схему, але не вмістяться в колонку (numeric(p, s), integer, varchar(n))."""
+    out = []
+    for column, sql_type in entity.columns.items():
+        value = item.get(column)
+        if value is None:
+            continue
+        numeric, varchar = _NUMERIC.fullmatch(sql_type), _VARCHAR.fullmatch(sql_type)
+        if numeric:
+            precision, scale = int(numeric.group(1)), int(numeric.group(2))
+            if not Decimal(value).is_finite() or abs(round(Decimal(value), scale)) >= Decimal(10) ** (precision - scale):
+                out.append(f"{column}: value out of range for {sql_type}")
+        elif sql_type == "integer" and not -INT4_MAX - 1 <= value <= INT4_MAX:
+            out.append(f"{column}: value out of range for integer")
+        elif varchar and len(str(value)) > int(varchar.group(1)):
+            out.append(f"{column}: longer than {varchar.group(1)} characters")
+    return out
+
+
+# ---------- staging / merge ----------
+def _copy(cursor, entity: Entity, buffer: io.StringIO) -> None:
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {entity.staging} (row_no, provided, {', '.join(entity.columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+    )
+
+
+def _merge_sql(entity: Entity, present: set) -> str:
+    cols = list(entity.columns)
+    staging, table, key = entity.staging, entity.table, entity.key
+    updates = [c for c in cols if c in present and c != key]
+    if updates:
+        # порожня клітинка — значення не задано: лишаємо поточне, а не дефолт схеми
+        assignments = ", ".join(f"{c} = CASE WHEN '{c}' = ANY(s.provided) THEN s.{c} ELSE t.{c} END" for c in updates)
+        matched = f"""
+            UPDATE {table} t SET {assignments}
+            FROM {staging} s WHERE t.{key} = s.{key}
+            RETURNING s.row_no
+        """
+    else:
+        matched = f"SELECT s.row_no FROM {staging} s JOIN {table} t ON t.{key} = s.{key}"
+    return f"""
+        WITH matched AS ({matched}),
+        inserted AS (
+            INSERT INTO {table} ({', '.join(cols)})
+            SELECT {', '.join('s.' + c for c in cols)} FROM {staging} s
+            WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE t.{key} = s.{key})
+            RETURNING 1
+        )
+        SELECT (SELECT count(DISTINCT row_no) FROM matched), (SELECT count(*) FROM inserted)
+    """
+
+
+def import_file(db: Session, entity_name: str, upload: UploadFile, dry_run: bool = False) -> dict:
+    entity = ENTITIES[entity_name]
+    header, rows = read_rows(upload)
+    known = [h for h in header if h in entity.columns]
+    required = [n for n, f in entity.schema.model_fields.items() if f.is_required()]
+    missing = [c for c in required if c not in header]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Missing required columns: {', '.join(missing)}")
+
+    errors, error_count = [], 0
+
+    def report(row_no: int, messages: list) -> None:
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"row": row_no, "errors": messages})
+
+    try:
+        total, inserted, updated = _load_and_merge(db, entity, header, rows, known, report)
+    except (UnicodeDecodeError, csv.Error) as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Cannot parse file: {e}")
+    except (DBAPIError, psycopg2.Error) as e:
+        # рядкові перевірки мали відсіяти все, що не влазить у колонки; решта — 400, а не 500
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Import failed: {getattr(e, 'orig', None) or e}")
+
+    if dry_run:
+        db.rollback()
+    else:
+        db.commit()
+
+    errors.sort(key=lambda e: e["row"])
+    return {
+        "entity": entity_name,
+        "dry_run": dry_run,
+        "rows": total,
+        "inserted": inserted,
+        "updated": updated,
+        "error_count": error_count,
+        "errors": errors,
+        "ignored_columns": [h for h in header if h and h not in entity.columns],
+    }
+
+
+def _load_and_merge(db: Session, entity: Entity, header: list, rows, known: list, report) -> tuple:
+    """COPY валідних рядків у staging, set-based перевірки, merge; повертає (rows, inserted, updated)."""
+    staging_columns = ", ".join(f"{c} {t}" for c, t in entity.columns.items())
+    db.execute(text(
+        f"CREATE TEMP TABLE {entity.staging} (row_no integer, provided varchar[], {staging_columns}) ON COMMIT DROP"
+    ))
+    cursor = db.connection().connection.cursor()
+
+    total = valid = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    # рядок 1 — заголовок, дані з рядка 2 (як у редакторі таблиць)
+    for row_no, raw in enumerate(rows, start=2):
+        if not raw or all(v is None or str(v).strip() == "" for v in raw):
+            continue
+        total += 1
+        values = {
+            h: (v.strip() if isinstance(v, str) else v)
+            for h, v in zip(header, raw)
+            if h in entity.columns and v is not None and str(v).strip() != ""
+        }
+        try:
+            model = entity.schema.model_validate(values)
+        except ValidationError as e:
+            report(row_no, [f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()])
+            continue
+        item = model.model_dump()
+        problems = _column_errors(entity, item)
+        if problems:
+            report(row_no, problems)
+            continue
+        provided = "{" + ",".join(sorted(model.model_fields_set)) + "}"
+        writer.writerow([row_no, provided] + [item.get(c) for c in entity.columns])
+        valid += 1
+        if valid % COPY_BATCH_ROWS == 0:
+            _copy(cursor, entity, buffer)
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        _copy(cursor, entity, buffer)
+
+    # дублікати ключа у файлі: лишається останній рядок
+    superseded = {}
+    for row_no, kept in db.execute(text(f"""
+        DELETE FROM {entity.staging} s USING {entity.staging} t
+        WHERE s.{entity.key} = t.{entity.key} AND s.row_no < t.row_no
+        RETURNING s.row_no, t.row_no
+    """)):
+        superseded[row_no] = max(kept, superseded.get(row_no, 0))
+    for row_no, kept in sorted(superseded.items()):
+        report(row_no, [f"{entity.key}: duplicate in file, superseded by row {kept}"])
+
+    if "category_id" in entity.columns:
+        for row_no, category_id in db.execute(text(f"""
+            DELETE FROM {entity.staging} s
+            WHERE s.category_id IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM categories c WHERE c.id = s.category_id)
+            RETURNING s.row_no, s.category_id
+        """)):
+            report(row_no, [f"category_id: category {category_id} not found"])
+
+    # один merge під локом таблиці: паралельний імпорт не вставить той самий ключ двічі
+    db.execute(text(f"LOCK TABLE {entity.table} IN SHARE ROW EXCLUSIVE MODE"))
+    updated, inserted = db.execute(text(_merge_sql(entity, set(known)))).one()
+    return total, inserted, updated
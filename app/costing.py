@@ -0,0 +1,154 @@
+"""
+Собівартість залишку за ковзною середньою (stock_costs) і COGS по видачах.
+
+Every document that moves stock also posts its lines through post_costs()
+in the same transaction. The cost never has to be rebuilt from the
+ledger. Each pair keeps quantity, value (UAH) and avg_cost:
+
+- incoming lines (receipts, positive adjustments) add their value. Lines
+  without a price come in at the current avg_cost
+- receipt reversals (edit/delete) take back the same qty and value
+- outgoing lines (issues, negative adjustments) leave at value/quantity,
+  and that amount is the line's COGS. Past the tracked quantity the
+  remainder is costed at the last avg_cost
+
+Journaled receipts (hot SKUs) are not posted here in the request. Their
+value rides on the stock_deltas row, and stock_service posts it when the
+delta is folded or taken.
+
+Call post_costs() after apply_movements()/receive_stock(). Every
+document then takes stock_current locks before stock_costs locks, in
+(warehouse_id, material_id) order, so two documents cannot deadlock
+on each other.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .utils import EXCHANGE_RATES_UAH, div_half_up, money_decimal, money_units, qty_decimal, qty_units
+
+# (warehouse_id, material_id, ±qty units, value units UAH або None)
+CostLine = Tuple[Optional[int], int, int, Optional[int]]
+
+AVG_QUANT = Decimal("0.000001")
+
+_PAIRS_CTE = """
+    WITH req AS (
+        SELECT * FROM unnest(
+            CAST(:warehouse_ids AS integer[]),
+            CAST(:material_ids AS integer[])
+        ) AS r(warehouse_id, material_id)
+    )
+"""
+
+_ENSURE_SQL = text(_PAIRS_CTE + """
+    INSERT INTO stock_costs (warehouse_id, material_id, quantity, value, avg_cost)
+    SELECT warehouse_id, material_id, 0, 0, 0 FROM req ORDER BY warehouse_id, material_id
+    ON CONFLICT (warehouse_id, material_id) DO NOTHING
+""")
+
+_LOCK_SQL = text(_PAIRS_CTE + """
+    SELECT sc.warehouse_id, sc.material_id, sc.quantity, sc.value, sc.avg_cost
+    FROM stock_costs sc
+    JOIN req ON sc.warehouse_id = req.warehouse_id AND sc.material_id = req.material_id
+    ORDER BY sc.warehouse_id, sc.material_id
+    FOR UPDATE OF sc
+""")
+
+_STORE_SQL = text("""
+    UPDATE stock_costs sc
+    SET quantity = n.quantity, value = n.value, avg_cost = n.avg_cost, updated_at = now()
+    FROM unnest(
+        CAST(:warehouse_ids AS integer[]),
+        CAST(:material_ids AS integer[]),
+        CAST(:quantities AS numeric[]),
+        CAST(:values AS numeric[]),
+        CAST(:avg_costs AS numeric[])
+    ) AS n(warehouse_id, material_id, quantity, value, avg_cost)
+    WHERE sc.warehouse_id = n.warehouse_id AND sc.material_id = n.material_id
+""")
+
+
+def to_uah_units(money_u: int, currency: Optional[str]) -> int:
+    """Сума в одиницях 0.01 валюти документа -> одиниці 0.01 гривні (utils.EXCHANGE_RATES_UAH)."""
+    rate = EXCHANGE_RATES_UAH.get(currency or "UAH", Decimal("1.0"))
+    return money_units(money_decimal(money_u) * rate)
+
+
+class _PairCost:
+    __slots__ = ("qty", "value", "avg")
+
+    def __init__(self, quantity, value, avg_cost):
+        self.qty = qty_units(quantity)
+        self.value = money_units(value)
+        self.avg = Decimal(avg_cost)
+
+    def at_avg(self, qty_u: int) -> int:
+        return money_units(qty_decimal(qty_u) * self.avg)
+
+    def take_in(self, qty_u: int, value_u: Optional[int]) -> int:
+        if value_u is None:
+            value_u = self.at_avg(qty_u)
+        self.qty += qty_u
+        self.value += value_u
+        self._settle()
+        return value_u
+
+    def take_out(self, qty_u: int) -> int:
+        part = min(qty_u, max(self.qty, 0))
+        if part <= 0:
+            cost = 0
+        elif part == self.qty:
+            cost = self.value
+        else:
+            cost = div_half_up(part * self.value, self.qty)
+        self.qty -= qty_u
+        self.value -= cost
+        self._settle()
+        return cost + self.at_avg(qty_u - part)
+
+    def _settle(self) -> None:
+        if self.qty <= 0:
+            self.value = 0
+            return
+        self.value = max(self.value, 0)
+        self.avg = (money_decimal(self.value) / qty_decimal(self.qty)).quantize(AVG_QUANT, ROUND_HALF_UP)
+
+
+def post_costs(db: Session, lines: Iterable[CostLine]) -> List[Optional[int]]:
+    """
+    Провести рядки по собівартості в порядку переданих рядків.
+
+    Returns one amount (UAH units of 0.01) per line: COGS for outgoing
+    lines (qty < 0, value None), the value taken in for the rest, and None
+    for lines without a warehouse.
+    """
+    lines = list(lines)
+    pairs = sorted({(w, m) for w, m, _, _ in lines if w is not None})
+    if not pairs:
+        return [None] * len(lines)
+
+    params = {"warehouse_ids": [w for w, _ in pairs], "material_ids": [m for _, m in pairs]}
+    db.execute(_ENSURE_SQL, params)
+    state = {(r[0], r[1]): _PairCost(r[2], r[3], r[4]) for r in db.execute(_LOCK_SQL, params)}
+
+    out = []
+    for warehouse_id, material_id, qty_u, value_u in lines:
+        pair = state.get((warehouse_id, material_id))
+        if pair is None:
+            out.append(None)
+        elif qty_u < 0 and value_u is None:
+            out.append(pair.take_out(-qty_u))
+        else:
+            out.append(pair.take_in(qty_u, value_u))
+
+    db.execute(_STORE_SQL, {
+        "warehouse_ids": [w for w, _ in state],
+        "material_ids": [m for _, m in state],
+        "quantities": [qty_decimal(p.qty) for p in state.values()],
+        "values": [money_decimal(p.value) for p in state.values()],
+        "avg_costs": [p.avg for p in state.values()],
+    })
+    return out
@@ -1,10 +1,214 @@
-from sqlalchemy import create_engine
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool, AsyncAdaptedQueuePool
 from .config import settings
 
-engine = create_engine(settings.DATABASE_URL, future=True)
+
+class PoolStats:
+    """Лічильники очікування з'єднання з пулу (для /api/health/pool)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record(self, waited: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total / attempts * 1000, 3) if attempts else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+
+
+class _TimedPoolMixin:
+    """Measures how long a checkout waits for a free connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - start)
+        return conn
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def _pool_options() -> dict:
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "query_cache_size": settings.DB_QUERY_CACHE_SIZE,
+    }
+
+
+def pool_status(engine) -> dict:
+    pool = engine.pool
+    status = {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+    }
+    status["saturation"] = round(status["checked_out"] / (status["size"] + status["max_overflow"]), 3)
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        status.update(stats.snapshot())
+    return status
+
+
+engine = create_engine(settings.DATABASE_URL, future=True, poolclass=TimedQueuePool, **_pool_options())
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+
+class ReplicaSet:
+    """
+    Round-robin over read replicas whose replay lag is within REPLICA_MAX_LAG_SECONDS.
+
+    A background thread probes every replica each REPLICA_CHECK_INTERVAL_SECONDS
+    through a separate unpooled connection with a short connect/statement
+    timeout; pick() only reads the cached result and never touches the network.
+    A replica counts as unhealthy (requests go to the primary) while it is
+    lagging, while its last probe failed, before the first probe and when
+    the last probe is older than two intervals.
+    """
+
+    LAG_SQL = text("""
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END
+    """)
+
+    def __init__(self, urls: list):
+        self.engines = [
+            create_engine(url, future=True, poolclass=TimedQueuePool, **_pool_options())
+            for url in urls
+        ]
+        timeout = settings.REPLICA_PROBE_TIMEOUT_SECONDS
+        self._probes = [
+            create_engine(url, future=True, poolclass=NullPool, connect_args={
+                "connect_timeout": timeout,
+                "options": f"-c statement_timeout={timeout * 1000}",
+            })
+            for url in urls
+        ]
+        self._lock = threading.Lock()
+        self._next = 0
+        self._checked_at = [0.0] * len(self.engines)
+        self._lag = [None] * len(self.engines)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self.engines and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="replica-lag-probe", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            for i in range(len(self.engines)):
+                self._refresh(i)
+            self._stop.wait(settings.REPLICA_CHECK_INTERVAL_SECONDS)
+
+    def _refresh(self, i: int) -> None:
+        try:
+            with self._probes[i].connect() as conn:
+                self._lag[i] = float(conn.execute(self.LAG_SQL).scalar() or 0)
+        except Exception:
+            self._lag[i] = None
+        self._checked_at[i] = time.monotonic()
+
+    def _healthy(self, i: int) -> bool:
+        if time.monotonic() - self._checked_at[i] > 2 * settings.REPLICA_CHECK_INTERVAL_SECONDS:
+            return False
+        lag = self._lag[i]
+        return lag is not None and lag <= settings.REPLICA_MAX_LAG_SECONDS
+
+    def pick(self):
+        """Engine of the next healthy replica, or None to fall back to the primary."""
+        n = len(self.engines)
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % n
+        for k in range(n):
+            i = (start + k) % n
+            if self._healthy(i):
+                return self.engines[i]
+        return None
+
+    def status(self) -> list:
+        return [
+            {"url": e.url.render_as_string(hide_password=True), "lag_seconds": self._lag[i], "pool": pool_status(e)}
+            for i, e in enumerate(self.engines)
+        ]
+
+
+replicas = ReplicaSet([u.strip() for u in settings.DATABASE_REPLICA_URLS.split(",") if u.strip()])
+
+# Async engine (asyncpg) for the hot routes, see ASYNC_DB_ENABLED
+async_engine = None
+AsyncSessionLocal = None
+
+if settings.ASYNC_DB_ENABLED:
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+    async_url = (
+        make_url(settings.ASYNC_DATABASE_URL) if settings.ASYNC_DATABASE_URL
+        else make_url(settings.DATABASE_URL).set(drivername="postgresql+asyncpg")
+    )
+    if async_url.get_driver_name() == "asyncpg" and "prepared_statement_cache_size" not in async_url.query:
+        async_url = async_url.update_query_dict(
+            {"prepared_statement_cache_size": str(settings.DB_PREPARED_STATEMENT_CACHE_SIZE)}
+        )
+    async_engine = create_async_engine(async_url, poolclass=TimedAsyncQueuePool, **_pool_options())
+    AsyncSessionLocal = sessionmaker(
+        bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+    )
+
 from fastapi import Depends
 
 
@@ -13,4 +217,19 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def get_read_db():
+    """Session for read-only handlers: a healthy replica if configured, else the primary."""
+    replica = replicas.pick() if replicas.engines else None
+    db = SessionLocal(bind=replica) if replica is not None else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
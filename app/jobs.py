@@ -0,0 +1,575 @@
+"""
+Фонові задачі: довгі звіти, експорти, імпорти, перерахунки.
+
+A request only creates a `jobs` row (status queued) and returns its id.
+Each API process runs JobRunner: a bounded pool of JOB_WORKERS threads
+with their own sessions, separate from the request threadpool. Workers
+claim queued jobs with FOR UPDATE SKIP LOCKED, so any number of
+processes can share one queue. The concurrency limit per job type holds
+across all processes. It is checked at claim time under a per-type
+advisory lock, and JOB_TYPE_LIMITS overrides the registered defaults.
+
+State, progress and the result (a file, or JSON) live in the row and
+survive restarts. A heartbeat thread:
+- touches heartbeat_at of the jobs running in this process
+- picks up cancel requests, which handlers see through ctx.check()
+- fails jobs whose worker stopped sending heartbeats
+- deletes finished jobs older than JOB_RETENTION_HOURS
+
+On shutdown, interrupted jobs go back to the queue. Handlers that call
+ctx.check() stop at the next check. Rows still running when stop() gives
+up waiting (e.g. a handler inside one long statement) are requeued by
+worker id. That handler's transaction dies with the process and its late
+outcome is ignored. Handlers run in transactions, so a restarted job
+starts from a clean state.
+
+New job types are registered with @job_type(name, params=Model, limit=n).
+The handler gets a JobContext and returns JobResult, a JSON-serializable
+value, or None.
+"""
+import csv
+import io
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import Callable, Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .bulk_import import import_file
+from .config import settings
+from .db import SessionLocal
+from .ledger_rollup import ledger_months, month_start, movement_statement, next_month, rebuild_month
+from .models import Job
+
+log = logging.getLogger(__name__)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Задачу скасовано (користувачем або зупинкою процесу)."""
+
+
+class JobResult:
+    """Файл-результат задачі для /api/jobs/{id}/result."""
+
+    def __init__(self, content: bytes, filename: str, content_type: str = "text/csv"):
+        self.content = content
+        self.filename = filename
+        self.content_type = content_type
+
+
+class JobType:
+    def __init__(self, name: str, fn: Callable, params: Optional[type], limit: int, role: str):
+        self.name = name
+        self.fn = fn
+        self.params = params
+        self.default_limit = limit
+        self.role = role
+
+    @property
+    def limit(self) -> int:
+        return _limit_overrides().get(self.name, self.default_limit)
+
+    def parse_params(self, params: dict) -> dict:
+        """Перевірити параметри моделлю типу; у БД зберігається нормалізований JSON."""
+        if self.params is None:
+            return params or {}
+        try:
+            return jsonable_encoder(self.params.model_validate(params or {}))
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors())
+
+
+JOB_TYPES: dict = {}
+
+
+def job_type(name: str, params: Optional[type] = None, limit: int = 1, role: str = "storekeeper"):
+    """Зареєструвати обробник задач типу name (limit — одночасних задач на весь кластер)."""
+    def register(fn):
+        JOB_TYPES[name] = JobType(name, fn, params, limit, role)
+        return fn
+    return register
+
+
+def _limit_overrides() -> dict:
+    out = {}
+    for part in settings.JOB_TYPE_LIMITS.split(","):
+        name, _, value = part.partition("=")
+        if name.strip() and value.strip().isdigit():
+            out[name.strip()] = int(value)
+    return out
+
+
+class JobContext:
+    """Що бачить обробник: параметри, вхідний файл, звіт про прогрес, перевірка скасування."""
+
+    def __init__(self, job_id: int, params: dict, input_filename: Optional[str] = None):
+        self.job_id = job_id
+        self.params = params
+        self.input_filename = input_filename
+        self.cancelled = threading.Event()
+        self.shutdown = False
+        self._reported = 0.0
+
+    def input_data(self) -> Optional[bytes]:
+        with SessionLocal() as db:
+            return db.execute(_INPUT_SQL, {"id": self.job_id}).scalar()
+
+    def check(self) -> None:
+        if self.cancelled.is_set():
+            raise JobCancelled()
+
+    def progress(self, done: int, total: Optional[int] = None, message: Optional[str] = None,
+                 force: bool = False) -> None:
+        """Записати прогрес (не частіше JOB_PROGRESS_INTERVAL_SECONDS) і перевірити скасування."""
+        self.check()
+        now = time.monotonic()
+        if not force and now - self._reported < settings.JOB_PROGRESS_INTERVAL_SECONDS:
+            return
+        self._reported = now
+        with SessionLocal() as db:
+            db.execute(_PROGRESS_SQL, {"id": self.job_id, "done": done, "total": total, "message": message})
+            db.commit()
+
+
+# ---------- SQL ----------
+_INPUT_SQL = text("SELECT input_data FROM jobs WHERE id = :id")
+
+_PROGRESS_SQL = text("""
+    UPDATE jobs
+    SET progress_done = :done,
+        progress_total = COALESCE(CAST(:total AS bigint), progress_total),
+        message = COALESCE(CAST(:message AS text), message)
+    WHERE id = :id
+""")
+
+# типи, у яких є черга; скільки з них уже виконується (по всіх процесах)
+_QUEUE_SQL = text("""
+    SELECT job_type, count(*) FILTER (WHERE status = 'running')
+    FROM jobs
+    WHERE status IN ('queued', 'running')
+    GROUP BY job_type
+    HAVING count(*) FILTER (WHERE status = 'queued') > 0
+""")
+
+# advisory lock серіалізує захоплення задач одного типу, тож count(*) не гониться з іншим процесом
+_TYPE_LOCK_SQL = text("SELECT pg_advisory_xact_lock(hashtext('jobs:' || :job_type))")
+
+_CLAIM_SQL = text("""
+    UPDATE jobs
+    SET status = 'running', started_at = now(), heartbeat_at = now(), worker = :worker
+    WHERE id = (
+        SELECT id FROM jobs
+        WHERE job_type = :job_type AND status = 'queued'
+          AND (SELECT count(*) FROM jobs WHERE job_type = :job_type AND status = 'running') < :limit
+        ORDER BY id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, params, input_filename
+""")
+
+_FINISH_SQL = text("""
+    UPDATE jobs
+    SET status = :status, error = :error, finished_at = now(),
+        result = :result, result_filename = :filename, result_content_type = :content_type,
+        progress_done = CASE WHEN :status = 'succeeded' THEN COALESCE(progress_total, progress_done)
+                             ELSE progress_done END
+    WHERE id = :id AND status = 'running' AND worker = :worker
+""")
+
+# зупинка процесу: назад у чергу, якщо користувач тим часом не скасував задачу
+_REQUEUE_SQL = text("""
+    UPDATE jobs
+    SET status = CASE WHEN cancel_requested THEN 'cancelled' ELSE 'queued' END,
+        finished_at = CASE WHEN cancel_requested THEN now() END,
+        started_at = NULL, heartbeat_at = NULL, worker = NULL
+    WHERE id = :id AND status = 'running' AND worker = :worker
+""")
+
+# те саме для задач, чиї обробники не дійшли до ctx.check() до кінця stop()
+_REQUEUE_WORKER_SQL = text("""
+    UPDATE jobs
+    SET status = CASE WHEN cancel_requested THEN 'cancelled' ELSE 'queued' END,
+        finished_at = CASE WHEN cancel_requested THEN now() END,
+        started_at = NULL, heartbeat_at = NULL, worker = NULL
+    WHERE worker = :worker AND status = 'running'
+""")
+
+_HEARTBEAT_SQL = text("""
+    UPDATE jobs SET heartbeat_at = now()
+    WHERE id = ANY(CAST(:ids AS integer[]))
+    RETURNING id, cancel_requested
+""")
+
+_REAP_SQL = text("""
+    UPDATE jobs
+    SET status = 'failed', error = 'worker stopped responding', finished_at = now()
+    WHERE status = 'running' AND heartbeat_at < now() - make_interval(secs => :stale)
+""")
+
+_PURGE_SQL = text("""
+    DELETE FROM jobs WHERE finished_at < now() - make_interval(hours => :hours)
+""")
+
+_CANCEL_SQL = text("""
+    UPDATE jobs
+    SET cancel_requested = true,
+        status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+        finished_at = CASE WHEN status = 'queued' THEN now() ELSE finished_at END
+    WHERE id = :id AND status IN ('queued', 'running')
+""")
+
+
+# ---------- API ----------
+def submit(
+    db: Session,
+    name: str,
+    params: Optional[dict] = None,
+    created_by: Optional[str] = None,
+    input_data: Optional[bytes] = None,
+    input_filename: Optional[str] = None,
+) -> Job:
+    jt = JOB_TYPES.get(name)
+    if jt is None:
+        raise HTTPException(status_code=400, detail=f"Unknown job type: {name}")
+    job = Job(
+        job_type=name,
+        status=QUEUED,
+        params=jt.parse_params(params or {}),
+        created_by=created_by,
+        input_data=input_data,
+        input_filename=input_filename,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    runner.wake()
+    return job
+
+
+def cancel(db: Session, job_id: int) -> None:
+    """Чергова задача скасовується одразу, виконувана — на найближчому ctx.check()."""
+    db.execute(_CANCEL_SQL, {"id": job_id})
+    db.commit()
+
+
+def _encode(out) -> tuple:
+    if out is None:
+        return None, None, None
+    if isinstance(out, JobResult):
+        return out.content, out.filename, out.content_type
+    return json.dumps(jsonable_encoder(out), ensure_ascii=False).encode(), "result.json", "application/json"
+
+
+# ---------- runner ----------
+class JobRunner:
+    """Пул робочих потоків + потік heartbeat; по одному на процес API."""
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads: list = []
+        self._running: dict = {}  # job id -> JobContext
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        for i in range(settings.JOB_WORKERS):
+            self._threads.append(threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True))
+        self._threads.append(threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True))
+        for t in self._threads:
+            t.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            for ctx in self._running.values():
+                ctx.shutdown = True
+                ctx.cancelled.set()
+        for t in self._threads:
+            t.join(timeout=10)
+        self._threads = []
+        # обробник з одним довгим запитом не бачить ctx.check(): повертаємо його рядок самі;
+        # якщо потік таки допрацює, _FINISH_SQL уже не збігається за worker
+        try:
+            with SessionLocal() as db:
+                requeued = db.execute(_REQUEUE_WORKER_SQL, {"worker": self.worker_id}).rowcount
+                db.commit()
+            if requeued:
+                log.info("Requeued %s interrupted jobs", requeued)
+        except Exception as e:
+            log.warning("Cannot requeue interrupted jobs: %s", e)
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def running(self) -> list:
+        with self._lock:
+            return sorted(self._running)
+
+    # --- робочі потоки ---
+    def _work(self) -> None:
+        while not self._stop.is_set():
+            claimed = None
+            try:
+                claimed = self._claim()
+            except Exception as e:
+                log.warning("Job claim failed: %s", e)
+            if claimed is None:
+                self._wake.wait(settings.JOB_POLL_INTERVAL_SECONDS)
+                self._wake.clear()
+                continue
+            self._execute(*claimed)
+
+    def _claim(self) -> Optional[tuple]:
+        with SessionLocal() as db:
+            queue = db.execute(_QUEUE_SQL).all()
+            for name, running in sorted(queue, key=lambda r: r[1]):
+                jt = JOB_TYPES.get(name)
+                if jt is None or running >= jt.limit:
+                    continue
+                db.execute(_TYPE_LOCK_SQL, {"job_type": name})
+                row = db.execute(_CLAIM_SQL, {"job_type": name, "limit": jt.limit, "worker": self.worker_id}).first()
+                db.commit()
+                if row is not None:
+                    return jt, JobContext(row.id, row.params, row.input_filename)
+        return None
+
+    def _execute(self, jt: JobType, ctx: JobContext) -> None:
+        with self._lock:
+            self._running[ctx.job_id] = ctx
+        status, error, out = SUCCEEDED, None, None
+        started = time.perf_counter()
+        try:
+            out = jt.fn(ctx)
+        except JobCancelled:
+            status = CANCELLED
+        except HTTPException as e:
+            status, error = FAILED, e.detail if isinstance(e.detail, str) else json.dumps(jsonable_encoder(e.detail))
+        except Exception as e:
+            log.exception("Job %s (%s) failed", ctx.job_id, jt.name)
+            status, error = FAILED, str(e) or e.__class__.__name__
+        finally:
+            with self._lock:
+                self._running.pop(ctx.job_id, None)
+
+        try:
+            with SessionLocal() as db:
+                if status == CANCELLED and ctx.shutdown:
+                    db.execute(_REQUEUE_SQL, {"id": ctx.job_id, "worker": self.worker_id})
+                else:
+                    content, filename, content_type = _encode(out) if status == SUCCEEDED else (None, None, None)
+                    db.execute(_FINISH_SQL, {
+                        "id": ctx.job_id, "worker": self.worker_id, "status": status, "error": error,
+                        "result": content, "filename": filename, "content_type": content_type,
+                    })
+                db.commit()
+        except Exception as e:
+            # рядок лишиться running — його підбере _REAP_SQL
+            log.warning("Job %s: cannot store outcome: %s", ctx.job_id, e)
+        log.info("Job %s (%s) %s in %.2fs", ctx.job_id, jt.name, status, time.perf_counter() - started)
+
+    # --- heartbeat / прибирання ---
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(settings.JOB_HEARTBEAT_SECONDS):
+            try:
+                with SessionLocal() as db:
+                    ids = self.running()
+                    if ids:
+                        for job_id, cancel_requested in db.execute(_HEARTBEAT_SQL, {"ids": ids}):
+                            if cancel_requested:
+                                with self._lock:
+                                    ctx = self._running.get(job_id)
+                                if ctx is not None:
+                                    ctx.cancelled.set()
+                    db.execute(_REAP_SQL, {"stale": settings.JOB_STALE_SECONDS})
+                    db.execute(_PURGE_SQL, {"hours": settings.JOB_RETENTION_HOURS})
+                    db.commit()
+            except Exception as e:
+                log.warning("Job heartbeat failed: %s", e)
+
+
+runner = JobRunner()
+
+
+# ---------- job types ----------
+def _csv_result(header: list, rows, filename: str) -> JobResult:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    writer.writerows(rows)
+    return JobResult(buf.getvalue().encode("utf-8-sig"), filename)
+
+
+class StockExportParams(BaseModel):
+    warehouse_id: Optional[int] = None
+    category_id: Optional[int] = None
+    include_zero: bool = False
+
+
+_STOCK_EXPORT_FILTERS = """
+    WHERE (CAST(:warehouse_id AS integer) IS NULL OR sc.warehouse_id = :warehouse_id)
+      AND (CAST(:category_id AS integer) IS NULL OR m.category_id = :category_id)
+"""
+
+_STOCK_EXPORT_COUNT_SQL = text("""
+    SELECT count(*) FROM stock_current sc JOIN materials m ON m.id = sc.material_id
+""" + _STOCK_EXPORT_FILTERS)
+
+_STOCK_EXPORT_SQL = text("""
+    SELECT w.name, m.code, m.name, m.unit,
+           sc.quantity + COALESCE(d.pending, 0) AS quantity,
+           m.min_stock, c.avg_cost, c.value, sc.last_movement_at
+    FROM stock_current sc
+    JOIN materials m ON m.id = sc.material_id
+    JOIN warehouses w ON w.id = sc.warehouse_id
+    LEFT JOIN stock_costs c ON c.warehouse_id = sc.warehouse_id AND c.material_id = sc.material_id
+    LEFT JOIN (
+        SELECT warehouse_id, material_id, SUM(delta) AS pending
+        FROM stock_deltas GROUP BY warehouse_id, material_id
+    ) d ON d.warehouse_id = sc.warehouse_id AND d.material_id = sc.material_id
+""" + _STOCK_EXPORT_FILTERS + """
+    ORDER BY w.name, m.code
+""")
+
+
+@job_type("stock_export", params=StockExportParams, limit=2)
+def stock_export(ctx: JobContext) -> JobResult:
+    """Повний експорт залишків (з незгорнутими дельтами журналу) у CSV."""
+    params = dict(ctx.params)
+    include_zero = params.pop("include_zero")
+    with SessionLocal() as db:
+        total = db.execute(_STOCK_EXPORT_COUNT_SQL, params).scalar()
+        ctx.progress(0, total, force=True)
+        rows, done = [], 0
+        result = db.execute(_STOCK_EXPORT_SQL.execution_options(stream_results=True), params)
+        for part in result.partitions(settings.JOB_BATCH_ROWS):
+            rows.extend(r for r in part if include_zero or r.quantity != 0)
+            done += len(part)
+            ctx.progress(done)
+    header = ["warehouse", "code", "name", "unit", "quantity", "min_stock", "avg_cost_uah", "value_uah",
+              "last_movement_at"]
+    return _csv_result(header, rows, f"stock_{datetime.now(timezone.utc):%Y%m%d_%H%M}.csv")
+
+
+class MovementStatementParams(BaseModel):
+    date_from: datetime
+    date_to: datetime
+    warehouse_id: Optional[int] = None
+    material_id: Optional[int] = None
+    category_id: Optional[int] = None
+
+
+@job_type("movement_statement", params=MovementStatementParams, limit=2)
+def movement_statement_export(ctx: JobContext) -> JobResult:
+    """Відомість руху запасів за період у CSV, без ліміту на кількість рядків."""
+    p = MovementStatementParams.model_validate(ctx.params)
+    if p.date_from >= p.date_to:
+        raise HTTPException(status_code=400, detail="date_from must be before date_to")
+    with SessionLocal() as db:
+        # limit=None -> LIMIT NULL: усі рядки одним запитом, без повторних OFFSET-проходів
+        rows = movement_statement(db, p.date_from, p.date_to, p.warehouse_id, p.material_id, p.category_id,
+                                  0, None)
+    ctx.progress(len(rows), len(rows), force=True)
+    header = ["warehouse", "code", "name", "opening", "receipts", "issues", "adjustments", "closing"]
+    return _csv_result(
+        header,
+        ([r.warehouse_name, r.code, r.material_name, r.opening, r.receipts, r.issues, r.adjustments, r.closing]
+         for r in rows),
+        f"movement_{p.date_from:%Y%m%d}_{p.date_to:%Y%m%d}.csv",
+    )
+
+
+class RollupRebuildParams(BaseModel):
+    month_from: Optional[date] = None
+    month_to: Optional[date] = None
+
+
+@job_type("ledger_rollup_rebuild", params=RollupRebuildParams, limit=1, role="admin")
+def ledger_rollup_rebuild(ctx: JobContext) -> dict:
+    """Перерахувати місячні підсумки журналу (як tools/rollup.py), по транзакції на місяць."""
+    p = RollupRebuildParams.model_validate(ctx.params)
+    with SessionLocal() as db:
+        first, last = ledger_months(db)
+    if first is None:
+        return {"months": 0}
+    month = month_start(p.month_from) if p.month_from else first
+    last = month_start(p.month_to) if p.month_to else last
+    total = (last.year - month.year) * 12 + last.month - month.month + 1
+    done = 0
+    while month <= last:
+        ctx.progress(done, total, message=f"{month:%Y-%m}", force=True)
+        with SessionLocal() as db:
+            rebuild_month(db, month)
+            db.commit()
+        done += 1
+        month = next_month(month)
+    return {"months": done}
+
+
+_RECONCILE_SQL = text("""
+    WITH ledger AS (
+        SELECT warehouse_id, material_id, SUM(qty_change) AS qty
+        FROM stock_ledger
+        WHERE warehouse_id IS NOT NULL AND material_id IS NOT NULL
+        GROUP BY warehouse_id, material_id
+    ),
+    stock AS (
+        SELECT sc.warehouse_id, sc.material_id, sc.quantity + COALESCE(SUM(d.delta), 0) AS qty
+        FROM stock_current sc
+        LEFT JOIN stock_deltas d ON d.warehouse_id = sc.warehouse_id AND d.material_id = sc.material_id
+        GROUP BY sc.warehouse_id, sc.material_id, sc.quantity
+    )
+    SELECT warehouse_id, material_id, COALESCE(stock.qty, 0) AS stock_qty, COALESCE(ledger.qty, 0) AS ledger_qty
+    FROM stock FULL JOIN ledger USING (warehouse_id, material_id)
+    WHERE COALESCE(stock.qty, 0) <> COALESCE(ledger.qty, 0)
+    ORDER BY warehouse_id, material_id
+""")
+
+
+@job_type("stock_reconcile", limit=1, role="admin")
+def stock_reconcile(ctx: JobContext) -> JobResult:
+    """Звірка stock_current (+ дельти) із сумою stock_ledger; у CSV — лише розбіжності."""
+    with SessionLocal() as db:
+        rows = db.execute(_RECONCILE_SQL).all()
+    ctx.progress(len(rows), len(rows), message=f"{len(rows)} mismatched pairs", force=True)
+    return _csv_result(
+        ["warehouse_id", "material_id", "stock_qty", "ledger_qty", "difference"],
+        ([r.warehouse_id, r.material_id, r.stock_qty, r.ledger_qty, r.stock_qty - r.ledger_qty] for r in rows),
+        "stock_reconcile.csv",
+    )
+
+
+class BulkImportParams(BaseModel):
+    entity: str = Field(..., pattern="^(materials|clients|suppliers)$")
+    dry_run: bool = False
+
+
+@job_type("bulk_import", params=BulkImportParams, limit=1)
+def bulk_import_job(ctx: JobContext) -> dict:
+    """Імпорт довідника з файлу, завантаженого через POST /api/jobs/import/{entity}."""
+    p = BulkImportParams.model_validate(ctx.params)
+    data = ctx.input_data()
+    if data is None:
+        raise HTTPException(status_code=400, detail="Job has no input file")
+    upload = UploadFile(file=io.BytesIO(data), filename=ctx.input_filename)
+    ctx.progress(0, message=f"importing {ctx.input_filename}", force=True)
+    with SessionLocal() as db:
+        return import_file(db, p.entity, upload, dry_run=p.dry_run)
@@ -0,0 +1,281 @@
+"""
+In-process columnar cache of stock_ledger for analytics (LEDGER_CACHE_ENABLED).
+
+The ledger is held as NumPy arrays: id, ts (epoch µs), warehouse_id,
+material_id, type (index in StockMovementType), qty (units of 0.0001) and
+value (total_price in units of 0.01). Group-bys and filters run as
+vectorized operations over these arrays instead of scanning Postgres.
+
+The full load runs in a background thread at startup (read replica if
+configured). After that, rows with id > max loaded id are appended every
+LEDGER_CACHE_REFRESH_SECONDS.
+
+Staleness: a committed movement shows up within one refresh interval.
+Ids come from a sequence and can commit out of order, so ids skipped
+by a load are re-checked on every refresh for up to
+LEDGER_CACHE_GAP_TTL_SECONDS. After an incremental load that covers every
+skipped id; after the full load it covers the top MAX_TRACKED_GAPS ids,
+where transactions in flight during the load sit. Rows that commit
+later than the TTL are missed until restart. The ledger is append-only here. Changes made by
+ON DELETE SET NULL on warehouses/materials are not reflected.
+
+Memory: at most LEDGER_CACHE_MAX_MB of column data. Past the limit, the
+oldest rows are evicted and coverage_from moves forward. Windows starting
+before it are not served from the cache.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import text
+
+from .config import settings
+from .db import engine, replicas
+from .models import StockMovementType
+from .utils import MONEY_SCALE, QTY_SCALE
+
+log = logging.getLogger(__name__)
+
+# мітки enum у БД — імена членів (return_), а не значення
+MOVEMENT_TYPES = [t.name for t in StockMovementType]
+COLUMNS = ("id", "ts", "warehouse_id", "material_id", "type", "qty", "value")
+DTYPES = {
+    "id": np.int64,
+    "ts": np.int64,
+    "warehouse_id": np.int32,
+    "material_id": np.int32,
+    "type": np.int8,
+    "qty": np.int64,
+    "value": np.int64,
+}
+ROW_BYTES = sum(np.dtype(t).itemsize for t in DTYPES.values())
+CHUNK_ROWS = 100_000
+MAX_TRACKED_GAPS = 10_000
+
+_SELECT = f"""
+    SELECT id,
+           (EXTRACT(EPOCH FROM date_time) * 1000000)::bigint,
+           COALESCE(warehouse_id, -1),
+           COALESCE(material_id, -1),
+           array_position(CAST(:types AS text[]), movement_type::text) - 1,
+           ROUND(qty_change * {QTY_SCALE})::bigint,
+           ROUND(COALESCE(total_price, 0) * {MONEY_SCALE})::bigint
+    FROM stock_ledger
+"""
+_LOAD_SQL = text(_SELECT + " WHERE id > :after ORDER BY id")
+_GAPS_SQL = text(_SELECT + " WHERE id = ANY(CAST(:ids AS bigint[])) ORDER BY id")
+
+
+def to_ts(dt: Optional[datetime]) -> Optional[int]:
+    """datetime -> epoch µs; naive values are taken as UTC."""
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1_000_000)
+
+
+def type_code(movement_type: StockMovementType) -> int:
+    return MOVEMENT_TYPES.index(movement_type.name)
+
+
+def group_sum(keys: np.ndarray, *values: np.ndarray):
+    """Exact int64 group-by sum: (unique keys, [sums per value array])."""
+    if keys.size == 0:
+        return keys[:0], [v[:0] for v in values]
+    order = np.argsort(keys, kind="stable")
+    k = keys[order]
+    starts = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+    return k[starts], [np.add.reduceat(v[order], starts) for v in values]
+
+
+class Snapshot:
+    """Consistent read-only view of the first n rows."""
+
+    def __init__(self, cols: dict, n: int):
+        self.n = n
+        for name in COLUMNS:
+            setattr(self, name, cols[name][:n])
+
+    def mask(
+        self,
+        ts_from: Optional[int] = None,
+        ts_to: Optional[int] = None,
+        warehouse_id: Optional[int] = None,
+        material_id: Optional[int] = None,
+        movement_type: Optional[StockMovementType] = None,
+    ) -> np.ndarray:
+        m = np.ones(self.n, dtype=bool)
+        if ts_from is not None:
+            m &= self.ts >= ts_from
+        if ts_to is not None:
+            m &= self.ts <= ts_to
+        if warehouse_id:
+            m &= self.warehouse_id == warehouse_id
+        if material_id:
+            m &= self.material_id == material_id
+        if movement_type is not None:
+            m &= self.type == type_code(movement_type)
+        return m
+
+
+class LedgerCache:
+    def __init__(self):
+        self.max_rows = max(1, settings.LEDGER_CACHE_MAX_MB * 1024 * 1024 // ROW_BYTES)
+        self._write_lock = threading.Lock()
+        # (columns, n) міняється одним присвоєнням — читачі бачать узгоджений стан
+        self._state = ({c: np.empty(0, dtype=t) for c, t in DTYPES.items()}, 0)
+        self.max_id = 0
+        self.ready = False
+        self.refreshed_at: Optional[float] = None
+        self.coverage_from: Optional[int] = None  # epoch µs; None = з самого початку
+        self._gaps: dict = {}  # id -> monotonic коли помічено
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- reads ----------
+    def snapshot(self) -> Snapshot:
+        cols, n = self._state
+        return Snapshot(cols, n)
+
+    def covers(self, ts_from: Optional[int]) -> bool:
+        """True if a window starting at ts_from can be answered from the cache."""
+        if not self.ready:
+            return False
+        if self.coverage_from is None:
+            return True
+        return ts_from is not None and ts_from >= self.coverage_from
+
+    def status(self) -> dict:
+        cols, n = self._state
+        capacity = len(cols["id"])
+        return {
+            "enabled": settings.LEDGER_CACHE_ENABLED,
+            "ready": self.ready,
+            "rows": n,
+            "max_rows": self.max_rows,
+            "memory_mb": round(capacity * ROW_BYTES / 1024 / 1024, 1),
+            "max_id": self.max_id,
+            "age_seconds": round(time.monotonic() - self.refreshed_at, 3) if self.refreshed_at else None,
+            "coverage_from": (
+                datetime.fromtimestamp(self.coverage_from / 1_000_000, tz=timezone.utc)
+                if self.coverage_from is not None else None
+            ),
+            "pending_gaps": len(self._gaps),
+        }
+
+    # ---------- writes (one writer at a time) ----------
+    def _append(self, block: np.ndarray) -> None:
+        cols, n = self._state
+        need = n + len(block)
+        if need > len(cols["id"]):
+            capacity = min(max(need, 2 * len(cols["id"]), CHUNK_ROWS), self.max_rows + CHUNK_ROWS)
+            capacity = max(capacity, need)
+            grown = {}
+            for c, t in DTYPES.items():
+                grown[c] = np.empty(capacity, dtype=t)
+                grown[c][:n] = cols[c][:n]
+            cols = grown
+        for i, c in enumerate(COLUMNS):
+            cols[c][n:need] = block[:, i]
+        self._state = (cols, need)
+        if need > self.max_rows:
+            self._evict(need - self.max_rows + self.max_rows // 10)
+
+    def _evict(self, drop: int) -> None:
+        cols, n = self._state
+        drop = min(drop, n)
+        newest_dropped = int(cols["ts"][:drop].max()) if drop else None
+        kept = {c: cols[c][drop:n].copy() for c in COLUMNS}
+        self._state = (kept, n - drop)
+        if newest_dropped is not None:
+            self.coverage_from = max(self.coverage_from or 0, newest_dropped + 1)
+        log.info("Ledger cache evicted %d oldest rows (memory limit)", drop)
+
+    def _track_gaps(self, prev_max: int, ids: np.ndarray) -> None:
+        if ids.size == 0:
+            return
+        expected = np.arange(prev_max + 1, int(ids[-1]) + 1, dtype=np.int64)
+        missing = np.setdiff1d(expected, ids, assume_unique=True)
+        now = time.monotonic()
+        for i in missing[: max(0, MAX_TRACKED_GAPS - len(self._gaps))]:
+            self._gaps[int(i)] = now
+
+    def refresh(self) -> int:
+        """Load rows appended since the last refresh; returns number of new rows."""
+        with self._write_lock:
+            added = 0
+            incremental = self.ready
+            source = replicas.pick() or engine
+            with source.connect() as conn:
+                result = conn.execution_options(stream_results=True, yield_per=CHUNK_ROWS).execute(
+                    _LOAD_SQL, {"types": MOVEMENT_TYPES, "after": self.max_id}
+                )
+                for chunk in result.partitions():
+                    block = np.array(chunk, dtype=np.int64).reshape(-1, len(COLUMNS))
+                    if incremental:
+                        self._track_gaps(self.max_id, block[:, 0])
+                    self._append(block)
+                    self.max_id = max(self.max_id, int(block[-1, 0]))
+                    added += len(block)
+
+                if not incremental and added:
+                    # пропуски біля верху — транзакції, що ще не закомітились під час повного завантаження
+                    cols, n = self._state
+                    horizon = max(0, self.max_id - MAX_TRACKED_GAPS)
+                    ids = cols["id"][:n]
+                    self._track_gaps(horizon, ids[ids > horizon])
+
+                if self._gaps:
+                    now = time.monotonic()
+                    for i, seen in list(self._gaps.items()):
+                        if now - seen > settings.LEDGER_CACHE_GAP_TTL_SECONDS:
+                            del self._gaps[i]
+                    if self._gaps:
+                        rows = conn.execute(_GAPS_SQL, {"types": MOVEMENT_TYPES, "ids": list(self._gaps)}).all()
+                        if rows:
+                            block = np.array(rows, dtype=np.int64).reshape(-1, len(COLUMNS))
+                            self._append(block)
+                            for i in block[:, 0]:
+                                self._gaps.pop(int(i), None)
+                            added += len(block)
+
+            self.refreshed_at = time.monotonic()
+            self.ready = True
+            return added
+
+    # ---------- background ----------
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="ledger-cache", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                added = self.refresh()
+                log.debug("Ledger cache: +%d rows in %.3fs", added, time.monotonic() - started)
+            except Exception as e:
+                log.warning("Ledger cache refresh failed: %s", e)
+            self._stop.wait(settings.LEDGER_CACHE_REFRESH_SECONDS)
+
+
+ledger_cache = LedgerCache()
+
+
+def cached_snapshot(ts_from: Optional[int]) -> Optional[Snapshot]:
+    """Snapshot to answer a window starting at ts_from, or None -> use SQL."""
+    if settings.LEDGER_CACHE_ENABLED and ledger_cache.covers(ts_from):
+        return ledger_cache.snapshot()
+    return None
@@ -0,0 +1,216 @@
+"""
+Місячні підсумки stock_ledger (stock_ledger_monthly) і звіт про рух запасів.
+
+The DB trigger trg_stock_ledger_rollup keeps the rollups current. Every
+INSERT/COPY into stock_ledger appends its per-(month, warehouse,
+material, movement_type) sums to stock_ledger_monthly_deltas in the same
+transaction. The trigger only inserts and never updates a rollup row, so
+concurrent postings of one hot SKU do not queue on a row lock.
+merge_pending() folds the deltas into stock_ledger_monthly in batches,
+called from the DeltaFolder thread. Readers add the not-yet-merged
+deltas, so results do not depend on merge lag. rebuild_month()
+recomputes one month from the ledger, for backfill or repair (see
+tools/rollup.py).
+
+movement_statement() answers opening / receipts / issues / adjustments /
+closing for any [date_from, date_to). Whole calendar months (UTC) come
+from the rollups. Raw ledger rows, through ix_stock_ledger_date_time,
+are read only for the partial months at the edges: before date_from for
+the opening balance, and the first and last partial month of the period.
+"""
+from datetime import date, datetime, timezone
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+_ROLLUP_SELECT = """
+    SELECT date_trunc('month', date_time AT TIME ZONE 'UTC')::date,
+           warehouse_id, material_id, movement_type,
+           SUM(qty_change), SUM(COALESCE(total_price, 0)), COUNT(*)
+    FROM stock_ledger
+    WHERE warehouse_id IS NOT NULL AND material_id IS NOT NULL
+"""
+
+_LOCK_LEDGER_SQL = text("LOCK TABLE stock_ledger IN SHARE MODE")
+_LOCK_DELTAS_SQL = text("LOCK TABLE stock_ledger_monthly_deltas IN EXCLUSIVE MODE")
+_DELETE_MONTH_DELTAS_SQL = text("DELETE FROM stock_ledger_monthly_deltas WHERE month = :month")
+_DELETE_MONTH_SQL = text("DELETE FROM stock_ledger_monthly WHERE month = :month")
+_REBUILD_MONTH_SQL = text("""
+    INSERT INTO stock_ledger_monthly (month, warehouse_id, material_id, movement_type, qty, value, moves)
+""" + _ROLLUP_SELECT + """
+      AND date_time >= :start AND date_time < :end
+    GROUP BY 1, 2, 3, 4
+""")
+_LEDGER_MONTHS_SQL = text("""
+    SELECT date_trunc('month', MIN(date_time) AT TIME ZONE 'UTC')::date,
+           date_trunc('month', MAX(date_time) AT TIME ZONE 'UTC')::date
+    FROM stock_ledger
+""")
+
+# Забрати батч приростів і додати до підсумків; ключі у стабільному порядку
+_MERGE_SQL = text("""
+    WITH taken AS (
+        DELETE FROM stock_ledger_monthly_deltas
+        WHERE id IN (
+            SELECT id FROM stock_ledger_monthly_deltas
+            ORDER BY id
+            LIMIT :batch
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING month, warehouse_id, material_id, movement_type, qty, value, moves
+    ),
+    merged AS (
+        INSERT INTO stock_ledger_monthly AS r
+               (month, warehouse_id, material_id, movement_type, qty, value, moves)
+        SELECT month, warehouse_id, material_id, movement_type, SUM(qty), SUM(value), SUM(moves)
+        FROM taken
+        GROUP BY 1, 2, 3, 4
+        ORDER BY 2, 3, 1, 4
+        ON CONFLICT (month, warehouse_id, material_id, movement_type) DO UPDATE
+        SET qty = r.qty + EXCLUDED.qty,
+            value = r.value + EXCLUDED.value,
+            moves = r.moves + EXCLUDED.moves
+    )
+    SELECT count(*) FROM taken
+""")
+
+# Фільтри однакові для підсумків і сирих рядків
+_FILTERS = """
+          AND (CAST(:warehouse_id AS integer) IS NULL OR warehouse_id = :warehouse_id)
+          AND (CAST(:material_id AS integer) IS NULL OR material_id = :material_id)
+          AND (CAST(:category_id AS integer) IS NULL
+               OR material_id IN (SELECT id FROM materials WHERE category_id = :category_id))
+"""
+
+_STATEMENT_SQL = text("""
+    WITH moves AS (
+        SELECT warehouse_id, material_id, movement_type, qty, month < :rollup_from AS before
+        FROM (
+            SELECT month, warehouse_id, material_id, movement_type, qty FROM stock_ledger_monthly
+            UNION ALL
+            SELECT month, warehouse_id, material_id, movement_type, qty FROM stock_ledger_monthly_deltas
+        ) r
+        WHERE (month < :open_month OR (month >= :rollup_from AND month < :rollup_to))
+""" + _FILTERS + """
+        UNION ALL
+        SELECT warehouse_id, material_id, movement_type, qty_change, date_time < :date_from
+        FROM stock_ledger
+        WHERE warehouse_id IS NOT NULL AND material_id IS NOT NULL
+          AND ((date_time >= :open_start AND date_time < :head_to)
+               OR (date_time >= :tail_from AND date_time < :date_to))
+""" + _FILTERS + """
+    ),
+    totals AS (
+        SELECT warehouse_id, material_id,
+               COALESCE(SUM(qty) FILTER (WHERE before), 0) AS opening,
+               COALESCE(SUM(qty) FILTER (WHERE NOT before AND movement_type = 'receipt'), 0) AS receipts,
+               COALESCE(-SUM(qty) FILTER (WHERE NOT before AND movement_type = 'issue'), 0) AS issues,
+               COALESCE(SUM(qty) FILTER (WHERE NOT before AND movement_type NOT IN ('receipt', 'issue')), 0)
+                   AS adjustments,
+               SUM(qty) AS closing
+        FROM moves
+        GROUP BY warehouse_id, material_id
+        HAVING SUM(qty) <> 0 OR COUNT(*) FILTER (WHERE NOT before) > 0
+    )
+    SELECT t.*, m.code, m.name AS material_name, w.name AS warehouse_name, COUNT(*) OVER () AS total
+    FROM totals t
+    JOIN materials m ON m.id = t.material_id
+    JOIN warehouses w ON w.id = t.warehouse_id
+    ORDER BY t.warehouse_id, t.material_id
+    OFFSET :skip LIMIT :limit
+""")
+
+
+def month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def next_month(d: date) -> date:
+    return date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+
+def _utc(d: date) -> datetime:
+    return datetime(d.year, d.month, d.day, tzinfo=timezone.utc)
+
+
+def month_bounds(month: date) -> tuple:
+    """[start, end) of a calendar month in UTC."""
+    month = month_start(month)
+    return _utc(month), _utc(next_month(month))
+
+
+def rebuild_month(db: Session, month: date) -> None:
+    """
+    Перерахувати підсумки одного місяця з журналу (виклик у транзакції).
+
+    SHARE lock on stock_ledger blocks new ledger inserts until commit, so
+    the trigger cannot add rows between the delete and the insert. The
+    EXCLUSIVE lock on the deltas waits out a running merge_pending(); the
+    month's unmerged deltas are dropped together with its rollups.
+    Commit per month to keep the lock short.
+    """
+    start, end = month_bounds(month)
+    db.execute(_LOCK_LEDGER_SQL)
+    db.execute(_LOCK_DELTAS_SQL)
+    db.execute(_DELETE_MONTH_DELTAS_SQL, {"month": month_start(month)})
+    db.execute(_DELETE_MONTH_SQL, {"month": month_start(month)})
+    db.execute(_REBUILD_MONTH_SQL, {"start": start, "end": end})
+
+
+def merge_pending(db: Session, batch: int = 5000) -> int:
+    """Злити до batch найстаріших приростів у stock_ledger_monthly (виклик у транзакції); повертає кількість."""
+    return db.execute(_MERGE_SQL, {"batch": batch}).scalar()
+
+
+def ledger_months(db: Session) -> tuple:
+    """(first, last) month present in stock_ledger, or (None, None)."""
+    return tuple(db.execute(_LEDGER_MONTHS_SQL).one())
+
+
+def movement_statement(
+    db: Session,
+    date_from: datetime,
+    date_to: datetime,
+    warehouse_id: Optional[int] = None,
+    material_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    skip: int = 0,
+    limit: int = 100,
+) -> list:
+    """Рядки звіту для [date_from, date_to); у кожному рядку total — загальна кількість пар."""
+    if date_from.tzinfo is None:
+        date_from = date_from.replace(tzinfo=timezone.utc)
+    if date_to.tzinfo is None:
+        date_to = date_to.replace(tzinfo=timezone.utc)
+    date_from = date_from.astimezone(timezone.utc)
+    date_to = date_to.astimezone(timezone.utc)
+
+    # open_month: місяць date_from — до нього залишок із підсумків, далі сирі рядки
+    open_month = month_start(date_from.date())
+    first_full = open_month if _utc(open_month) == date_from else next_month(open_month)
+    last_full_end = month_start(date_to.date())
+
+    if first_full < last_full_end:
+        rollup_from, rollup_to = first_full, last_full_end
+        head_to, tail_from = _utc(first_full), _utc(last_full_end)
+    else:
+        # період усередині одного-двох неповних місяців — лише сирі рядки
+        rollup_from = rollup_to = first_full
+        head_to, tail_from = date_to, date_to
+
+    return db.execute(_STATEMENT_SQL, {
+        "open_month": open_month,
+        "open_start": _utc(open_month),
+        "rollup_from": rollup_from,
+        "rollup_to": rollup_to,
+        "date_from": date_from,
+        "head_to": head_to,
+        "tail_from": tail_from,
+        "date_to": date_to,
+        "warehouse_id": warehouse_id,
+        "material_id": material_id,
+        "category_id": category_id,
+        "skip": skip,
+        "limit": limit,
+    }).all()
@@ -0,0 +1,174 @@
+"""
+Live feed of stock movements.
+
+Every StockLedger row flushed by an ORM session (sync or async) is announced with
+pg_notify in the same transaction, so listeners only see committed
+movements. MovementHub keeps one LISTEN connection per API process and
+fans notifications out to in-process subscribers (SSE clients).
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+from datetime import datetime, timezone
+from typing import Optional
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .models import StockLedger
+
+log = logging.getLogger(__name__)
+
+# NOTIFY payloads are limited to 8000 bytes, so one notification per ledger row
+_NOTIFY_SQL = text(
+    "SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"
+)
+
+
+def ledger_event(row: StockLedger, ts: Optional[datetime] = None) -> dict:
+    """Payload sent for a single ledger row."""
+    return {
+        "id": row.id,
+        "timestamp": (ts or datetime.now(timezone.utc)).isoformat(),
+        "warehouse_id": row.warehouse_id,
+        "material_id": row.material_id,
+        "type": row.movement_type.value,
+        "qty_change": str(row.qty_change),
+        "reference_doc_type": row.reference_doc_type,
+        "reference_doc_id": row.reference_doc_id,
+    }
+
+
+def notify_movements(conn, events: list) -> None:
+    """Queue NOTIFY for already built event payloads on the given connection/session."""
+    if not events:
+        return
+    conn.execute(_NOTIFY_SQL, {
+        "channel": settings.LIVE_FEED_CHANNEL,
+        "payloads": [json.dumps(e, default=str) for e in events],
+    })
+
+
+def _notify_ledger_inserts(session, flush_context):
+    rows = [o for o in session.new if isinstance(o, StockLedger)]
+    if rows:
+        ts = datetime.now(timezone.utc)
+        notify_movements(session.connection(), [ledger_event(r, ts) for r in rows])
+
+
+class _Subscriber:
+    def __init__(self, warehouse_id: Optional[int], material_id: Optional[int], queue_size: int):
+        self.warehouse_id = warehouse_id
+        self.material_id = material_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    def matches(self, evt: dict) -> bool:
+        if self.warehouse_id and evt.get("warehouse_id") != self.warehouse_id:
+            return False
+        if self.material_id and evt.get("material_id") != self.material_id:
+            return False
+        return True
+
+    def push(self, evt: dict) -> None:
+        # повільний клієнт втрачає найстаріші події, а не блокує решту
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(evt)
+
+
+class MovementHub:
+    """LISTEN on one connection in a background thread, fan out on the event loop."""
+
+    def __init__(self, dsn: str, channel: str, queue_size: int = 256):
+        self.dsn = dsn
+        self.channel = channel
+        self.queue_size = queue_size
+        self._subscribers: set = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        if self._thread is not None:
+            return
+        self._loop = loop
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="movement-hub", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    # called on the event loop thread only
+    def subscribe(self, warehouse_id: Optional[int] = None, material_id: Optional[int] = None) -> _Subscriber:
+        sub = _Subscriber(warehouse_id, material_id, self.queue_size)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: _Subscriber) -> None:
+        self._subscribers.discard(sub)
+
+    def _publish(self, payload: str) -> None:
+        try:
+            evt = json.loads(payload)
+        except ValueError:
+            log.warning("Skipping malformed movement payload: %r", payload)
+            return
+        for sub in list(self._subscribers):
+            if sub.matches(evt):
+                sub.push(evt)
+
+    def _run(self) -> None:
+        backoff = 1.0
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+                backoff = 1.0
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        note = conn.notifies.pop(0)
+                        self._loop.call_soon_threadsafe(self._publish, note.payload)
+            except RuntimeError:
+                # цикл подій уже закрито (зупинка сервера) — публікувати нікуди
+                log.info("Movement hub: event loop closed, stopping")
+                self._stop.set()
+            except psycopg2.Error as e:
+                log.warning("Movement hub connection lost: %s; retrying in %.0fs", e, backoff)
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+def _listen_dsn(url: str) -> str:
+    # psycopg2 не розуміє "+driver" у схемі SQLAlchemy URL
+    return make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+hub = MovementHub(_listen_dsn(settings.DATABASE_URL), settings.LIVE_FEED_CHANNEL)
+
+if settings.LIVE_FEED_ENABLED:
+    # на базовий Session, щоб покрити і AsyncSession (його sync_session)
+    event.listen(Session, "after_flush", _notify_ledger_inserts)
@@ -1,5 +1,19 @@
+import asyncio
+import logging
+import time
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import text
+from .config import settings
+from .db import engine, async_engine, pool_status, replicas
+from .auth import jwks_cache
+from .live import hub
+from .metrics import MetricsMiddleware, registry
+from .profiler import ProfilerMiddleware
+from .stock_service import folder
+from .ledger_cache import ledger_cache
+from .jobs import runner as job_runner
 from .security import require_auth
 
 from .routers import (
@@ -13,9 +27,16 @@ from .routers import (
     receipts,
     users,
     stock_ledger,
-    dashboard
+    dashboard,
+    live,
+    profiler,
+    analytics,
+    jobs,
+    stock_counts,
 )
 
+log = logging.getLogger(__name__)
+
 app = FastAPI(
     title="Mini Warehouse API",
     description="Система управління складським обліком"
@@ -29,6 +50,13 @@ app.add_middleware(
     allow_headers=["Authorization", "Content-Type"],
     expose_headers=["Content-Type"]
 )
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+# async-версії гарячих маршрутів реєструються першими і перекривають sync-обробники
+if settings.ASYNC_DB_ENABLED:
+    for module in (stock, stock_ledger, issues, receipts, dashboard):
+        app.include_router(module.async_router)
 
 app.include_router(categories.router)
 app.include_router(suppliers.router)
@@ -41,6 +69,79 @@ app.include_router(stock_ledger.router)
 app.include_router(receipts.router)
 app.include_router(users.router)
 app.include_router(dashboard.router)
+app.include_router(live.router)
+app.include_router(profiler.router)
+app.include_router(analytics.router)
+app.include_router(jobs.router)
+app.include_router(stock_counts.router)
+
+
+@app.on_event("startup")
+async def warm_up_auth():
+    # ключі тягнемо до першого запиту, далі їх оновлює фоновий потік
+    if not settings.AUTH_DISABLED:
+        try:
+            await asyncio.to_thread(jwks_cache.refresh)
+        except Exception as e:
+            log.warning("Initial JWKS fetch failed: %s", e)
+        jwks_cache.start()
+
+
+@app.on_event("startup")
+async def start_live_feed():
+    if settings.LIVE_FEED_ENABLED:
+        hub.start(asyncio.get_running_loop())
+
+
+@app.on_event("shutdown")
+def stop_live_feed():
+    hub.stop()
+
+
+@app.on_event("startup")
+def start_replica_probe():
+    # лаг реплік перевіряє фоновий потік; get_read_db лише читає кешований стан
+    replicas.start()
+
+
+@app.on_event("shutdown")
+def stop_replica_probe():
+    replicas.stop()
+
+
+@app.on_event("startup")
+def start_stock_folder():
+    # згортає stock_deltas і тоді, коли журнал вимкнено — щоб не лишилось хвостів
+    folder.start()
+
+
+@app.on_event("shutdown")
+def stop_stock_folder():
+    folder.stop()
+
+
+@app.on_event("startup")
+def start_ledger_cache():
+    # повне завантаження йде у фоновому потоці; до готовності аналітика читає з БД
+    if settings.LEDGER_CACHE_ENABLED:
+        ledger_cache.start()
+
+
+@app.on_event("shutdown")
+def stop_ledger_cache():
+    ledger_cache.stop()
+
+
+@app.on_event("startup")
+def start_job_runner():
+    # власний пул потоків: довгі звіти не займають потоки обробки запитів
+    if settings.JOB_RUNNER_ENABLED:
+        job_runner.start()
+
+
+@app.on_event("shutdown")
+def stop_job_runner():
+    job_runner.stop()
 
 @app.get("/api/health")
 def health_check():
@@ -48,6 +149,42 @@ def health_check():
     return {"status": "ok", "service": "mini-warehouse"}
 
 
+@app.get("/api/health/ready")
+def readiness_check():
+    """Readiness probe: DB round-trip latency + pool state"""
+    start = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except Exception as e:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "unavailable", "error": str(e), "pool": pool_status(engine)},
+        )
+    return {
+        "status": "ready",
+        "db_latency_ms": round((time.perf_counter() - start) * 1000, 3),
+        "pool": pool_status(engine),
+    }
+
+
+@app.get("/api/health/pool")
+def pool_stats():
+    """Connection pool statistics (checked out, overflow, wait time)"""
+    out = {"sync": pool_status(engine)}
+    if async_engine is not None:
+        out["async"] = pool_status(async_engine.sync_engine)
+    if replicas.engines:
+        out["replicas"] = replicas.status()
+    return out
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 def root():
     """Root endpoint"""
@@ -0,0 +1,197 @@
+"""
+Per-route request metrics in Prometheus text format.
+
+MetricsMiddleware records latency, in-flight requests, response size and
+errors per route template (/api/issues/{id}, not /api/issues/17). SQL
+statement counts and time are attributed to the current request through
+SQLAlchemy engine events and a context variable. Values are per worker
+process; Prometheus sums them across scrape targets.
+"""
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+DB_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """Minimal thread-safe counters, gauges and histograms keyed by label tuples."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}  # name -> (type, help, label names, buckets)
+        self._values = {}  # name -> {labels: value | _Histogram}
+
+    def _declare(self, kind, name, help_, labels, buckets=None):
+        self._meta[name] = (kind, help_, labels, buckets)
+        self._values[name] = {}
+
+    def counter(self, name, help_, labels):
+        self._declare("counter", name, help_, labels)
+
+    def gauge(self, name, help_, labels):
+        self._declare("gauge", name, help_, labels)
+
+    def histogram(self, name, help_, labels, buckets):
+        self._declare("histogram", name, help_, labels, buckets)
+
+    def inc(self, name, labels, amount=1.0):
+        with self._lock:
+            series = self._values[name]
+            series[labels] = series.get(labels, 0.0) + amount
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            series = self._values[name]
+            hist = series.get(labels)
+            if hist is None:
+                hist = series[labels] = _Histogram(self._meta[name][3])
+            hist.observe(value)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, (kind, help_, label_names, buckets) in self._meta.items():
+                lines.append(f"# HELP {name} {help_}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in self._values[name].items():
+                    pairs = [f'{k}="{_escape(v)}"' for k, v in zip(label_names, labels)]
+                    if kind != "histogram":
+                        lines.append(f"{name}{_fmt_labels(pairs)} {_num(value)}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets + ("+Inf",), value.counts):
+                        cumulative += count
+                        le = 'le="%s"' % (bound if bound == "+Inf" else _num(bound))
+                        lines.append(f"{name}_bucket{_fmt_labels(pairs + [le])} {cumulative}")
+                    lines.append(f"{name}_sum{_fmt_labels(pairs)} {_num(value.sum)}")
+                    lines.append(f"{name}_count{_fmt_labels(pairs)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(pairs) -> str:
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _num(v) -> str:
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+registry = Registry()
+registry.counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+registry.counter("http_request_errors_total", "Requests that ended in 5xx or an unhandled exception.", ("method", "route"))
+registry.gauge("http_requests_in_flight", "Requests currently being served.", ("method", "route"))
+registry.histogram("http_request_duration_seconds", "Request latency.", ("method", "route"), LATENCY_BUCKETS)
+registry.histogram("http_response_size_bytes", "Response body size.", ("method", "route"), SIZE_BUCKETS)
+registry.histogram("db_statements_per_request", "SQL statements executed per request.", ("method", "route"), DB_COUNT_BUCKETS)
+registry.histogram("db_time_per_request_seconds", "Time spent in SQL per request.", ("method", "route"), LATENCY_BUCKETS)
+
+
+# ---------- DB statements per request ----------
+class _DbUsage:
+    __slots__ = ("statements", "seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+
+
+_db_usage: ContextVar[Optional[_DbUsage]] = ContextVar("db_usage", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append((context, time.perf_counter()))
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record_statement(conn.info["metrics_query_start"].pop()[1])
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # after_cursor_execute не викликається для запиту з помилкою — інакше стек росте на з'єднанні
+    conn = exception_context.connection
+    stack = conn.info.get("metrics_query_start") if conn is not None else None
+    # лише якщо before_cursor_execute встиг записати саме цей запит
+    if stack and stack[-1][0] is exception_context.execution_context:
+        _record_statement(stack.pop()[1])
+
+
+def _record_statement(started: float) -> None:
+    usage = _db_usage.get()
+    if usage is not None:
+        usage.statements += 1
+        usage.seconds += time.perf_counter() - started
+
+
+# ---------- middleware ----------
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses (SSE) are not buffered."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def _route_template(self, scope) -> str:
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", scope["path"])
+        return "<unmatched>"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        labels = (scope["method"], self._route_template(scope))
+        usage = _DbUsage()
+        token = _db_usage.set(usage)
+        state = {"status": 500, "size": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["size"] += len(message.get("body", b""))
+            await send(message)
+
+        registry.inc("http_requests_in_flight", labels, 1)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _db_usage.reset(token)
+            registry.inc("http_requests_in_flight", labels, -1)
+            registry.inc("http_requests_total", labels + (str(state["status"]),))
+            if state["status"] >= 500:
+                registry.inc("http_request_errors_total", labels)
+            registry.observe("http_request_duration_seconds", labels, elapsed)
+            registry.observe("http_response_size_bytes", labels, state["size"])
+            registry.observe("db_statements_per_request", labels, usage.statements)
+            registry.observe("db_time_per_request_seconds", labels, usage.seconds)
@@ -0,0 +1,236 @@
+"""
+Opt-in SQL profiler.
+
+A request is profiled when PROFILER_ENABLED is set, or when it carries the
+PROFILER_HEADER header with the PROFILER_TOKEN value. Every SQL statement
+it runs is recorded with its timing and the app-level caller. Statements
+of the same shape repeated PROFILER_N_PLUS_ONE_THRESHOLD times or more are
+flagged as N+1. Reads slower than PROFILER_SLOW_MS get a plan. A plain
+SELECT without a locking clause gets EXPLAIN (ANALYZE, BUFFERS), which
+runs it again. A WITH statement (here usually a data-modifying CTE) or a
+SELECT ... FOR UPDATE/SHARE gets plain EXPLAIN, which does not execute,
+so triggers, row locks and sequences are not touched. The plan is
+captured after the response is sent, on a separate connection, so the
+request's own transaction and locks are never touched. Profiles are kept in a bounded in-memory ring
+buffer per worker, shown at /api/admin/profiler.
+"""
+import asyncio
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .config import settings
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_SKIP_FILES = {os.path.abspath(__file__)}
+MAX_STATEMENTS_KEPT = 500
+MAX_PLANS_PER_REQUEST = 3
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str):
+        self.id = next(_ids)
+        self.method = method
+        self.path = path
+        self.started_at = datetime.now(timezone.utc)
+        self.status = None
+        self.duration_ms = 0.0
+        self.statements = []
+        self.statement_count = 0
+        self.db_ms = 0.0
+        self.shapes = Counter()
+        self.first_caller = {}
+        self.slow = []  # (statement, parameters, engine, ms, caller)
+        self.plans = []
+
+    def record(self, conn, statement, parameters, ms: float) -> None:
+        caller = _caller()
+        self.statement_count += 1
+        self.db_ms += ms
+        self.shapes[statement] += 1
+        self.first_caller.setdefault(statement, caller)
+        if len(self.statements) < MAX_STATEMENTS_KEPT:
+            self.statements.append({"sql": statement, "ms": round(ms, 3), "caller": caller})
+        if ms >= settings.PROFILER_SLOW_MS and _is_read(statement):
+            self.slow.append((statement, parameters, conn.engine, ms, caller))
+
+    def n_plus_one(self) -> list:
+        return [
+            {"sql": sql, "count": n, "caller": self.first_caller.get(sql)}
+            for sql, n in self.shapes.most_common()
+            if n >= settings.PROFILER_N_PLUS_ONE_THRESHOLD
+        ]
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 3),
+            "statement_count": self.statement_count,
+            "db_ms": round(self.db_ms, 3),
+            "n_plus_one": len(self.n_plus_one()),
+            "slow_statements": len(self.slow),
+        }
+
+    def detail(self) -> dict:
+        out = self.summary()
+        out["n_plus_one"] = self.n_plus_one()
+        out["slow_statements"] = [
+            {"sql": s, "ms": round(ms, 3), "caller": caller} for s, _, _, ms, caller in self.slow
+        ]
+        out["plans"] = self.plans
+        out["statements"] = self.statements
+        return out
+
+
+_ids = itertools.count(1)
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("sql_profile", default=None)
+profiles: deque = deque(maxlen=settings.PROFILER_BUFFER_SIZE)
+_profiles_lock = threading.Lock()
+
+
+_LOCKING_CLAUSE = re.compile(r"\bFOR\s+(NO\s+KEY\s+UPDATE|UPDATE|KEY\s+SHARE|SHARE)\b", re.IGNORECASE)
+
+
+def _is_read(statement: str) -> bool:
+    words = statement.split(None, 1)
+    return bool(words) and words[0].upper() in ("SELECT", "WITH")
+
+
+def _can_analyze(statement: str) -> bool:
+    """EXPLAIN ANALYZE лише для простого SELECT: WITH тут часто UPDATE/DELETE/INSERT, FOR UPDATE бере локи."""
+    words = statement.split(None, 1)
+    return bool(words) and words[0].upper() == "SELECT" and not _LOCKING_CLAUSE.search(statement)
+
+
+def _caller() -> Optional[str]:
+    """First stack frame inside the app package that is not the profiler itself."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_APP_DIR) and filename not in _SKIP_FILES:
+            return f"{os.path.relpath(filename, os.path.dirname(_APP_DIR))}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profiler_query_start", []).append((context, time.perf_counter()))
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    if profile is None:
+        return
+    started = conn.info["profiler_query_start"].pop()[1]
+    profile.record(conn, statement, parameters, (time.perf_counter() - started) * 1000)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # запит з помилкою не доходить до after_cursor_execute — прибираємо його мітку
+    conn = exception_context.connection
+    stack = conn.info.get("profiler_query_start") if conn is not None else None
+    if stack and stack[-1][0] is exception_context.execution_context:
+        stack.pop()
+
+
+def _explain(profile: RequestProfile) -> None:
+    for statement, parameters, engine, ms, caller in sorted(profile.slow, key=lambda s: -s[3])[:MAX_PLANS_PER_REQUEST]:
+        analyze = _can_analyze(statement)
+        entry = {"sql": statement, "ms": round(ms, 3), "caller": caller, "analyze": analyze}
+        if engine.dialect.driver != "psycopg2":
+            entry["error"] = f"EXPLAIN capture not supported for driver {engine.dialect.driver}"
+            profile.plans.append(entry)
+            continue
+        try:
+            with engine.connect() as conn:
+                # EXPLAIN ANALYZE виконує запит — лише простий SELECT і в транзакції, яку відкочуємо
+                dbapi_conn = conn.connection
+                cursor = dbapi_conn.cursor()
+                try:
+                    prefix = "EXPLAIN (ANALYZE, BUFFERS) " if analyze else "EXPLAIN "
+                    cursor.execute(prefix + statement, parameters)
+                    entry["plan"] = "\n".join(row[0] for row in cursor.fetchall())
+                finally:
+                    cursor.close()
+                    dbapi_conn.rollback()
+        except Exception as e:
+            entry["error"] = str(e)
+        profile.plans.append(entry)
+
+
+def _requested(scope) -> bool:
+    if settings.PROFILER_ENABLED:
+        return True
+    if not settings.PROFILER_TOKEN:
+        return False
+    header = settings.PROFILER_HEADER.lower().encode()
+    for name, value in scope.get("headers", []):
+        if name == header:
+            return value.decode() == settings.PROFILER_TOKEN
+    return False
+
+
+class ProfilerMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"])
+        token = _current.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.duration_ms = (time.perf_counter() - start) * 1000
+            _current.reset(token)
+            if profile.slow:
+                await asyncio.to_thread(_explain, profile)
+            with _profiles_lock:
+                profiles.append(profile)
+
+
+def list_profiles(limit: int) -> list:
+    with _profiles_lock:
+        items = list(profiles)
+    return [p.summary() for p in reversed(items[-limit:])]
+
+
+def get_profile(profile_id: int) -> Optional[dict]:
+    with _profiles_lock:
+        for p in profiles:
+            if p.id == profile_id:
+                return p.detail()
+    return None
+
+
+def clear_profiles() -> None:
+    with _profiles_lock:
+        profiles.clear()
@@ -0,0 +1,632 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+
+import numpy as np
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.orm import Session
+
+from .. import analytics
+from ..auth import require_role
+from ..config import settings
+from ..db import get_read_db
+from ..ledger_cache import cached_snapshot, group_sum, ledger_cache, to_ts
+from ..ledger_rollup import movement_statement
+from ..models import (
+    Issue, IssueItem, Material, Receipt, ReceiptItem, StockCost, StockCurrent, StockLedger, StockMovementType,
+    Supplier, Warehouse,
+)
+from ..stock_service import current_quantity
+from ..utils import EXCHANGE_RATES_UAH, MONEY_SCALE, QTY_SCALE
+
+router = APIRouter(prefix="/api/analytics", tags=["Analytics"])
+
+# Звіти по stock_ledger: з колонкового кешу в пам'яті (LEDGER_CACHE_ENABLED), інакше — SQL.
+# Заголовок X-Analytics-Source показує, звідки відповідь.
+
+
+def _ledger_filters(q, date_from, date_to, warehouse_id=None, material_id=None, movement_type=None):
+    if date_from:
+        q = q.where(StockLedger.date_time >= date_from)
+    if date_to:
+        q = q.where(StockLedger.date_time <= date_to)
+    if warehouse_id:
+        q = q.where(StockLedger.warehouse_id == warehouse_id)
+    if material_id:
+        q = q.where(StockLedger.material_id == material_id)
+    if movement_type:
+        q = q.where(StockLedger.movement_type == movement_type)
+    return q
+
+
+def _names(db: Session, model, ids) -> dict:
+    ids = [int(i) for i in ids]
+    if not ids:
+        return {}
+    cols = (model.id, model.code, model.name) if model is Material else (model.id, model.name)
+    return {r[0]: r for r in db.execute(select(*cols).where(model.id.in_(ids))).all()}
+
+
+# ---------- movement per material ----------
+@router.get("/material-movement")
+def material_movement(
+    response: Response,
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    warehouse_id: Optional[int] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=1000),
+    db: Session = Depends(get_read_db),
+):
+    """Надходження / вибуття / нетто по матеріалах за період, за спаданням обороту"""
+    snap = cached_snapshot(to_ts(date_from))
+    if snap is not None:
+        m = snap.mask(to_ts(date_from), to_ts(date_to), warehouse_id=warehouse_id)
+        qty = snap.qty[m]
+        keys, (qty_in, qty_out, value, moves) = group_sum(
+            snap.material_id[m],
+            np.where(qty > 0, qty, 0),
+            np.where(qty < 0, -qty, 0),
+            snap.value[m],
+            np.ones(qty.size, dtype=np.int64),
+        )
+        order = np.lexsort((keys, -(qty_in + qty_out)))[skip:skip + limit]
+        rows = [
+            (int(keys[i]), int(qty_in[i]), int(qty_out[i]), int(value[i]), int(moves[i]))
+            for i in order
+        ]
+        response.headers["X-Analytics-Source"] = "cache"
+    else:
+        qty_in = func.coalesce(func.sum(case((StockLedger.qty_change > 0, StockLedger.qty_change), else_=0)), 0)
+        qty_out = func.coalesce(func.sum(case((StockLedger.qty_change < 0, -StockLedger.qty_change), else_=0)), 0)
+        q = select(
+            StockLedger.material_id,
+            qty_in.label("qty_in"),
+            qty_out.label("qty_out"),
+            func.coalesce(func.sum(StockLedger.total_price), 0).label("value"),
+            func.count(StockLedger.id).label("moves"),
+        )
+        q = _ledger_filters(q, date_from, date_to, warehouse_id=warehouse_id)
+        q = q.group_by(StockLedger.material_id).order_by(
+            (qty_in + qty_out).desc(), StockLedger.material_id
+        ).offset(skip).limit(limit)
+        rows = [
+            (r.material_id, r.qty_in * QTY_SCALE, r.qty_out * QTY_SCALE, r.value * MONEY_SCALE, r.moves)
+            for r in db.execute(q).all()
+        ]
+        response.headers["X-Analytics-Source"] = "db"
+
+    names = _names(db, Material, [r[0] for r in rows if r[0] is not None and r[0] >= 0])
+    return [
+        {
+            "material_id": mid if mid is not None and mid >= 0 else None,
+            "code": names[mid].code if mid in names else None,
+            "name": names[mid].name if mid in names else None,
+            "qty_in": float(qi) / QTY_SCALE,
+            "qty_out": float(qo) / QTY_SCALE,
+            "net_qty": float(qi - qo) / QTY_SCALE,
+            "value": float(v) / MONEY_SCALE,
+            "movements": int(n),
+        }
+        for mid, qi, qo, v, n in rows
+    ]
+
+
+# ---------- top materials by movement type ----------
+@router.get("/top-materials")
+def top_materials(
+    response: Response,
+    movement_type: StockMovementType = StockMovementType.issue,
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    warehouse_id: Optional[int] = None,
+    limit: int = Query(10, ge=1, le=500),
+    db: Session = Depends(get_read_db),
+):
+    """Топ матеріалів за обсягом руху заданого типу (за замовчуванням — видача)"""
+    snap = cached_snapshot(to_ts(date_from))
+    if snap is not None:
+        m = snap.mask(to_ts(date_from), to_ts(date_to), warehouse_id=warehouse_id, movement_type=movement_type)
+        keys, (qty, value) = group_sum(snap.material_id[m], np.abs(snap.qty[m]), np.abs(snap.value[m]))
+        order = np.lexsort((keys, -qty))[:limit]
+        rows = [(int(keys[i]), int(qty[i]), int(value[i])) for i in order]
+        response.headers["X-Analytics-Source"] = "cache"
+    else:
+        total_qty = func.sum(func.abs(StockLedger.qty_change))
+        q = select(
+            StockLedger.material_id,
+            total_qty.label("qty"),
+            func.coalesce(func.sum(func.abs(StockLedger.total_price)), 0).label("value"),
+        )
+        q = _ledger_filters(q, date_from, date_to, warehouse_id=warehouse_id, movement_type=movement_type)
+        q = q.group_by(StockLedger.material_id).order_by(total_qty.desc(), StockLedger.material_id).limit(limit)
+        rows = [(r.material_id, r.qty * QTY_SCALE, r.value * MONEY_SCALE) for r in db.execute(q).all()]
+        response.headers["X-Analytics-Source"] = "db"
+
+    names = _names(db, Material, [r[0] for r in rows if r[0] is not None and r[0] >= 0])
+    return [
+        {
+            "material_id": mid if mid is not None and mid >= 0 else None,
+            "code": names[mid].code if mid in names else None,
+            "name": names[mid].name if mid in names else None,
+            "qty": float(qty) / QTY_SCALE,
+            "value": float(value) / MONEY_SCALE,
+        }
+        for mid, qty, value in rows
+    ]
+
+
+# ---------- distribution across warehouses ----------
+@router.get("/warehouse-distribution")
+def warehouse_distribution(
+    response: Response,
+    material_id: Optional[int] = None,
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    db: Session = Depends(get_read_db),
+):
+    """Нетто-рух і кількість операцій по складах (опційно для одного матеріалу)"""
+    snap = cached_snapshot(to_ts(date_from))
+    if snap is not None:
+        m = snap.mask(to_ts(date_from), to_ts(date_to), material_id=material_id)
+        keys, (qty, value, moves) = group_sum(
+            snap.warehouse_id[m], snap.qty[m], snap.value[m], np.ones(int(m.sum()), dtype=np.int64)
+        )
+        rows = [(int(keys[i]), int(qty[i]), int(value[i]), int(moves[i])) for i in range(keys.size)]
+        response.headers["X-Analytics-Source"] = "cache"
+    else:
+        q = select(
+            StockLedger.warehouse_id,
+            func.coalesce(func.sum(StockLedger.qty_change), 0).label("qty"),
+            func.coalesce(func.sum(StockLedger.total_price), 0).label("value"),
+            func.count(StockLedger.id).label("moves"),
+        )
+        q = _ledger_filters(q, date_from, date_to, material_id=material_id)
+        q = q.group_by(StockLedger.warehouse_id).order_by(StockLedger.warehouse_id)
+        rows = [(r.warehouse_id, r.qty * QTY_SCALE, r.value * MONEY_SCALE, r.moves) for r in db.execute(q).all()]
+        response.headers["X-Analytics-Source"] = "db"
+
+    names = _names(db, Warehouse, [r[0] for r in rows if r[0] is not None and r[0] >= 0])
+    return [
+        {
+            "warehouse_id": wid if wid is not None and wid >= 0 else None,
+            "warehouse_name": names[wid].name if wid in names else None,
+            "net_qty": float(qty) / QTY_SCALE,
+            "value": float(value) / MONEY_SCALE,
+            "movements": int(n),
+        }
+        for wid, qty, value, n in rows
+    ]
+
+
+# ---------- ABC / XYZ ----------
+@router.get("/abc-xyz")
+def abc_xyz(
+    response: Response,
+    date_from: Optional[date] = Query(None, description="за замовчуванням — 365 днів до date_to"),
+    date_to: Optional[date] = Query(None, description="включно; за замовчуванням — сьогодні (UTC)"),
+    period: str = Query("month", pattern="^(week|month)$"),
+    warehouse_id: Optional[int] = None,
+    a_share: float = Query(0.8, gt=0, lt=1),
+    b_share: float = Query(0.95, gt=0, le=1),
+    x_cv: float = Query(0.5, ge=0),
+    y_cv: float = Query(1.0, ge=0),
+    cls: Optional[str] = Query(None, alias="class", pattern="^[ABC][XYZ]?$"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=5000),
+    db: Session = Depends(get_read_db),
+):
+    """
+    ABC/XYZ-аналіз видачі за вікно: частка вартості (UAH) і коефіцієнт варіації попиту по періодах.
+    Межі періодів — у UTC; крайні періоди вікна можуть бути неповними.
+    """
+    date_to = date_to or datetime.now(timezone.utc).date()
+    date_from = date_from or date_to - timedelta(days=365)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to")
+    if a_share >= b_share:
+        raise HTTPException(status_code=400, detail="a_share must be less than b_share")
+    if x_cv >= y_cv:
+        raise HTTPException(status_code=400, detail="x_cv must be less than y_cv")
+
+    key = ("abc-xyz", date_from, date_to, period, warehouse_id, a_share, b_share, x_cv, y_cv,
+           analytics.issue_version(db))
+    report, hit = analytics.reports.get_or_compute(key, lambda: analytics.abc_xyz(
+        db, date_from, date_to, period, warehouse_id, a_share, b_share, x_cv, y_cv
+    ))
+    response.headers["X-Analytics-Cache"] = "hit" if hit else "miss"
+
+    selected = report.select(cls)
+    page = selected[skip:skip + limit]
+    names = _names(db, Material, report.material_id[page])
+    items = []
+    for i in page:
+        mid = int(report.material_id[i])
+        cv = float(report.cv[i])
+        items.append({
+            "material_id": mid,
+            "code": names[mid].code if mid in names else None,
+            "name": names[mid].name if mid in names else None,
+            "issue_value": round(float(report.value[i]), 2),
+            "issue_qty": round(float(report.qty[i]), 4),
+            "value_share": round(float(report.share[i]), 6),
+            "cumulative_share": round(float(report.cumulative[i]), 6),
+            "abc": str(report.abc[i]),
+            "active_periods": int(report.active_periods[i]),
+            "demand_mean": round(float(report.mean[i]), 4),
+            "demand_cv": round(cv, 4) if np.isfinite(cv) else None,
+            "xyz": str(report.xyz[i]),
+            "class": f"{report.abc[i]}{report.xyz[i]}",
+        })
+
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "period": period,
+        "periods": report.n_periods,
+        "materials": int(report.material_id.size),
+        "total_value": round(report.total_value, 2),
+        "matrix": report.matrix(),
+        "total": int(selected.size),
+        "items": items,
+    }
+
+
+# ---------- reorder points / replenishment ----------
+@router.get("/replenishment")
+def replenishment(
+    response: Response,
+    lookback_days: int = Query(settings.REPLENISHMENT_LOOKBACK_DAYS, ge=7, le=1095),
+    lead_time_days: float = Query(settings.REPLENISHMENT_LEAD_TIME_DAYS, gt=0, le=365),
+    review_days: float = Query(settings.REPLENISHMENT_REVIEW_DAYS, ge=0, le=365),
+    service_level: float = Query(settings.REPLENISHMENT_SERVICE_LEVEL, gt=0.5, lt=1),
+    warehouse_id: Optional[int] = None,
+    only_suggested: bool = True,
+    include_drafts: bool = True,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=100000),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Точки замовлення і рекомендовані кількості для всього каталогу (склад x матеріал),
+    плюс чернетки надходжень по постачальниках. Перераховується лише після нових рухів.
+    """
+    key = ("replenishment", datetime.now(timezone.utc).date(), lookback_days, lead_time_days, review_days,
+           service_level, warehouse_id, analytics.ledger_version(db))
+    report, hit = analytics.reports.get_or_compute(key, lambda: analytics.replenishment(
+        db, lookback_days, lead_time_days, review_days, service_level, warehouse_id
+    ))
+    response.headers["X-Analytics-Cache"] = "hit" if hit else "miss"
+
+    selected = report.select(only_suggested)
+    page = selected[skip:skip + limit]
+    materials = _names(db, Material, report.material_id[page])
+    items = []
+    for i in page:
+        mid = int(report.material_id[i])
+        supplier_id = int(report.supplier_id[i])
+        cover = float(report.days_of_cover[i])
+        items.append({
+            "warehouse_id": int(report.warehouse_id[i]),
+            "material_id": mid,
+            "code": materials[mid].code if mid in materials else None,
+            "name": materials[mid].name if mid in materials else None,
+            "available": round(float(report.available[i]), 4),
+            "daily_demand": round(float(report.daily_demand[i]), 4),
+            "daily_demand_std": round(float(report.daily_std[i]), 4),
+            "days_of_cover": round(cover, 1) if np.isfinite(cover) else None,
+            "safety_stock": round(float(report.safety_stock[i]), 4),
+            "reorder_point": round(float(report.reorder_point[i]), 4),
+            "order_up_to": round(float(report.order_up_to[i]), 4),
+            "suggested_qty": round(float(report.suggested_qty[i]), 4),
+            "supplier_id": supplier_id if supplier_id >= 0 else None,
+        })
+
+    result = {
+        "lookback_days": lookback_days,
+        "lead_time_days": lead_time_days,
+        "review_days": review_days,
+        "service_level": service_level,
+        "pairs": report.pairs,
+        "suggested": int(report.suggested.size),
+        "total": int(selected.size),
+        "items": items,
+    }
+    if include_drafts:
+        drafts = report.drafts()
+        suppliers = _names(db, Supplier, [d["supplier_id"] for d in drafts if d["supplier_id"] is not None])
+        for d in drafts:
+            d["supplier_name"] = suppliers[d["supplier_id"]].name if d["supplier_id"] in suppliers else None
+        result["drafts"] = drafts
+    return result
+
+
+# ---------- turnover / days of supply / dead stock ----------
+def _doc_qty(item_model, doc_model, fk, since):
+    return (
+        select(
+            item_model.warehouse_id,
+            item_model.material_id,
+            func.sum(item_model.qty).label("qty"),
+        )
+        .join(doc_model, doc_model.id == fk)
+        .where(doc_model.date >= since)
+        .group_by(item_model.warehouse_id, item_model.material_id)
+        .subquery()
+    )
+
+
+@router.get("/turnover")
+def turnover(
+    days: int = Query(90, ge=1, le=1095, description="вікно для видач/надходжень"),
+    warehouse_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    dead_days: Optional[int] = Query(None, ge=1, description="лише залишки без руху щонайменше N днів"),
+    sort: str = Query("last_movement", pattern="^(last_movement|turnover|days_of_supply)$"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=5000),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Оборотність, запас у днях і дні без руху по парі (склад, матеріал).
+
+    turnover = issued / average on hand, where average = (opening + on hand) / 2
+    and opening = on hand - received + issued over the window (adjustments
+    excluded). days_of_supply = on hand / (issued / days).
+    days_since_movement comes from stock_current.last_movement_at, which is
+    indexed, so dead-stock filtering needs no ledger scan.
+    """
+    now = datetime.now(timezone.utc)
+    since = now - timedelta(days=days)
+    issued = _doc_qty(IssueItem, Issue, IssueItem.issue_id, since)
+    received = _doc_qty(ReceiptItem, Receipt, ReceiptItem.receipt_id, since)
+
+    on_hand = current_quantity()
+    issued_qty = func.coalesce(issued.c.qty, 0)
+    received_qty = func.coalesce(received.c.qty, 0)
+    avg_on_hand = (2 * on_hand - received_qty + issued_qty) / 2
+    turnover_ratio = issued_qty / func.nullif(avg_on_hand, 0)
+    days_of_supply = on_hand * days / func.nullif(issued_qty, 0)
+
+    filters = []
+    if warehouse_id:
+        filters.append(StockCurrent.warehouse_id == warehouse_id)
+    if category_id:
+        filters.append(Material.category_id == category_id)
+    if dead_days:
+        filters.append(on_hand > 0)
+        cutoff = now - timedelta(days=dead_days)
+        filters.append((StockCurrent.last_movement_at < cutoff) | StockCurrent.last_movement_at.is_(None))
+
+    q = (
+        select(
+            StockCurrent.warehouse_id,
+            StockCurrent.material_id,
+            Material.code,
+            Material.name,
+            Material.category_id,
+            on_hand.label("on_hand"),
+            issued_qty.label("issued"),
+            received_qty.label("received"),
+            turnover_ratio.label("turnover"),
+            days_of_supply.label("days_of_supply"),
+            StockCurrent.last_movement_at,
+        )
+        .join(Material, Material.id == StockCurrent.material_id)
+        .outerjoin(issued, and_(
+            issued.c.warehouse_id == StockCurrent.warehouse_id, issued.c.material_id == StockCurrent.material_id
+        ))
+        .outerjoin(received, and_(
+            received.c.warehouse_id == StockCurrent.warehouse_id, received.c.material_id == StockCurrent.material_id
+        ))
+        .where(*filters)
+    )
+
+    total = db.execute(select(func.count()).select_from(q.subquery())).scalar()
+
+    if sort == "turnover":
+        order = [turnover_ratio.asc().nullsfirst()]
+    elif sort == "days_of_supply":
+        order = [days_of_supply.desc().nullsfirst()]
+    else:
+        order = [StockCurrent.last_movement_at.asc().nullsfirst()]
+    rows = db.execute(
+        q.order_by(*order, StockCurrent.warehouse_id, StockCurrent.material_id).offset(skip).limit(limit)
+    ).all()
+
+    return {
+        "days": days,
+        "total": total,
+        "items": [
+            {
+                "warehouse_id": r.warehouse_id,
+                "material_id": r.material_id,
+                "code": r.code,
+                "name": r.name,
+                "category_id": r.category_id,
+                "on_hand": r.on_hand,
+                "issued": r.issued,
+                "received": r.received,
+                "turnover": round(float(r.turnover), 4) if r.turnover is not None else None,
+                "days_of_supply": round(float(r.days_of_supply), 1) if r.days_of_supply is not None else None,
+                "last_movement_at": r.last_movement_at,
+                "days_since_movement": (now - r.last_movement_at).days if r.last_movement_at else None,
+            }
+            for r in rows
+        ],
+    }
+
+
+# ---------- opening / in / out / closing ----------
+@router.get("/movement-statement")
+def movement_statement_report(
+    date_from: Optional[datetime] = Query(None, description="за замовчуванням — початок поточного місяця (UTC)"),
+    date_to: Optional[datetime] = Query(None, description="не включно; за замовчуванням — зараз"),
+    warehouse_id: Optional[int] = None,
+    material_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=5000),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Відомість руху запасів: залишок на початок, надходження, видача, коригування, залишок на кінець.
+    Повні місяці — з місячних підсумків, неповні краї періоду — з журналу.
+    """
+    now = datetime.now(timezone.utc)
+    date_to = date_to or now
+    date_from = date_from or now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if date_from.tzinfo is None:
+        date_from = date_from.replace(tzinfo=timezone.utc)
+    if date_to.tzinfo is None:
+        date_to = date_to.replace(tzinfo=timezone.utc)
+    if date_from >= date_to:
+        raise HTTPException(status_code=400, detail="date_from must be before date_to")
+
+    rows = movement_statement(db, date_from, date_to, warehouse_id, material_id, category_id, skip, limit)
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "total": rows[0].total if rows else 0,
+        "items": [
+            {
+                "warehouse_id": r.warehouse_id,
+                "warehouse_name": r.warehouse_name,
+                "material_id": r.material_id,
+                "code": r.code,
+                "name": r.material_name,
+                "opening": r.opening,
+                "receipts": r.receipts,
+                "issues": r.issues,
+                "adjustments": r.adjustments,
+                "closing": r.closing,
+            }
+            for r in rows
+        ],
+    }
+
+
+# ---------- costing: valuation and COGS ----------
+@router.get("/valuation")
+def valuation(
+    warehouse_id: Optional[int] = None,
+    material_id: Optional[int] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=5000),
+    db: Session = Depends(get_read_db),
+):
+    """Вартість залишку за ковзною середньою собівартістю (UAH), за спаданням вартості"""
+    filters = [StockCost.quantity != 0]
+    if warehouse_id:
+        filters.append(StockCost.warehouse_id == warehouse_id)
+    if material_id:
+        filters.append(StockCost.material_id == material_id)
+
+    total_value, total = db.execute(
+        select(func.coalesce(func.sum(StockCost.value), 0), func.count(StockCost.id)).where(*filters)
+    ).one()
+    rows = db.execute(
+        select(StockCost.warehouse_id, StockCost.material_id, StockCost.quantity, StockCost.avg_cost, StockCost.value)
+        .where(*filters)
+        .order_by(StockCost.value.desc(), StockCost.warehouse_id, StockCost.material_id)
+        .offset(skip).limit(limit)
+    ).all()
+
+    names = _names(db, Material, [r.material_id for r in rows])
+    return {
+        "total_value": total_value,
+        "total": total,
+        "items": [
+            {
+                "warehouse_id": r.warehouse_id,
+                "material_id": r.material_id,
+                "code": names[r.material_id].code if r.material_id in names else None,
+                "name": names[r.material_id].name if r.material_id in names else None,
+                "quantity": r.quantity,
+                "avg_cost": r.avg_cost,
+                "value": r.value,
+            }
+            for r in rows
+        ],
+    }
+
+
+@router.get("/cogs")
+def cogs_report(
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    warehouse_id: Optional[int] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=5000),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Собівартість видач і валовий прибуток по матеріалах за період (UAH).
+    Позиції, видані до запуску обліку собівартості, не мають COGS: виручка і маржа рахуються
+    лише по позиціях із собівартістю, решта — в uncosted_lines і uncosted_revenue.
+    """
+    rate = case(*[(IssueItem.currency == c, r) for c, r in EXCHANGE_RATES_UAH.items()], else_=1)
+    revenue = func.coalesce(func.sum(IssueItem.total_price * rate).filter(IssueItem.cogs.isnot(None)), 0)
+    cogs = func.coalesce(func.sum(IssueItem.cogs), 0)
+    uncosted = func.count(IssueItem.id).filter(IssueItem.cogs.is_(None))
+    uncosted_revenue = func.coalesce(func.sum(IssueItem.total_price * rate).filter(IssueItem.cogs.is_(None)), 0)
+
+    filters = []
+    if date_from:
+        filters.append(Issue.date >= date_from)
+    if date_to:
+        filters.append(Issue.date <= date_to)
+    if warehouse_id:
+        filters.append(IssueItem.warehouse_id == warehouse_id)
+
+    totals = db.execute(
+        select(revenue, cogs, uncosted, uncosted_revenue).select_from(IssueItem).join(Issue, Issue.id == IssueItem.issue_id).where(*filters)
+    ).one()
+    rows = db.execute(
+        select(
+            IssueItem.material_id,
+            func.sum(IssueItem.qty).label("qty"),
+            revenue.label("revenue"),
+            cogs.label("cogs"),
+            uncosted.label("uncosted"),
+            uncosted_revenue.label("uncosted_revenue"),
+        )
+        .join(Issue, Issue.id == IssueItem.issue_id)
+        .where(*filters)
+        .group_by(IssueItem.material_id)
+        .order_by(cogs.desc(), IssueItem.material_id)
+        .offset(skip).limit(limit)
+    ).all()
+
+    def margin(rev, cost):
+        return {
+            "revenue": round(rev, 2),
+            "cogs": round(cost, 2),
+            "gross_margin": round(rev - cost, 2),
+            "margin_pct": round(float((rev - cost) / rev * 100), 2) if rev else None,
+        }
+
+    names = _names(db, Material, [r.material_id for r in rows])
+    return {
+        **margin(totals[0], totals[1]),
+        "uncosted_lines": totals[2],
+        "uncosted_revenue": round(totals[3], 2),
+        "items": [
+            {
+                "material_id": r.material_id,
+                "code": names[r.material_id].code if r.material_id in names else None,
+                "name": names[r.material_id].name if r.material_id in names else None,
+                "qty": r.qty,
+                **margin(r.revenue, r.cogs),
+                "uncosted_lines": r.uncosted,
+                "uncosted_revenue": round(r.uncosted_revenue, 2),
+            }
+            for r in rows
+        ],
+    }
+
+
+@router.get("/ledger-cache")
+def ledger_cache_status(_: dict = Depends(require_role("admin"))):
+    """Стан кешу журналу: рядки, пам'ять, вік, покриття"""
+    return ledger_cache.status()
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, File, UploadFile
 from sqlalchemy.orm import Session
 from typing import List
 
@@ -6,6 +6,7 @@ from ..db import get_db
 from ..models import Client
 from ..schemas import ClientCreate, ClientUpdate, ClientResponse
 from ..auth import require_role
+from ..bulk_import import import_file
 
 router = APIRouter(prefix="/api/clients", tags=["Clients"])
 
@@ -39,6 +40,17 @@ def create_client(
     return client
 
 
+@router.post("/import")
+def import_clients(
+    file: UploadFile = File(...),
+    dry_run: bool = Query(False, description="Перевірити файл і порахувати зміни без збереження"),
+    db: Session = Depends(get_db),
+    _: dict = Depends(require_role("admin"))
+):
+    """Масовий імпорт клієнтів з CSV/XLSX (тільки admin); повертає звіт з помилками по рядках"""
+    return import_file(db, "clients", file, dry_run=dry_run)
+
+
 @router.get("/{id}", response_model=ClientResponse)
 def get_client(id: int, db: Session = Depends(get_db)):
     """Отримати клієнта за ID"""
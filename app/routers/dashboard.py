@@ -1,11 +1,14 @@
 from datetime import date, datetime, timedelta
 from typing import List, Optional, Tuple
 from decimal import Decimal
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, select, union_all, literal, cast, bindparam, DateTime, Integer, Interval, String
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, aliased
 
-from ..db import get_db
+from ..db import get_read_db, get_async_db
+from ..utils import EXCHANGE_RATES_UAH
 from ..models import (
     StockCurrent, StockLedger, StockMovementType,
     Material, Warehouse,
@@ -18,12 +21,20 @@ router = APIRouter(prefix="/api/dashboard", tags=["Dashboard"])
 
 
 # ---------- helpers ----------
+def _parse_timezone(tz: str) -> ZoneInfo:
+    try:
+        return ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=422, detail=f"Unknown timezone: {tz}")
+
+
 def _parse_date_range(
     dfrom: Optional[str],
     dto: Optional[str],
     fallback_days: int,
+    tz: Optional[ZoneInfo] = None,
 ) -> Tuple[datetime, datetime]:
-    """Parse 'YYYY-MM-DD' into [from, to] inclusive day range."""
+    """Parse 'YYYY-MM-DD' into [from, to] inclusive day range (naive, wall clock of tz)."""
     if dfrom and dto:
         try:
             f = datetime.fromisoformat(dfrom)
@@ -34,95 +45,205 @@ def _parse_date_range(
         t = datetime(t.year, t.month, t.day, 23, 59, 59, 999999)
         return f, t
     # fallback by days
-    today = datetime.now()
+    today = datetime.now(tz)
     f = today - timedelta(days=fallback_days - 1)
     f = datetime(f.year, f.month, f.day, 0, 0, 0)
     t = datetime(today.year, today.month, today.day, 23, 59, 59, 999999)
     return f, t
 
 
+# ---------- pre-built statements ----------
+# Будуються один раз при імпорті; значення йдуть як bound params, тож SQLAlchemy
+# бере скомпільований SQL з кешу, а asyncpg — готовий prepared statement.
+def _recent_docs(model, since):
+    return select(func.count(model.id)).where(
+        (model.created_at.isnot(None) & (model.created_at >= since))
+        | (model.created_at.is_(None) & (model.date >= since))
+    ).scalar_subquery()
+
+
+_since = bindparam("since", type_=DateTime())
+_SUMMARY_COUNTS = select(
+    select(func.count(Warehouse.id)).scalar_subquery().label("warehouses"),
+    select(func.count(Material.id)).where(Material.is_active.is_(True)).scalar_subquery().label("materials"),
+    select(func.count(Supplier.id)).scalar_subquery().label("suppliers"),
+    select(func.count(Client.id)).scalar_subquery().label("clients"),
+    select(func.count(StockCurrent.id)).where(StockCurrent.below_min).scalar_subquery().label("low_stock_items"),
+    _recent_docs(Receipt, _since).label("receipts"),
+    _recent_docs(Issue, _since).label("issues"),
+)
+
+# вартість складу згортається в БД до однієї суми на валюту — у Python лише кілька рядків
+_STOCK_VALUE_BY_CURRENCY = select(
+    Material.currency,
+    func.sum(StockCurrent.quantity * Material.price).label("value"),
+).join(Material, StockCurrent.material_id == Material.id).where(
+    Material.price.isnot(None)
+).group_by(Material.currency)
+
+_WAREHOUSE_STATS = select(
+    Warehouse.id.label("warehouse_id"),
+    Warehouse.name.label("warehouse_name"),
+    func.coalesce(func.sum(StockCurrent.quantity), 0).label("available"),
+).outerjoin(StockCurrent, StockCurrent.warehouse_id == Warehouse.id).group_by(
+    Warehouse.id, Warehouse.name
+).order_by(Warehouse.id)
+
+_available = (StockCurrent.quantity - StockCurrent.reserved_quantity).label("available")
+_LOW_STOCK_ALERT = select(
+    StockCurrent.warehouse_id,
+    Warehouse.name.label("warehouse_name"),
+    StockCurrent.material_id,
+    Material.code,
+    Material.name,
+    Material.min_stock,
+    _available,
+).join(Warehouse, Warehouse.id == StockCurrent.warehouse_id
+).join(Material, Material.id == StockCurrent.material_id
+).where(StockCurrent.below_min
+).order_by((_available / func.nullif(Material.min_stock, 0)).asc().nullsfirst(), StockCurrent.id
+).offset(bindparam("skip", type_=Integer())).limit(bindparam("limit", type_=Integer()))
+
+_RECENT_ACTIVITIES = select(
+    StockLedger.date_time,
+    StockLedger.movement_type,
+    StockLedger.qty_change,
+    StockLedger.reference_doc_type,
+    StockLedger.reference_doc_id,
+    Warehouse.name.label("warehouse"),
+    Material.name.label("material"),
+).join(Warehouse, Warehouse.id == StockLedger.warehouse_id
+).join(Material, Material.id == StockLedger.material_id
+).order_by(StockLedger.date_time.desc()
+).limit(bindparam("limit", type_=Integer()))
+
+
+def _timeline_stmt():
+    granularity = bindparam("granularity", type_=String())
+    tz = bindparam("tz", type_=String())
+    ts_from = bindparam("ts_from", type_=DateTime(timezone=True))
+    ts_to = bindparam("ts_to", type_=DateTime(timezone=True))
+
+    def bucket_of(col):
+        return func.date_trunc(granularity, func.timezone(tz, col))
+
+    docs = union_all(
+        select(
+            bucket_of(Receipt.date).label("bucket"),
+            literal("receipt").label("kind"),
+            Receipt.total_amount.label("amount"),
+        ).where(Receipt.date >= ts_from, Receipt.date <= ts_to),
+        select(
+            bucket_of(Issue.date).label("bucket"),
+            literal("issue").label("kind"),
+            Issue.total_amount.label("amount"),
+        ).where(Issue.date >= ts_from, Issue.date <= ts_to),
+    ).subquery("docs")
+
+    series = select(
+        func.generate_series(
+            func.date_trunc(granularity, bindparam("date_from", type_=DateTime())),
+            func.date_trunc(granularity, bindparam("date_to", type_=DateTime())),
+            cast(bindparam("step", type_=String()), Interval),
+        ).label("bucket")
+    ).subquery("series")
+
+    is_receipt = docs.c.kind == "receipt"
+    is_issue = docs.c.kind == "issue"
+    return select(
+        series.c.bucket,
+        func.count(docs.c.kind).filter(is_receipt).label("receipts_count"),
+        func.coalesce(func.sum(docs.c.amount).filter(is_receipt), 0).label("receipts_total"),
+        func.count(docs.c.kind).filter(is_issue).label("issues_count"),
+        func.coalesce(func.sum(docs.c.amount).filter(is_issue), 0).label("issues_total"),
+    ).select_from(
+        series.outerjoin(docs, docs.c.bucket == series.c.bucket)
+    ).group_by(series.c.bucket).order_by(series.c.bucket)
+
+
+_TIMELINE = _timeline_stmt()
+
+# сума відпуску за позиціями IssueItem у діапазоні дат документа Issue
+_TOP_MATERIALS = select(
+    Material.id.label("material_id"),
+    Material.code,
+    Material.name,
+    func.coalesce(func.sum(IssueItem.qty), 0).label("total_issued"),
+    func.coalesce(func.sum(IssueItem.total_price), 0).label("total_amount"),
+).join(IssueItem, IssueItem.material_id == Material.id
+).join(Issue, Issue.id == IssueItem.issue_id
+).where(
+    Issue.date >= bindparam("date_from", type_=DateTime()),
+    Issue.date <= bindparam("date_to", type_=DateTime()),
+).group_by(Material.id, Material.code, Material.name
+).order_by(desc("total_issued")
+).limit(bindparam("limit", type_=Integer()))
+
+
+def _counterparty_stmt(party, doc, item, doc_party_col, item_doc_col, with_currency: bool):
+    q = select(
+        party.id.label("id"),
+        party.name.label("name"),
+        func.count(doc.id).label("docs_count"),
+        func.coalesce(func.sum(item.qty), 0).label("total_qty"),
+        func.coalesce(func.sum(item.total_price), 0).label("total"),
+    ).join(doc, doc_party_col == party.id
+    ).join(item, item_doc_col == doc.id
+    ).where(
+        doc.date >= bindparam("date_from", type_=DateTime()),
+        doc.date <= bindparam("date_to", type_=DateTime()),
+    )
+    if with_currency:
+        q = q.where(item.currency == bindparam("currency", type_=String()))
+    return q.group_by(party.id, party.name
+    ).order_by(desc("total")
+    ).limit(bindparam("limit", type_=Integer()))
+
+
+_COUNTERPARTY = {
+    ("clients", c): _counterparty_stmt(Client, Issue, IssueItem, Issue.client_id, IssueItem.issue_id, c)
+    for c in (False, True)
+}
+_COUNTERPARTY.update({
+    ("suppliers", c): _counterparty_stmt(Supplier, Receipt, ReceiptItem, Receipt.supplier_id, ReceiptItem.receipt_id, c)
+    for c in (False, True)
+})
+
+
 # ---------- summary ----------
 @router.get("/summary")
-def get_summary(db: Session = Depends(get_db)):
+def get_summary(db: Session = Depends(get_read_db)):
     """
     Загальна статистика системи.
-    total_stock_value рахується у гривні за фіксованими курсами нижче.
+    total_stock_value рахується у гривні за фіксованими курсами (utils.EXCHANGE_RATES_UAH).
     """
-    exchange_rates = {
-        "UAH": Decimal("1.0"),
-        "USD": Decimal("41.5"),
-        "EUR": Decimal("44.8"),
-        "PLN": Decimal("10.2"),
-        "GBP": Decimal("52.3"),
-        "CHF": Decimal("47.5"),
-        "CZK": Decimal("1.73"),
-        "HUF": Decimal("0.11"),
-        "RON": Decimal("9.0"),
-        "TRY": Decimal("1.2"),
-        "SEK": Decimal("3.8"),
-        "NOK": Decimal("3.7"),
-        "JPY": Decimal("0.27"),
-        "CNY": Decimal("5.7"),
-        "AUD": Decimal("26.5"),
-        "CAD": Decimal("29.8"),
-    }
 
-    total_warehouses = db.query(func.count(Warehouse.id)).scalar() or 0
-    total_materials = db.query(func.count(Material.id)).filter(Material.is_active.is_(True)).scalar() or 0
-    total_suppliers = db.query(func.count(Supplier.id)).scalar() or 0
-    total_clients = db.query(func.count(Client.id)).scalar() or 0
+    counts = db.execute(_SUMMARY_COUNTS, {"since": datetime.now() - timedelta(days=30)}).one()
 
     # перерахунок всіх валют у UAH
-    stock_items = db.query(
-        StockCurrent.quantity,
-        Material.price,
-        Material.currency
-    ).join(Material, StockCurrent.material_id == Material.id
-    ).filter(Material.price.isnot(None)).all()
+    stock_values = db.execute(_STOCK_VALUE_BY_CURRENCY).all()
 
     total_stock_value = Decimal("0")
-    for item in stock_items:
-        qty = Decimal(str(item.quantity or 0))
-        price = Decimal(str(item.price or 0))
-        currency = item.currency or "UAH"
-        rate = exchange_rates.get(currency, Decimal("1.0"))
-        total_stock_value += qty * price * rate
-
-    low_stock_count = db.query(func.count(StockCurrent.id)
-    ).join(Material, StockCurrent.material_id == Material.id
-    ).filter((func.coalesce(StockCurrent.quantity, 0) - func.coalesce(StockCurrent.reserved_quantity, 0)) < func.coalesce(Material.min_stock, 0)
-    ).scalar() or 0
-
-    last_month = datetime.now() - timedelta(days=30)
-    receipts_last_month = db.query(func.count(Receipt.id)
-    ).filter((Receipt.created_at != None) & (Receipt.created_at >= last_month) | ((Receipt.created_at == None) & (Receipt.date >= last_month))
-    ).scalar() or 0
-    issues_last_month = db.query(func.count(Issue.id)
-    ).filter((Issue.created_at != None) & (Issue.created_at >= last_month) | ((Issue.created_at == None) & (Issue.date >= last_month))
-    ).scalar() or 0
+    for item in stock_values:
+        rate = EXCHANGE_RATES_UAH.get(item.currency or "UAH", Decimal("1.0"))
+        total_stock_value += (item.value or Decimal("0")) * rate
 
     return {
-        "warehouses": total_warehouses,
-        "materials": total_materials,
-        "suppliers": total_suppliers,
-        "clients": total_clients,
+        "warehouses": counts.warehouses or 0,
+        "materials": counts.materials or 0,
+        "suppliers": counts.suppliers or 0,
+        "clients": counts.clients or 0,
         "total_stock_value": float(total_stock_value),
-        "low_stock_items": low_stock_count,
-        "receipts_last_30_days": receipts_last_month,
-        "issues_last_30_days": issues_last_month,
+        "low_stock_items": counts.low_stock_items or 0,
+        "receipts_last_30_days": counts.receipts or 0,
+        "issues_last_30_days": counts.issues or 0,
     }
 
 
 # ---------- warehouse stats ----------
 @router.get("/warehouse-stats")
-def warehouse_stats(db: Session = Depends(get_db)):
-    rows = db.query(
-        Warehouse.id.label("warehouse_id"),
-        Warehouse.name.label("warehouse_name"),
-        func.coalesce(func.sum(StockCurrent.quantity), 0).label("available"),
-    ).outerjoin(StockCurrent, StockCurrent.warehouse_id == Warehouse.id).group_by(
-        Warehouse.id, Warehouse.name
-    ).order_by(Warehouse.id).all()
+def warehouse_stats(db: Session = Depends(get_read_db)):
+    rows = db.execute(_WAREHOUSE_STATS).all()
 
     return [
         {"warehouse_id": r.warehouse_id, "warehouse_name": r.warehouse_name, "available": float(r.available)}
@@ -132,24 +253,13 @@ def warehouse_stats(db: Session = Depends(get_db)):
 
 # ---------- low stock alert ----------
 @router.get("/low-stock-alert")
-def low_stock_alert(limit: int = Query(20, ge=1, le=500), db: Session = Depends(get_db)):
-    q = db.query(
-        StockCurrent.warehouse_id,
-        Warehouse.name.label("warehouse_name"),
-        StockCurrent.material_id,
-        Material.code,
-        Material.name,
-        Material.min_stock,
-        func.coalesce(StockCurrent.quantity, 0).label("available")
-    ).join(Warehouse, Warehouse.id == StockCurrent.warehouse_id
-    ).join(Material, Material.id == StockCurrent.material_id
-    ).filter(
-        func.coalesce(StockCurrent.quantity, 0) < func.coalesce(Material.min_stock, 0)
-    ).order_by((func.coalesce(StockCurrent.quantity, 0) / func.nullif(Material.min_stock, 0)).asc().nullsfirst()
-    ).limit(limit)
-
+def low_stock_alert(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=500),
+    db: Session = Depends(get_read_db),
+):
     result = []
-    for r in q.all():
+    for r in db.execute(_LOW_STOCK_ALERT, {"skip": skip, "limit": limit}).all():
         min_stock = float(r.min_stock or 0)
         available = float(r.available or 0)
         fill_rate = 0.0 if min_stock <= 0 else max(0.0, min(100.0, available / min_stock * 100))
@@ -168,22 +278,9 @@ def low_stock_alert(limit: int = Query(20, ge=1, le=500), db: Session = Depends(
 
 # ---------- recent activities (simple feed) ----------
 @router.get("/recent-activities")
-def recent_activities(limit: int = Query(10, ge=1, le=100), db: Session = Depends(get_db)):
-    q = db.query(
-        StockLedger.date_time,
-        StockLedger.movement_type,
-        StockLedger.qty_change,
-        StockLedger.reference_doc_type,
-        StockLedger.reference_doc_id,
-        Warehouse.name.label("warehouse"),
-        Material.name.label("material"),
-    ).join(Warehouse, Warehouse.id == StockLedger.warehouse_id
-    ).join(Material, Material.id == StockLedger.material_id
-    ).order_by(StockLedger.date_time.desc()
-    ).limit(limit)
-
+def recent_activities(limit: int = Query(10, ge=1, le=100), db: Session = Depends(get_read_db)):
     out = []
-    for r in q.all():
+    for r in db.execute(_RECENT_ACTIVITIES, {"limit": limit}).all():
         out.append({
             "timestamp": r.date_time,
             "type": r.movement_type.value,
@@ -196,64 +293,46 @@ def recent_activities(limit: int = Query(10, ge=1, le=100), db: Session = Depend
 
 
 # ---------- receipts/issues timeline with from/to ----------
+TIMELINE_STEPS = {"day": "1 day", "week": "1 week", "month": "1 month"}
+
+
 @router.get("/receipts-issues-timeline")
 def get_receipts_issues_timeline(
     days: int = Query(30, ge=7, le=365),
     from_: Optional[str] = Query(None, alias="from"),
     to: Optional[str] = Query(None, alias="to"),
-    db: Session = Depends(get_db),
+    granularity: str = Query("day", pattern="^(day|week|month)$"),
+    tz: str = Query("UTC", max_length=64),
+    db: Session = Depends(get_read_db),
 ):
-    date_from, date_to = _parse_date_range(from_, to, fallback_days=days)
-
-    # Групуємо по днях за полем date; якщо воно порожнє — за created_at.
-    # PostgreSQL: можна використати date_trunc('day', ...) або ::date.
-    receipts = db.query(
-        func.coalesce(func.date(Receipt.date), func.date(Receipt.created_at)).label("d"),
-        func.count(Receipt.id).label("count"),
-        func.sum(Receipt.total_amount).label("total"),
-    ).filter(
-        (
-            (Receipt.date != None) &
-            (Receipt.date >= date_from) & (Receipt.date <= date_to)
-        ) | (
-            (Receipt.date == None) &
-            (Receipt.created_at >= date_from) & (Receipt.created_at <= date_to)
-        )
-    ).group_by("d").all()
-
-    issues = db.query(
-        func.coalesce(func.date(Issue.date), func.date(Issue.created_at)).label("d"),
-        func.count(Issue.id).label("count"),
-        func.sum(Issue.total_amount).label("total"),
-    ).filter(
-        (
-            (Issue.date != None) &
-            (Issue.date >= date_from) & (Issue.date <= date_to)
-        ) | (
-            (Issue.date == None) &
-            (Issue.created_at >= date_from) & (Issue.created_at <= date_to)
-        )
-    ).group_by("d").all()
-
-    receipts_map = {str(r.d): {"count": int(r.count or 0), "total": float(r.total or 0)} for r in receipts}
-    issues_map = {str(i.d): {"count": int(i.count or 0), "total": float(i.total or 0)} for i in issues}
-
-    # Повний щоденний ряд без дірок
-    out: List[dict] = []
-    cur = date_from.date()
-    end = date_to.date()
-    while cur <= end:
-        d = str(cur)
-        out.append({
-            "date": d,
-            "receipts_count": receipts_map.get(d, {}).get("count", 0),
-            "receipts_total": receipts_map.get(d, {}).get("total", 0.0),
-            "issues_count": issues_map.get(d, {}).get("count", 0),
-            "issues_total": issues_map.get(d, {}).get("total", 0.0),
-        })
-        cur += timedelta(days=1)
+    """
+    Кількість і сума надходжень/видач по бакетах (день/тиждень/місяць).
+    Бакети рахуються у часовому поясі tz, порожні бакети заповнює generate_series.
+    """
+    zone = _parse_timezone(tz)
+    date_from, date_to = _parse_date_range(from_, to, fallback_days=days, tz=zone)
+
+    # Фільтр — звичайний діапазон по date, тож працює індекс ix_*_date.
+    params = {
+        "granularity": granularity,
+        "step": TIMELINE_STEPS[granularity],
+        "tz": tz,
+        "date_from": date_from,
+        "date_to": date_to,
+        "ts_from": date_from.replace(tzinfo=zone),
+        "ts_to": date_to.replace(tzinfo=zone),
+    }
 
-    return out
+    return [
+        {
+            "date": str(r.bucket.date()),
+            "receipts_count": int(r.receipts_count or 0),
+            "receipts_total": float(r.receipts_total or 0),
+            "issues_count": int(r.issues_count or 0),
+            "issues_total": float(r.issues_total or 0),
+        }
+        for r in db.execute(_TIMELINE, params).all()
+    ]
 
 
 # ---------- top materials with from/to ----------
@@ -262,25 +341,11 @@ def top_materials(
     limit: int = Query(5, ge=1, le=100),
     from_: Optional[str] = Query(None, alias="from"),
     to: Optional[str] = Query(None, alias="to"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     date_from, date_to = _parse_date_range(from_, to, fallback_days=30)
 
-    # сума відпуску за позиціями IssueItem у діапазоні дат документа Issue
-    q = db.query(
-        Material.id.label("material_id"),
-        Material.code,
-        Material.name,
-        func.coalesce(func.sum(IssueItem.qty), 0).label("total_issued"),
-        func.coalesce(func.sum(IssueItem.total_price), 0).label("total_amount"),
-    ).join(IssueItem, IssueItem.material_id == Material.id
-    ).join(Issue, Issue.id == IssueItem.issue_id
-    ).filter(
-        Issue.date >= date_from, Issue.date <= date_to
-    ).group_by(Material.id, Material.code, Material.name
-    ).order_by(desc("total_issued")
-    ).limit(limit)
-
+    rows = db.execute(_TOP_MATERIALS, {"date_from": date_from, "date_to": date_to, "limit": limit}).all()
     return [
         {
             "material_id": r.material_id,
@@ -288,7 +353,7 @@ def top_materials(
             "name": r.name,
             "total_issued": float(r.total_issued or 0),
             "total_amount": float(r.total_amount or 0),
-        } for r in q.all()
+        } for r in rows
     ]
 
 
@@ -300,51 +365,14 @@ def counterparty_report(
     limit: int = Query(10, ge=1, le=500),
     from_: Optional[str] = Query(None, alias="from"),
     to: Optional[str] = Query(None, alias="to"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     date_from, date_to = _parse_date_range(from_, to, fallback_days=30)
 
-    if type == "clients":
-        q = db.query(
-            Client.id.label("id"),
-            Client.name.label("name"),
-            func.count(Issue.id).label("docs_count"),
-            func.coalesce(func.sum(IssueItem.qty), 0).label("total_qty"),
-            func.coalesce(func.sum(IssueItem.total_price), 0).label("total"),
-        ).join(Issue, Issue.client_id == Client.id
-        ).join(IssueItem, IssueItem.issue_id == Issue.id
-        ).filter(
-            Issue.date >= date_from, Issue.date <= date_to
-        )
-
-        if currency:
-            q = q.filter(IssueItem.currency == currency)
-
-        q = q.group_by(Client.id, Client.name
-        ).order_by(desc("total")
-        ).limit(limit)
-
-    else:  # suppliers
-        q = db.query(
-            Supplier.id.label("id"),
-            Supplier.name.label("name"),
-            func.count(Receipt.id).label("docs_count"),
-            func.coalesce(func.sum(ReceiptItem.qty), 0).label("total_qty"),
-            func.coalesce(func.sum(ReceiptItem.total_price), 0).label("total"),
-        ).join(Receipt, Receipt.supplier_id == Supplier.id
-        ).join(ReceiptItem, ReceiptItem.receipt_id == Receipt.id
-        ).filter(
-            Receipt.date >= date_from, Receipt.date <= date_to
-        )
-
-        if currency:
-            q = q.filter(ReceiptItem.currency == currency)
-
-        q = q.group_by(Supplier.id, Supplier.name
-        ).order_by(desc("total")
-        ).limit(limit)
-
-    rows = q.all()
+    params = {"date_from": date_from, "date_to": date_to, "limit": limit}
+    if currency:
+        params["currency"] = currency
+    rows = db.execute(_COUNTERPARTY[(type, bool(currency))], params).all()
     return [
         {
             "id": r.id,
@@ -354,3 +382,56 @@ def counterparty_report(
             "total": float(r.total or 0),
         } for r in rows
     ]
+
+
+
+# ---------- async variants (ASYNC_DB_ENABLED) ----------
+async_router = APIRouter(prefix="/api/dashboard", tags=["Dashboard"])
+
+
+@async_router.get("/summary")
+async def get_summary_async(db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(lambda s: get_summary(db=s))
+
+
+@async_router.get("/warehouse-stats")
+async def warehouse_stats_async(db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(lambda s: warehouse_stats(db=s))
+
+
+@async_router.get("/low-stock-alert")
+async def low_stock_alert_async(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=500),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(lambda s: low_stock_alert(skip, limit, db=s))
+
+
+@async_router.get("/recent-activities")
+async def recent_activities_async(limit: int = Query(10, ge=1, le=100), db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(lambda s: recent_activities(limit, db=s))
+
+
+@async_router.get("/receipts-issues-timeline")
+async def get_receipts_issues_timeline_async(
+    days: int = Query(30, ge=7, le=365),
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = Query(None, alias="to"),
+    granularity: str = Query("day", pattern="^(day|week|month)$"),
+    tz: str = Query("UTC", max_length=64),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(
+        lambda s: get_receipts_issues_timeline(days, from_, to, granularity, tz, db=s)
+    )
+
+
+@async_router.get("/top-materials")
+async def top_materials_async(
+    limit: int = Query(5, ge=1, le=100),
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = Query(None, alias="to"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(lambda s: top_materials(limit, from_, to, db=s))
@@ -1,12 +1,15 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
-from sqlalchemy.orm import Session, joinedload
-from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
+from decimal import Decimal
 from typing import List
-from ..db import get_db
-from ..models import Issue, IssueItem, StockCurrent, StockLedger, StockMovementType
+from ..db import get_db, get_async_db
+from ..models import Issue, IssueItem, StockLedger, StockMovementType
 from ..schemas import IssueCreate, IssueResponse, IssueUpdate
 from ..auth import require_role, get_current_user
-from ..utils import to_decimal
+from ..utils import qty_units, money_units, line_total_units, qty_decimal, money_decimal
+from ..stock_service import apply_movements
+from ..costing import post_costs
 
 router = APIRouter(prefix="/api/issues", tags=["Issues"])
 
@@ -18,7 +21,7 @@ def list_issues(
     db: Session = Depends(get_db)
 ):
     """Отримати список видач"""
-    issues = db.query(Issue).offset(skip).limit(limit).all()
+    issues = db.query(Issue).options(selectinload(Issue.items)).offset(skip).limit(limit).all()
     return issues
 
 
@@ -34,24 +37,10 @@ def create_issue(
         raise HTTPException(status_code=400, detail="No items provided")
 
     try:
-        for item_data in data.items:
-            stock = db.query(StockCurrent).filter_by(
-                warehouse_id=item_data.warehouse_id,
-                material_id=item_data.material_id
-            ).first()
-            
-            if not stock:
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"Material {item_data.material_id} not available in warehouse {item_data.warehouse_id}"
-                )
-            
-            available = stock.quantity - stock.reserved_quantity
-            if available < item_data.qty:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Insufficient stock for material {item_data.material_id}. Available: {available}, Requested: {item_data.qty}"
-                )
+        # Атомарне списання всіх позицій; при нестачі — 400 і rollback
+        lines = [(i, qty_units(i.qty), money_units(i.unit_price)) for i in data.items]
+        apply_movements(db, [(i.warehouse_id, i.material_id, -q) for i, q, _ in lines])
+        cogs = post_costs(db, [(i.warehouse_id, i.material_id, -q, None) for i, q, _ in lines])
 
         issue = Issue(
             document_number=data.document_number,
@@ -63,12 +52,11 @@ def create_issue(
         db.add(issue)
         db.flush()
 
-        total_amount = Decimal("0.00")
+        total_units = 0
 
-        for item_data in data.items:
-            qty = to_decimal(item_data.qty, "0.0001")
-            unit_price = to_decimal(item_data.unit_price, "0.01")
-            line_total = (qty * unit_price).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        for (item_data, qty_u, price_u), cogs_u in zip(lines, cogs):
+            line_u = line_total_units(qty_u, price_u)
+            qty, unit_price, line_total = qty_decimal(qty_u), money_decimal(price_u), money_decimal(line_u)
 
             item = IssueItem(
                 issue_id=issue.id,
@@ -79,10 +67,11 @@ def create_issue(
                 currency=item_data.currency,
                 total_price=line_total,
                 weight=item_data.weight,
-                notes=item_data.notes
+                notes=item_data.notes,
+                cogs=money_decimal(cogs_u) if cogs_u is not None else None
             )
             db.add(item)
-            total_amount += line_total
+            total_units += line_u
 
             # Stock ledger entry (negative qty_change for issue)
             ledger = StockLedger(
@@ -99,15 +88,7 @@ def create_issue(
             )
             db.add(ledger)
 
-            # Update stock_current (decrease)
-            stock = db.query(StockCurrent).filter_by(
-                warehouse_id=item_data.warehouse_id,
-                material_id=item_data.material_id
-            ).with_for_update().first()
-
-            stock.quantity = (stock.quantity - qty).quantize(Decimal("0.0001"), rounding=ROUND_HALF_UP)
-
-        issue.total_amount = total_amount
+        issue.total_amount = money_decimal(total_units)
         db.commit()
         db.refresh(issue)
         return issue
@@ -148,20 +129,26 @@ def update_issue_full(
         * компенсує склад та ledger за старими позиціями
         * застосовує нові позиції (як у create)
     """
-    issue = db.query(Issue).filter(Issue.id == id).first()
+    # лок документа: паралельні PUT інакше обидва повернуть на склад ті самі старі позиції
+    issue = db.query(Issue).filter(Issue.id == id).with_for_update().first()
     if not issue:
         raise HTTPException(status_code=404, detail="Issue not found")
 
     old_items = db.query(IssueItem).filter(IssueItem.issue_id == issue.id).all()
     try:
-      for it in old_items:
-          stock = db.query(StockCurrent).filter_by(
-              warehouse_id=it.warehouse_id,
-              material_id=it.material_id
-          ).with_for_update().first()
-          if stock:
-              stock.quantity = (stock.quantity + it.qty).quantize(Decimal("0.0001"), rounding=ROUND_HALF_UP)
+      # Нетто-зміна складу: старі позиції повертаються, нові списуються — одним запитом
+      new_lines = [(i, qty_units(i.qty), money_units(i.unit_price)) for i in (data.items or [])]
+      apply_movements(db, [(it.warehouse_id, it.material_id, qty_units(it.qty)) for it in old_items] + [
+          (i.warehouse_id, i.material_id, -q) for i, q, _ in new_lines
+      ])
+      # собівартість: старі позиції повертаються за своєю COGS, нові списуються за середньою
+      costs = post_costs(db, [
+          (it.warehouse_id, it.material_id, qty_units(it.qty), money_units(it.cogs) if it.cogs is not None else None)
+          for it in old_items
+      ] + [(i.warehouse_id, i.material_id, -q, None) for i, q, _ in new_lines])
+      new_cogs = costs[len(old_items):]
 
+      for it in old_items:
           db.add(StockLedger(
               warehouse_id=it.warehouse_id,
               material_id=it.material_id,
@@ -169,7 +156,7 @@ def update_issue_full(
               qty_change=abs(it.qty),  
               unit_price=it.unit_price,
               currency=it.currency,
-              total_price=(abs(it.qty) * it.unit_price).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP),
+              total_price=money_decimal(line_total_units(qty_units(abs(it.qty)), money_units(it.unit_price))),
               reference_doc_type="Issue(undo)",
               reference_doc_id=issue.id,
               remarks=f"Undo Issue item #{it.id}"
@@ -184,31 +171,11 @@ def update_issue_full(
       for k, v in patch.items():
           setattr(issue, k, v)
 
-      # 3) Якщо прийшли нові items — застосовуємо, перевіряємо склад, пишемо ledger
-      total_amount = Decimal("0.00")
-      new_items = (data.items or [])
-      for item_data in new_items:
-          # перевірка наявності на складі
-          stock = db.query(StockCurrent).filter_by(
-              warehouse_id=item_data.warehouse_id,
-              material_id=item_data.material_id
-          ).with_for_update().first()
-
-          if not stock:
-              raise HTTPException(
-                  status_code=400,
-                  detail=f"Material {item_data.material_id} not available in warehouse {item_data.warehouse_id}"
-              )
-          available = stock.quantity - stock.reserved_quantity
-          if available < item_data.qty:
-              raise HTTPException(
-                  status_code=400,
-                  detail=f"Insufficient stock for material {item_data.material_id}. Available: {available}, Requested: {item_data.qty}"
-              )
-
-          qty = to_decimal(item_data.qty, "0.0001")
-          unit_price = to_decimal(item_data.unit_price, "0.01")
-          line_total = (qty * unit_price).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+      # 3) Якщо прийшли нові items — пишемо позиції та ledger (склад уже списано вище)
+      total_units = 0
+      for (item_data, qty_u, price_u), cogs_u in zip(new_lines, new_cogs):
+          line_u = line_total_units(qty_u, price_u)
+          qty, unit_price, line_total = qty_decimal(qty_u), money_decimal(price_u), money_decimal(line_u)
 
           db.add(IssueItem(
               issue_id=issue.id,
@@ -219,9 +186,10 @@ def update_issue_full(
               currency=item_data.currency or issue.currency,
               total_price=line_total,
               weight=item_data.weight,
-              notes=item_data.notes
+              notes=item_data.notes,
+              cogs=money_decimal(cogs_u) if cogs_u is not None else None
           ))
-          total_amount += line_total
+          total_units += line_u
 
           db.add(StockLedger(
               warehouse_id=item_data.warehouse_id,
@@ -236,9 +204,7 @@ def update_issue_full(
               remarks=f"Update Issue {issue.document_number or issue.id}"
           ))
 
-          stock.quantity = (stock.quantity - qty).quantize(Decimal("0.0001"), rounding=ROUND_HALF_UP)
-
-      issue.total_amount = total_amount
+      issue.total_amount = money_decimal(total_units)
       db.commit()
       db.refresh(issue)
       return issue
@@ -262,4 +228,51 @@ def delete_issue(
         raise HTTPException(status_code=404, detail="Issue not found")
     db.delete(issue)
     db.commit()
-    return None
\ No newline at end of file
+    return None
+
+
+
+# ---------- async variants (ASYNC_DB_ENABLED) ----------
+# Відповідь серіалізуємо всередині run_sync: lazy-load поза greenlet неможливий.
+async_router = APIRouter(prefix="/api/issues", tags=["Issues"])
+
+
+@async_router.get("", response_model=List[IssueResponse])
+async def list_issues_async(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await db.run_sync(
+        lambda s: [IssueResponse.model_validate(i) for i in list_issues(skip, limit, db=s)]
+    )
+
+
+@async_router.post("", response_model=IssueResponse, status_code=201)
+async def create_issue_async(
+    data: IssueCreate,
+    db: AsyncSession = Depends(get_async_db),
+    user: dict = Depends(get_current_user),
+    _: dict = Depends(require_role("storekeeper"))
+):
+    return await db.run_sync(
+        lambda s: IssueResponse.model_validate(create_issue(data, db=s, user=user, _=_))
+    )
+
+
+@async_router.get("/{id}", response_model=IssueResponse)
+async def get_issue_async(id: int, db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(lambda s: IssueResponse.model_validate(get_issue(id, db=s)))
+
+
+@async_router.put("/{id}", response_model=IssueResponse)
+async def update_issue_full_async(
+    id: int,
+    data: IssueUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    user: dict = Depends(get_current_user),
+    _: dict = Depends(require_role("storekeeper"))
+):
+    return await db.run_sync(
+        lambda s: IssueResponse.model_validate(update_issue_full(id, data, db=s, user=user, _=_))
+    )
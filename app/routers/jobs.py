@@ -0,0 +1,133 @@
+from fastapi import APIRouter, HTTPException, Depends, Query, File, UploadFile
+from fastapi.responses import Response
+from sqlalchemy.orm import Session, undefer
+from typing import List, Optional
+
+from ..db import get_db
+from ..models import Job
+from ..schemas import JobSubmit, JobResponse
+from ..auth import require_role
+from ..config import settings
+from .. import jobs
+
+router = APIRouter(prefix="/api/jobs", tags=["Jobs"])
+
+# хто може імпортувати довідник — як у POST /api/<entity>/import
+IMPORT_ROLES = {"materials": "storekeeper", "clients": "admin", "suppliers": "admin"}
+
+
+def _get_job(db: Session, id: int, *options) -> Job:
+    job = db.query(Job).options(*options).filter(Job.id == id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+def _require_job_role(job: Job, user: dict) -> None:
+    """Скасувати чи забрати результат може лише той, хто міг поставити задачу такого типу."""
+    if job.job_type == "bulk_import":
+        role = IMPORT_ROLES.get((job.params or {}).get("entity"), "admin")
+    else:
+        jt = jobs.JOB_TYPES.get(job.job_type)
+        role = jt.role if jt is not None else "admin"
+    require_role(role)(user)
+
+
+@router.get("/types")
+def list_job_types(_: dict = Depends(require_role("storekeeper"))):
+    """Зареєстровані типи задач, їх ліміти одночасного виконання і потрібна роль"""
+    return [
+        {"type": jt.name, "limit": jt.limit, "role": jt.role, "description": (jt.fn.__doc__ or "").strip()}
+        for jt in jobs.JOB_TYPES.values()
+    ]
+
+
+@router.post("", response_model=JobResponse, status_code=202)
+def submit_job(
+    data: JobSubmit,
+    db: Session = Depends(get_db),
+    user: dict = Depends(require_role("storekeeper"))
+):
+    """Поставити задачу в чергу; стан — GET /api/jobs/{id}, результат — GET /api/jobs/{id}/result"""
+    jt = jobs.JOB_TYPES.get(data.type)
+    if jt is None:
+        raise HTTPException(status_code=400, detail=f"Unknown job type: {data.type}")
+    if jt.name == "bulk_import":
+        raise HTTPException(status_code=400, detail="Use POST /api/jobs/import/{entity} to upload the file")
+    require_role(jt.role)(user)
+    return jobs.submit(db, jt.name, data.params, created_by=user.get("sub"))
+
+
+@router.post("/import/{entity}", response_model=JobResponse, status_code=202)
+def submit_import_job(
+    entity: str,
+    file: UploadFile = File(...),
+    dry_run: bool = Query(False),
+    db: Session = Depends(get_db),
+    user: dict = Depends(require_role("storekeeper"))
+):
+    """Великий імпорт довідника у фоні: файл зберігається в задачі, звіт — у результаті"""
+    if entity not in IMPORT_ROLES:
+        raise HTTPException(status_code=404, detail="Unknown import entity")
+    require_role(IMPORT_ROLES[entity])(user)
+
+    limit = settings.JOB_MAX_UPLOAD_MB * 1024 * 1024
+    data = file.file.read(limit + 1)
+    if len(data) > limit:
+        raise HTTPException(status_code=413, detail=f"File is larger than {settings.JOB_MAX_UPLOAD_MB} MB")
+    return jobs.submit(
+        db, "bulk_import", {"entity": entity, "dry_run": dry_run},
+        created_by=user.get("sub"), input_data=data, input_filename=file.filename,
+    )
+
+
+@router.get("", response_model=List[JobResponse])
+def list_jobs(
+    status: Optional[str] = None,
+    job_type: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    _: dict = Depends(require_role("storekeeper"))
+):
+    """Список задач, нові першими"""
+    query = db.query(Job)
+    if status is not None:
+        query = query.filter(Job.status == status)
+    if job_type is not None:
+        query = query.filter(Job.job_type == job_type)
+    return query.order_by(Job.id.desc()).offset(skip).limit(limit).all()
+
+
+@router.get("/{id}", response_model=JobResponse)
+def get_job(id: int, db: Session = Depends(get_db), _: dict = Depends(require_role("storekeeper"))):
+    """Стан і прогрес задачі"""
+    return _get_job(db, id)
+
+
+@router.post("/{id}/cancel", response_model=JobResponse)
+def cancel_job(id: int, db: Session = Depends(get_db), user: dict = Depends(require_role("storekeeper"))):
+    """Скасувати задачу: з черги — одразу, виконувану — на найближчій перевірці в обробнику"""
+    job = _get_job(db, id)
+    _require_job_role(job, user)
+    if job.status in jobs.FINISHED:
+        raise HTTPException(status_code=409, detail=f"Job is already {job.status}")
+    jobs.cancel(db, id)
+    db.refresh(job)
+    return job
+
+
+@router.get("/{id}/result")
+def download_job_result(id: int, db: Session = Depends(get_db), user: dict = Depends(require_role("storekeeper"))):
+    """Завантажити результат виконаної задачі (CSV або JSON)"""
+    job = _get_job(db, id, undefer(Job.result))
+    _require_job_role(job, user)
+    if job.status != jobs.SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    if job.result is None:
+        raise HTTPException(status_code=404, detail="Job has no result")
+    return Response(
+        content=job.result,
+        media_type=job.result_content_type or "application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{job.result_filename or f"job_{id}"}"'},
+    )
@@ -0,0 +1,45 @@
+import asyncio
+import json
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from ..config import settings
+from ..live import hub
+
+router = APIRouter(prefix="/api/live", tags=["Live feed"])
+
+HEARTBEAT_SECONDS = 15
+
+
+@router.get("/movements")
+async def stream_movements(
+    request: Request,
+    warehouse_id: Optional[int] = None,
+    material_id: Optional[int] = None,
+):
+    """Потік рухів по складу (Server-Sent Events), з фільтрами по складу/матеріалу"""
+    if not settings.LIVE_FEED_ENABLED:
+        raise HTTPException(status_code=503, detail="Live feed is disabled")
+
+    sub = hub.subscribe(warehouse_id=warehouse_id, material_id=material_id)
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    evt = await asyncio.wait_for(sub.queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {evt['id']}\nevent: movement\ndata: {json.dumps(evt)}\n\n"
+        finally:
+            hub.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
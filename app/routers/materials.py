@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, File, UploadFile
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
@@ -6,6 +6,7 @@ from ..db import get_db
 from ..models import Material
 from ..schemas import MaterialCreate, MaterialUpdate, MaterialResponse
 from ..auth import require_role
+from ..bulk_import import import_file
 
 router = APIRouter(prefix="/api/materials", tags=["Materials"])
 
@@ -40,6 +41,17 @@ def create_material(
         raise HTTPException(status_code=400, detail=str(e))
     return material
 
+@router.post("/import")
+def import_materials(
+    file: UploadFile = File(...),
+    dry_run: bool = Query(False, description="Перевірити файл і порахувати зміни без збереження"),
+    db: Session = Depends(get_db),
+    _: dict = Depends(require_role("storekeeper"))
+):
+    """Масовий імпорт матеріалів з CSV/XLSX (storekeeper); повертає звіт з помилками по рядках"""
+    return import_file(db, "materials", file, dry_run=dry_run)
+
+
 @router.put("/{id}", response_model=MaterialResponse)
 def update_material(
     id: int,
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from ..auth import require_role
+from ..profiler import list_profiles, get_profile, clear_profiles
+
+router = APIRouter(prefix="/api/admin/profiler", tags=["Admin"])
+
+
+@router.get("")
+def list_sql_profiles(
+    limit: int = Query(50, ge=1, le=1000),
+    _: dict = Depends(require_role("admin"))
+):
+    """Останні профілі запитів (найновіші першими)"""
+    return list_profiles(limit)
+
+
+@router.get("/{id}")
+def get_sql_profile(id: int, _: dict = Depends(require_role("admin"))):
+    """Усі SQL-запити профілю, N+1 та плани повільних запитів"""
+    profile = get_profile(id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+
+@router.delete("", status_code=204)
+def clear_sql_profiles(_: dict = Depends(require_role("admin"))):
+    clear_profiles()
+    return None
@@ -1,13 +1,16 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
-from sqlalchemy.orm import Session, joinedload
-from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from decimal import Decimal
 from typing import List
 
-from ..db import get_db
-from ..models import Receipt, ReceiptItem, StockCurrent, StockLedger, StockMovementType
+from ..db import get_db, get_async_db
+from ..models import Receipt, ReceiptItem, StockLedger, StockMovementType
 from ..schemas import ReceiptCreate, ReceiptResponse
 from ..auth import require_role, get_current_user
-from ..utils import to_decimal
+from ..utils import qty_units, money_units, line_total_units, qty_decimal, money_decimal
+from ..stock_service import apply_movements, receive_stock
+from ..costing import post_costs, to_uah_units
 
 router = APIRouter(prefix="/api/receipts", tags=["Receipts"])
 
@@ -19,7 +22,7 @@ def list_receipts(
     db: Session = Depends(get_db)
 ):
     """Отримати список надходжень"""
-    receipts = db.query(Receipt).offset(skip).limit(limit).all()
+    receipts = db.query(Receipt).options(selectinload(Receipt.items)).offset(skip).limit(limit).all()
     return receipts
 
 
@@ -45,12 +48,12 @@ def create_receipt(
         db.add(receipt)
         db.flush()
 
-        total_amount = Decimal("0.00")
+        total_units = 0
+        lines = [(i, qty_units(i.qty), money_units(i.unit_price)) for i in data.items]
 
-        for item_data in data.items:
-            qty = to_decimal(item_data.qty, "0.0001")
-            unit_price = to_decimal(item_data.unit_price, "0.01")
-            line_total = (qty * unit_price).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        for item_data, qty_u, price_u in lines:
+            line_u = line_total_units(qty_u, price_u)
+            qty, unit_price, line_total = qty_decimal(qty_u), money_decimal(price_u), money_decimal(line_u)
 
             item = ReceiptItem(
                 receipt_id=receipt.id,
@@ -64,7 +67,7 @@ def create_receipt(
                 notes=item_data.notes
             )
             db.add(item)
-            total_amount += line_total
+            total_units += line_u
 
             # Stock ledger entry
             ledger = StockLedger(
@@ -81,24 +84,13 @@ def create_receipt(
             )
             db.add(ledger)
 
-            # Update stock_current
-            stock = db.query(StockCurrent).filter_by(
-                warehouse_id=item_data.warehouse_id,
-                material_id=item_data.material_id
-            ).with_for_update().first()
-
-            if stock:
-                stock.quantity = (stock.quantity + qty).quantize(Decimal("0.0001"), rounding=ROUND_HALF_UP)
-            else:
-                stock = StockCurrent(
-                    warehouse_id=item_data.warehouse_id,
-                    material_id=item_data.material_id,
-                    quantity=qty,
-                    reserved_quantity=Decimal("0.0000")
-                )
-                db.add(stock)
-
-        receipt.total_amount = total_amount
+        # Update stock_current — одним запитом (гарячі SKU — через журнал дельт)
+        # гарячі SKU не блокують ні stock_current, ні stock_costs: собівартість проведе folder
+        post_costs(db, receive_stock(db, [
+            (i.warehouse_id, i.material_id, q, to_uah_units(line_total_units(q, p), i.currency)) for i, q, p in lines
+        ]))
+
+        receipt.total_amount = money_decimal(total_units)
         db.commit()
         db.refresh(receipt)
         return receipt
@@ -123,18 +115,29 @@ def get_receipt(id: int, db: Session = Depends(get_db)):
 @router.put("/{id}", response_model=ReceiptResponse)
 def update_receipt(id: int, data: ReceiptCreate, db: Session = Depends(get_db), _: dict = Depends(require_role("storekeeper"))):
     """Повне редагування: шапка + items. Перераховуємо total і робимо Δ до складу/журналу."""
-    rec = db.query(Receipt).options(joinedload(Receipt.items)).filter(Receipt.id == id).first()
+    # лок документа до читання позицій: паралельні редагування/видалення не відкочують їх двічі
+    # (selectinload — окремим запитом після локу; FOR UPDATE з LEFT JOIN у Postgres не працює)
+    rec = db.query(Receipt).options(selectinload(Receipt.items)).filter(Receipt.id == id).with_for_update().first()
     if not rec:
         raise HTTPException(status_code=404, detail="Receipt not found")
     if not data.items:
         raise HTTPException(status_code=400, detail="No items provided")
 
     try:
-        # 1) повертаємо старі позиції назад на склад (відкочуємо)
+        # 1) нетто-зміна складу (нові мінус старі); не можна зняти те, що вже видано
+        lines = [(it, qty_units(it.qty), money_units(it.unit_price)) for it in data.items]
+        apply_movements(db, [(old.warehouse_id, old.material_id, -qty_units(old.qty)) for old in rec.items] + [
+            (it.warehouse_id, it.material_id, q) for it, q, _ in lines
+        ])
+        post_costs(db, [
+            (old.warehouse_id, old.material_id, -qty_units(old.qty), -to_uah_units(money_units(old.total_price), old.currency))
+            for old in rec.items
+        ] + [
+            (it.warehouse_id, it.material_id, q, to_uah_units(line_total_units(q, p), it.currency)) for it, q, p in lines
+        ])
+
+        # відкочуємо старі позиції в журналі
         for old in rec.items:
-            stock = db.query(StockCurrent).filter_by(warehouse_id=old.warehouse_id, material_id=old.material_id).with_for_update().first()
-            if stock:
-                stock.quantity = (stock.quantity - old.qty).quantize(Decimal("0.0001"), rounding=ROUND_HALF_UP)
             db.add(StockLedger(
                 warehouse_id=old.warehouse_id, material_id=old.material_id,
                 movement_type=StockMovementType.adjustment,  # фіксуємо як технічне коригування
@@ -144,27 +147,22 @@ def update_receipt(id: int, data: ReceiptCreate, db: Session = Depends(get_db),
             ))
         rec.items.clear(); db.flush()
 
-        # 2) заповнюємо новими позиціями і знову додаємо на склад
+        # 2) заповнюємо новими позиціями
         rec.document_number = data.document_number
         rec.supplier_id = data.supplier_id
         rec.currency = data.currency
         rec.notes = data.notes
-        rec.total_amount = Decimal("0.00")
+        total_units = 0
 
-        for it in data.items:
-            qty = to_decimal(it.qty, "0.0001")
-            up  = to_decimal(it.unit_price, "0.01")
-            line = (qty * up).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        for it, qty_u, price_u in lines:
+            line_u = line_total_units(qty_u, price_u)
+            qty, up, line = qty_decimal(qty_u), money_decimal(price_u), money_decimal(line_u)
 
             db.add(ReceiptItem(
                 receipt_id=rec.id, material_id=it.material_id, warehouse_id=it.warehouse_id,
                 qty=qty, unit_price=up, currency=it.currency, total_price=line, weight=it.weight, notes=it.notes
             ))
-            rec.total_amount += line
-
-            stock = db.query(StockCurrent).filter_by(warehouse_id=it.warehouse_id, material_id=it.material_id).with_for_update().first()
-            if stock: stock.quantity = (stock.quantity + qty).quantize(Decimal("0.0001"), rounding=ROUND_HALF_UP)
-            else: db.add(StockCurrent(warehouse_id=it.warehouse_id, material_id=it.material_id, quantity=qty, reserved_quantity=Decimal("0.0000")))
+            total_units += line_u
 
             db.add(StockLedger(
                 warehouse_id=it.warehouse_id, material_id=it.material_id,
@@ -172,6 +170,7 @@ def update_receipt(id: int, data: ReceiptCreate, db: Session = Depends(get_db),
                 total_price=line, reference_doc_type="ReceiptEdit", reference_doc_id=rec.id,
                 remarks="Apply new items after edit"
             ))
+        rec.total_amount = money_decimal(total_units)
         db.commit(); db.refresh(rec)
         return rec
     except:
@@ -179,13 +178,19 @@ def update_receipt(id: int, data: ReceiptCreate, db: Session = Depends(get_db),
 
 @router.delete("/{id}", status_code=204)
 def delete_receipt(id: int, db: Session = Depends(get_db), _: dict = Depends(require_role("admin"))):
-    rec = db.query(Receipt).options(joinedload(Receipt.items)).filter(Receipt.id == id).first()
+    rec = db.query(Receipt).options(selectinload(Receipt.items)).filter(Receipt.id == id).with_for_update().first()
     if not rec:
         raise HTTPException(status_code=404, detail="Receipt not found")
+    try:
+        apply_movements(db, [(it.warehouse_id, it.material_id, -qty_units(it.qty)) for it in rec.items])
+        post_costs(db, [
+            (it.warehouse_id, it.material_id, -qty_units(it.qty), -to_uah_units(money_units(it.total_price), it.currency))
+            for it in rec.items
+        ])
+    except HTTPException:
+        db.rollback()
+        raise
     for it in rec.items:
-        stock = db.query(StockCurrent).filter_by(warehouse_id=it.warehouse_id, material_id=it.material_id).with_for_update().first()
-        if stock:
-            stock.quantity = (stock.quantity - it.qty).quantize(Decimal("0.0001"), rounding=ROUND_HALF_UP)
         db.add(StockLedger(
             warehouse_id=it.warehouse_id, material_id=it.material_id,
             movement_type=StockMovementType.adjustment, qty_change=-it.qty,
@@ -193,4 +198,38 @@ def delete_receipt(id: int, db: Session = Depends(get_db), _: dict = Depends(req
             reference_doc_type="ReceiptDelete", reference_doc_id=rec.id, remarks="Delete receipt"
         ))
     db.delete(rec); db.commit()
-    return None
\ No newline at end of file
+    return None
+
+
+
+# ---------- async variants (ASYNC_DB_ENABLED) ----------
+# Відповідь серіалізуємо всередині run_sync: lazy-load поза greenlet неможливий.
+async_router = APIRouter(prefix="/api/receipts", tags=["Receipts"])
+
+
+@async_router.get("", response_model=List[ReceiptResponse])
+async def list_receipts_async(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await db.run_sync(
+        lambda s: [ReceiptResponse.model_validate(r) for r in list_receipts(skip, limit, db=s)]
+    )
+
+
+@async_router.post("", response_model=ReceiptResponse, status_code=201)
+async def create_receipt_async(
+    data: ReceiptCreate,
+    db: AsyncSession = Depends(get_async_db),
+    user: dict = Depends(get_current_user),
+    _: dict = Depends(require_role("storekeeper"))
+):
+    return await db.run_sync(
+        lambda s: ReceiptResponse.model_validate(create_receipt(data, db=s, user=user, _=_))
+    )
+
+
+@async_router.get("/{id}", response_model=ReceiptResponse)
+async def get_receipt_async(id: int, db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(lambda s: ReceiptResponse.model_validate(get_receipt(id, db=s)))
@@ -1,12 +1,15 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel, Field
-from decimal import Decimal, ROUND_HALF_UP
+from decimal import Decimal
 from ..models import StockCurrent, StockLedger, StockMovementType, Warehouse, Material
-from ..utils import to_decimal
+from ..utils import qty_units, money_units, line_total_units, qty_decimal, money_decimal
+from ..stock_service import apply_movements, current_quantity
+from ..costing import post_costs, to_uah_units
 from ..auth import require_role
-from ..db import get_db
+from ..db import get_db, get_read_db, get_async_db
 
 router = APIRouter(prefix="/api/stock", tags=["Stock & Reports"])
 
@@ -17,16 +20,17 @@ def get_current_stock(
     material_id: Optional[int] = None,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Поточні залишки на складах з іменами"""
     query = db.query(
         StockCurrent.id,
         StockCurrent.warehouse_id,
         StockCurrent.material_id,
-        StockCurrent.quantity,
+        current_quantity().label("quantity"),
         StockCurrent.reserved_quantity,
         StockCurrent.last_updated,
+        StockCurrent.last_movement_at,
         Warehouse.name.label("warehouse_name"),
         Material.code.label("material_code"),
         Material.name.label("material_name"),
@@ -48,6 +52,7 @@ def get_current_stock(
             "quantity": str(r.quantity),
             "reserved_quantity": str(r.reserved_quantity),
             "last_updated": r.last_updated,
+            "last_movement_at": r.last_movement_at,
             "warehouse_name": r.warehouse_name,
             "material_code": r.material_code,
             "material_name": r.material_name,
@@ -57,38 +62,44 @@ def get_current_stock(
 
 
 @router.get("/low-stock")
-def get_low_stock(db: Session = Depends(get_db)):
+def get_low_stock(
+    warehouse_id: Optional[int] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_read_db)
+):
     """Матеріали з низькими запасами (нижче min_stock)"""
-    query = """
-        SELECT 
-            m.id as material_id,
-            m.code,
-            m.name,
-            m.min_stock,
-            sc.warehouse_id,
-            w.name as warehouse_name,
-            sc.quantity,
-            (sc.quantity - sc.reserved_quantity) as available
-        FROM materials m
-        JOIN stock_current sc ON m.id = sc.material_id
-        LEFT JOIN warehouses w ON sc.warehouse_id = w.id
-        WHERE (sc.quantity - sc.reserved_quantity) < m.min_stock
-        ORDER BY available ASC
-    """
-    result = db.execute(query).fetchall()
-    
+    available = (StockCurrent.quantity - StockCurrent.reserved_quantity).label("available")
+    query = db.query(
+        Material.id.label("material_id"),
+        Material.code,
+        Material.name,
+        Material.min_stock,
+        StockCurrent.warehouse_id,
+        Warehouse.name.label("warehouse_name"),
+        StockCurrent.quantity,
+        available,
+    ).join(Material, StockCurrent.material_id == Material.id)\
+     .join(Warehouse, StockCurrent.warehouse_id == Warehouse.id, isouter=True)\
+     .filter(StockCurrent.below_min)
+
+    if warehouse_id:
+        query = query.filter(StockCurrent.warehouse_id == warehouse_id)
+
+    rows = query.order_by(available.asc(), StockCurrent.id).offset(skip).limit(limit).all()
+
     return [
         {
-            "material_id": row[0],
-            "code": row[1],
-            "name": row[2],
-            "min_stock": float(row[3]),
-            "warehouse_id": row[4],
-            "warehouse_name": row[5],
-            "quantity": float(row[6]),
-            "available": float(row[7])
+            "material_id": r.material_id,
+            "code": r.code,
+            "name": r.name,
+            "min_stock": float(r.min_stock),
+            "warehouse_id": r.warehouse_id,
+            "warehouse_name": r.warehouse_name,
+            "quantity": float(r.quantity),
+            "available": float(r.available)
         }
-        for row in result
+        for r in rows
     ]
 
 class StockAdjustBody(BaseModel):
@@ -105,32 +116,26 @@ def adjust_stock(
     db: Session = Depends(get_db),
     _: dict = Depends(require_role("storekeeper"))
 ):
-    stock = db.query(StockCurrent).filter_by(
-        warehouse_id=body.warehouse_id,
-        material_id=body.material_id
-    ).with_for_update().first()
-
-    if not stock:
-        stock = StockCurrent(
-            warehouse_id=body.warehouse_id,
-            material_id=body.material_id,
-            quantity=Decimal("0"),
-            reserved_quantity=Decimal("0"),
-        )
-        db.add(stock)
-        db.flush()
-
-    qty_delta = to_decimal(body.qty_delta, "0.0001")
-    stock.quantity = (stock.quantity + qty_delta).quantize(Decimal("0.0001"), rounding=ROUND_HALF_UP)
+    qty_u = qty_units(body.qty_delta)
+    price_u = money_units(body.unit_price) if body.unit_price is not None else None
+    # від'ємне коригування не може зробити доступний залишок від'ємним
+    try:
+        apply_movements(db, [(body.warehouse_id, body.material_id, qty_u)])
+        # надходження з ціною — за нею, решта — за поточною середньою собівартістю
+        value_u = to_uah_units(line_total_units(qty_u, price_u), body.currency) if price_u is not None and qty_u > 0 else None
+        post_costs(db, [(body.warehouse_id, body.material_id, qty_u, value_u)])
+    except HTTPException:
+        db.rollback()
+        raise
 
     ledger = StockLedger(
         warehouse_id=body.warehouse_id,
         material_id=body.material_id,
         movement_type=StockMovementType.adjustment,
-        qty_change=qty_delta,
-        unit_price=body.unit_price,
+        qty_change=qty_decimal(qty_u),
+        unit_price=money_decimal(price_u) if price_u is not None else None,
         currency=body.currency,
-        total_price=(qty_delta * (body.unit_price or Decimal("0"))).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP) if body.unit_price else None,
+        total_price=money_decimal(line_total_units(qty_u, price_u)) if price_u else None,
         reference_doc_type="Adjustment",
         reference_doc_id=None,
         remarks=body.remarks or "Manual adjustment"
@@ -144,19 +149,20 @@ def adjust_stock(
 @router.get("/available-materials")
 def get_available_materials(
     warehouse_id: Optional[int] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Отримати матеріали доступні на складі (з qty > 0)"""
+    quantity = current_quantity()
     query = db.query(
         Material.id,
         Material.code,
         Material.name,
         Material.unit,
         StockCurrent.warehouse_id,
-        StockCurrent.quantity,
+        quantity.label("quantity"),
         StockCurrent.reserved_quantity,
     ).join(StockCurrent, Material.id == StockCurrent.material_id)\
-     .filter(StockCurrent.quantity > 0)
+     .filter(quantity > 0)
     
     if warehouse_id:
         query = query.filter(StockCurrent.warehouse_id == warehouse_id)
@@ -175,4 +181,39 @@ def get_available_materials(
             "available": str(r.quantity - r.reserved_quantity),
         }
         for r in rows
-    ]
\ No newline at end of file
+    ]
+
+
+# ---------- async variants (ASYNC_DB_ENABLED) ----------
+# Ті самі обробники, але через AsyncSession.run_sync: I/O йде через asyncpg без потоку на запит.
+async_router = APIRouter(prefix="/api/stock", tags=["Stock & Reports"])
+
+
+@async_router.get("/current")
+async def get_current_stock_async(
+    warehouse_id: Optional[int] = None,
+    material_id: Optional[int] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await db.run_sync(lambda s: get_current_stock(warehouse_id, material_id, skip, limit, db=s))
+
+
+@async_router.get("/low-stock")
+async def get_low_stock_async(
+    warehouse_id: Optional[int] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await db.run_sync(lambda s: get_low_stock(warehouse_id, skip, limit, db=s))
+
+
+@async_router.post("/adjust")
+async def adjust_stock_async(
+    body: StockAdjustBody,
+    db: AsyncSession = Depends(get_async_db),
+    _: dict = Depends(require_role("storekeeper"))
+):
+    return await db.run_sync(lambda s: adjust_stock(body, db=s, _=_))
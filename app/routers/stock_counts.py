@@ -0,0 +1,173 @@
+from fastapi import APIRouter, HTTPException, Depends, Query, File, UploadFile
+from sqlalchemy.orm import Session
+from typing import List, Optional
+
+from ..db import get_db
+from ..models import StockCount, Warehouse
+from ..schemas import StockCountCreate, StockCountBatch, StockCountResponse
+from ..auth import require_role
+from .. import stock_count
+
+router = APIRouter(prefix="/api/stock-counts", tags=["Stock counts"])
+
+
+def _get_count(db: Session, id: int) -> StockCount:
+    count = db.query(StockCount).filter(StockCount.id == id).first()
+    if not count:
+        raise HTTPException(status_code=404, detail="Stock count not found")
+    return count
+
+
+def _with_summary(db: Session, count: StockCount) -> dict:
+    out = StockCountResponse.model_validate(count).model_dump()
+    out["summary"] = stock_count.summary(db, count.id)
+    return out
+
+
+@router.post("", status_code=201)
+def create_stock_count(
+    data: StockCountCreate,
+    db: Session = Depends(get_db),
+    user: dict = Depends(require_role("storekeeper"))
+):
+    """Почати інвентаризацію: зафіксувати очікувані залишки складу (або категорії)"""
+    if not db.query(Warehouse.id).filter(Warehouse.id == data.warehouse_id).first():
+        raise HTTPException(status_code=404, detail="Warehouse not found")
+    count = StockCount(**data.model_dump(), status=stock_count.OPEN, created_by=user.get("sub"))
+    db.add(count)
+    try:
+        db.flush()
+        stock_count.freeze(db, count)
+        db.commit()
+        db.refresh(count)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    return _with_summary(db, count)
+
+
+@router.get("", response_model=List[StockCountResponse])
+def list_stock_counts(
+    warehouse_id: Optional[int] = None,
+    status: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    query = db.query(StockCount)
+    if warehouse_id:
+        query = query.filter(StockCount.warehouse_id == warehouse_id)
+    if status:
+        query = query.filter(StockCount.status == status)
+    return query.order_by(StockCount.id.desc()).offset(skip).limit(limit).all()
+
+
+@router.get("/{id}")
+def get_stock_count(id: int, db: Session = Depends(get_db)):
+    """Сесія інвентаризації з підсумками: рядків, підраховано, з розбіжністю"""
+    return _with_summary(db, _get_count(db, id))
+
+
+@router.post("/{id}/counts")
+def record_counts(
+    id: int,
+    data: StockCountBatch,
+    db: Session = Depends(get_db),
+    _: dict = Depends(require_role("storekeeper"))
+):
+    """Пакет підрахунків зі сканера: set — перезаписати кількість, add — додати до підрахованого"""
+    items = [(i, item.material_id, item.code, item.qty) for i, item in enumerate(data.items)]
+    try:
+        report = stock_count.record_counts(db, id, items, add=data.mode == "add")
+        db.commit()
+    except HTTPException:
+        db.rollback()
+        raise
+    return report
+
+
+@router.post("/{id}/counts/file")
+def record_counts_file(
+    id: int,
+    file: UploadFile = File(...),
+    mode: str = Query("set", pattern="^(set|add)$"),
+    db: Session = Depends(get_db),
+    _: dict = Depends(require_role("storekeeper"))
+):
+    """Підрахунки з CSV/XLSX: колонки code або material_id, і qty; помилки — по номерах рядків файлу"""
+    items = stock_count.items_from_file(file)
+    try:
+        report = stock_count.record_counts(db, id, items, add=mode == "add")
+        db.commit()
+    except HTTPException:
+        db.rollback()
+        raise
+    return report
+
+
+@router.get("/{id}/variances")
+def get_variances(
+    id: int,
+    zero_uncounted: bool = Query(False, description="непідраховані рядки вважати нулем (повна інвентаризація)"),
+    only_diff: bool = True,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=5000),
+    db: Session = Depends(get_db)
+):
+    """Розбіжності (підраховано - очікувано) з вартістю за середньою собівартістю, найбільші першими"""
+    count = _get_count(db, id)
+    rows = stock_count.variances(db, count, zero_uncounted, only_diff, skip, limit)
+    return {
+        "total": rows[0].total if rows else 0,
+        "items": [
+            {
+                "material_id": r.material_id,
+                "code": r.code,
+                "name": r.name,
+                "unit": r.unit,
+                "expected_qty": r.expected_qty,
+                "counted_qty": r.counted_qty,
+                "variance": r.variance,
+                "avg_cost": r.avg_cost,
+                "variance_value": r.variance_value,
+                "posted_qty": r.posted_qty,
+            }
+            for r in rows
+        ],
+    }
+
+
+@router.post("/{id}/apply")
+def apply_stock_count(
+    id: int,
+    zero_uncounted: bool = Query(False, description="непідраховані рядки вважати нулем (повна інвентаризація)"),
+    db: Session = Depends(get_db),
+    _: dict = Depends(require_role("storekeeper"))
+):
+    """Провести всі розбіжності однією транзакцією: коригування залишків, собівартості і журналу"""
+    count = _get_count(db, id)
+    try:
+        result = stock_count.apply_count(db, count, zero_uncounted)
+        db.commit()
+    except HTTPException:
+        db.rollback()
+        raise
+    return {"id": id, "status": stock_count.APPLIED, **result}
+
+
+@router.post("/{id}/cancel", response_model=StockCountResponse)
+def cancel_stock_count(
+    id: int,
+    db: Session = Depends(get_db),
+    _: dict = Depends(require_role("storekeeper"))
+):
+    """Скасувати відкриту інвентаризацію без змін залишків"""
+    count = db.query(StockCount).filter(StockCount.id == id).with_for_update().first()
+    if not count:
+        raise HTTPException(status_code=404, detail="Stock count not found")
+    if count.status != stock_count.OPEN:
+        raise HTTPException(status_code=409, detail=f"Stock count is {count.status}")
+    count.status = stock_count.CANCELLED
+    db.commit()
+    db.refresh(count)
+    return count
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, Query, HTTPException
+from sqlalchemy import lambda_stmt, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 
-from app.db import get_db
+from app.db import get_read_db, get_async_db
 from app.models import StockLedger, StockMovementType
 
 router = APIRouter(prefix="/api/stock-ledger", tags=["Stock Ledger"])
@@ -17,22 +19,23 @@ def list_ledger(
     date_to: Optional[datetime] = Query(None),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    q = db.query(StockLedger)
+    # lambda_stmt: конструкція і компіляція кешуються за набором фільтрів, значення — bound params
+    stmt = lambda_stmt(lambda: select(StockLedger))
     if warehouse_id:
-        q = q.filter(StockLedger.warehouse_id == warehouse_id)
+        stmt += lambda s: s.where(StockLedger.warehouse_id == warehouse_id)
     if material_id:
-        q = q.filter(StockLedger.material_id == material_id)
+        stmt += lambda s: s.where(StockLedger.material_id == material_id)
     if movement_type:
-        q = q.filter(StockLedger.movement_type == movement_type)
+        stmt += lambda s: s.where(StockLedger.movement_type == movement_type)
     if date_from:
-        q = q.filter(StockLedger.date_time >= date_from)
+        stmt += lambda s: s.where(StockLedger.date_time >= date_from)
     if date_to:
-        q = q.filter(StockLedger.date_time <= date_to)
+        stmt += lambda s: s.where(StockLedger.date_time <= date_to)
+    stmt += lambda s: s.order_by(StockLedger.date_time.desc()).offset(skip).limit(limit)
 
-    q = q.order_by(StockLedger.date_time.desc())
-    rows = q.offset(skip).limit(limit).all()
+    rows = db.execute(stmt).scalars().all()
     return [
         {
             "id": r.id,
@@ -49,3 +52,21 @@ def list_ledger(
             "remarks": r.remarks,
         } for r in rows
     ]
+
+
+async_router = APIRouter(prefix="/api/stock-ledger", tags=["Stock Ledger"])
+
+@async_router.get("")
+async def list_ledger_async(
+    warehouse_id: Optional[int] = None,
+    material_id: Optional[int] = None,
+    movement_type: Optional[StockMovementType] = None,
+    date_from: Optional[datetime] = Query(None),
+    date_to: Optional[datetime] = Query(None),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(lambda s: list_ledger(
+        warehouse_id, material_id, movement_type, date_from, date_to, skip, limit, db=s
+    ))
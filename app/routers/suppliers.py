@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, File, UploadFile
 from sqlalchemy.orm import Session
 from typing import List
 
@@ -6,6 +6,7 @@ from ..db import get_db
 from ..models import Supplier
 from ..schemas import SupplierCreate, SupplierUpdate, SupplierResponse
 from ..auth import require_role
+from ..bulk_import import import_file
 
 router = APIRouter(prefix="/api/suppliers", tags=["Suppliers"])
 
@@ -38,6 +39,17 @@ def create_supplier(
     return supplier
 
 
+@router.post("/import")
+def import_suppliers(
+    file: UploadFile = File(...),
+    dry_run: bool = Query(False, description="Перевірити файл і порахувати зміни без збереження"),
+    db: Session = Depends(get_db),
+    _: dict = Depends(require_role("admin"))
+):
+    """Масовий імпорт постачальників з CSV/XLSX (тільки admin); повертає звіт з помилками по рядках"""
+    return import_file(db, "suppliers", file, dry_run=dry_run)
+
+
 @router.get("/{id}", response_model=SupplierResponse)
 def get_supplier(id: int, db: Session = Depends(get_db)):
     """Отримати постачальника за ID"""
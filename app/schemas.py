@@ -176,6 +176,7 @@ class IssueItemResponse(BaseModel):
     total_price: Decimal
     weight: Optional[Decimal] = None
     notes: Optional[str] = None
+    cogs: Optional[Decimal] = None
     
     model_config = ConfigDict(from_attributes=True)
 
@@ -207,6 +208,7 @@ class StockCurrentResponse(BaseModel):
     quantity: Decimal
     reserved_quantity: Decimal
     last_updated: datetime
+    last_movement_at: Optional[datetime] = None
     
     model_config = ConfigDict(from_attributes=True)
     
@@ -215,4 +217,56 @@ class IssueUpdate(BaseModel):
     client_id: Optional[int] = None
     currency: Optional[str] = Field(None, max_length=3)
     notes: Optional[str] = None
-    items: Optional[list[IssueItemCreate]] = None
\ No newline at end of file
+    items: Optional[list[IssueItemCreate]] = None
+
+class JobSubmit(BaseModel):
+    type: str = Field(..., max_length=64)
+    params: dict = Field(default_factory=dict)
+
+class JobResponse(BaseModel):
+    id: int
+    job_type: str
+    status: str
+    params: dict
+    progress_done: int
+    progress_total: Optional[int] = None
+    message: Optional[str] = None
+    error: Optional[str] = None
+    cancel_requested: bool
+    input_filename: Optional[str] = None
+    result_filename: Optional[str] = None
+    result_content_type: Optional[str] = None
+    created_by: Optional[str] = None
+    worker: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    heartbeat_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class StockCountCreate(BaseModel):
+    warehouse_id: int
+    category_id: Optional[int] = None
+    notes: Optional[str] = None
+
+class StockCountItem(BaseModel):
+    material_id: Optional[int] = None
+    code: Optional[str] = Field(None, max_length=64)
+    qty: Decimal
+
+class StockCountBatch(BaseModel):
+    mode: str = Field(default="set", pattern="^(set|add)$", description="set — перезаписати, add — додати (скани)")
+    items: list[StockCountItem]
+
+class StockCountResponse(BaseModel):
+    id: int
+    warehouse_id: int
+    category_id: Optional[int] = None
+    status: str
+    notes: Optional[str] = None
+    created_by: Optional[str] = None
+    created_at: datetime
+    applied_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,310 @@
+"""
+Інвентаризація (stock take): сесії підрахунку з пакетним проведенням різниць.
+
+freeze() stores the expected quantity of every stock_current row in the
+warehouse (plus pending journal deltas, optionally one category only) in
+a single INSERT ... SELECT. Counted quantities then arrive in batches
+from a scanner or a CSV/XLSX file. Each batch is one upsert into
+stock_count_lines. In "set" mode a recount overwrites the quantity, and
+retries are idempotent. In "add" mode every scan adds to the counted
+quantity. In a category-scoped session, materials from other
+categories are rejected. Any other material outside the snapshot (its
+stock_current row appeared after the freeze) gets expected = its stock
+plus pending deltas when first counted, not 0.
+
+apply_count() works in one transaction:
+- a single UPDATE ... RETURNING computes and stores every variance
+  (posted_qty = counted - expected)
+- the variances go through apply_movements() and post_costs() as one
+  batch. Surpluses come in at the current average cost, shortages leave
+  at it
+- the ledger gets one adjustment row per material, with reference
+  StockCount/<id>
+
+The variance is posted as a delta, not as "set stock to counted". Stock
+moved between freeze and apply is therefore kept. Count right after
+freezing, or keep the counted area still until apply.
+"""
+from decimal import InvalidOperation
+from typing import Iterable
+
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import text
+from sqlalchemy.sql import func
+from sqlalchemy.orm import Session
+
+from .bulk_import import read_rows
+from .costing import post_costs
+from .models import StockCount, StockLedger, StockMovementType
+from .stock_service import apply_movements
+from .utils import div_half_up, money_decimal, qty_decimal, qty_units, QTY_SCALE
+
+OPEN, APPLIED, CANCELLED = "open", "applied", "cancelled"
+MAX_REPORTED_ERRORS = 1000
+
+_FREEZE_SQL = text("""
+    INSERT INTO stock_count_lines (count_id, material_id, expected_qty)
+    SELECT :count_id, sc.material_id, sc.quantity + COALESCE(d.pending, 0)
+    FROM stock_current sc
+    JOIN materials m ON m.id = sc.material_id
+    LEFT JOIN (
+        SELECT material_id, SUM(delta) AS pending
+        FROM stock_deltas WHERE warehouse_id = :warehouse_id
+        GROUP BY material_id
+    ) d ON d.material_id = sc.material_id
+    WHERE sc.warehouse_id = :warehouse_id
+      AND (CAST(:category_id AS integer) IS NULL OR m.category_id = :category_id)
+""")
+
+# FOR SHARE: пакети підрахунку йдуть паралельно, а apply (FOR UPDATE) чекає на них і навпаки
+_SESSION_SHARE_SQL = text("SELECT status, warehouse_id, category_id FROM stock_counts WHERE id = :id FOR SHARE")
+
+_RESOLVE_SQL = text("""
+    SELECT id, code, category_id FROM materials
+    WHERE id = ANY(CAST(:ids AS integer[])) OR code = ANY(CAST(:codes AS varchar[]))
+""")
+
+_RECORD_SQL = text("""
+    INSERT INTO stock_count_lines AS l (count_id, material_id, expected_qty, counted_qty, counted_at)
+    SELECT :count_id, c.material_id,
+           -- рядок поза знімком: очікуване — поточний залишок з дельтами, а не 0
+           COALESCE(sc.quantity, 0) + COALESCE((
+               SELECT SUM(d.delta) FROM stock_deltas d
+               WHERE d.warehouse_id = :warehouse_id AND d.material_id = c.material_id
+           ), 0),
+           c.qty, now()
+    FROM unnest(CAST(:material_ids AS integer[]), CAST(:qtys AS numeric[])) AS c(material_id, qty)
+    LEFT JOIN stock_current sc ON sc.warehouse_id = :warehouse_id AND sc.material_id = c.material_id
+    -- від'ємне add без рядка не вставляємо; з рядком — перевіряє WHERE нижче
+    WHERE c.qty >= 0 OR EXISTS (
+        SELECT 1 FROM stock_count_lines x WHERE x.count_id = :count_id AND x.material_id = c.material_id
+    )
+    ORDER BY c.material_id
+    ON CONFLICT (count_id, material_id) DO UPDATE
+    SET counted_qty = CASE WHEN :add THEN COALESCE(l.counted_qty, 0) + EXCLUDED.counted_qty
+                           ELSE EXCLUDED.counted_qty END,
+        counted_at = now()
+    WHERE NOT :add OR COALESCE(l.counted_qty, 0) + EXCLUDED.counted_qty >= 0
+    RETURNING material_id
+""")
+
+_SUMMARY_SQL = text("""
+    SELECT count(*) AS lines,
+           count(counted_qty) AS counted,
+           count(*) FILTER (WHERE counted_qty IS NOT NULL AND counted_qty <> expected_qty) AS with_variance,
+           COALESCE(SUM(counted_qty - expected_qty) FILTER (WHERE counted_qty > expected_qty), 0) AS surplus_qty,
+           COALESCE(-SUM(counted_qty - expected_qty) FILTER (WHERE counted_qty < expected_qty), 0) AS shortage_qty
+    FROM stock_count_lines WHERE count_id = :count_id
+""")
+
+_VARIANCE_SQL = text("""
+    WITH v AS (
+        SELECT l.material_id, l.expected_qty, l.counted_qty, l.posted_qty,
+               COALESCE(l.counted_qty, 0) - l.expected_qty AS variance
+        FROM stock_count_lines l
+        WHERE l.count_id = :count_id
+          AND (l.counted_qty IS NOT NULL OR :zero_uncounted)
+    )
+    SELECT v.*, m.code, m.name, m.unit,
+           c.avg_cost, ROUND(v.variance * COALESCE(c.avg_cost, 0), 2) AS variance_value,
+           COUNT(*) OVER () AS total
+    FROM v
+    JOIN materials m ON m.id = v.material_id
+    LEFT JOIN stock_costs c ON c.warehouse_id = :warehouse_id AND c.material_id = v.material_id
+    WHERE NOT :only_diff OR v.variance <> 0
+    ORDER BY abs(v.variance * COALESCE(c.avg_cost, 0)) DESC, abs(v.variance) DESC, v.material_id
+    OFFSET :skip LIMIT :limit
+""")
+
+_LOCK_SESSION_SQL = text("SELECT status FROM stock_counts WHERE id = :id FOR UPDATE")
+
+# усі різниці сесії одним запитом; той самий запит фіксує проведену кількість
+_POST_VARIANCES_SQL = text("""
+    UPDATE stock_count_lines
+    SET posted_qty = COALESCE(counted_qty, 0) - expected_qty
+    WHERE count_id = :count_id
+      AND (counted_qty IS NOT NULL OR :zero_uncounted)
+    RETURNING material_id, posted_qty
+""")
+
+
+def freeze(db: Session, count: StockCount) -> int:
+    """Зафіксувати очікувані залишки для нової сесії; повертає кількість рядків."""
+    return db.execute(_FREEZE_SQL, {
+        "count_id": count.id, "warehouse_id": count.warehouse_id, "category_id": count.category_id,
+    }).rowcount
+
+
+def _lock_open(db: Session, count_id: int, sql):
+    row = db.execute(sql, {"id": count_id}).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Stock count not found")
+    if row.status != OPEN:
+        raise HTTPException(status_code=409, detail=f"Stock count is {row.status}")
+    return row
+
+
+def record_counts(db: Session, count_id: int, items: Iterable[tuple], add: bool = False) -> dict:
+    """
+    Записати пакет підрахунків (виклик у транзакції роутера): items — (row, material_id, code, qty).
+
+    Lines are matched by material_id or, failing that, by code. Unknown
+    materials and bad quantities are reported per row and skipped. Every
+    other line of the batch is written in one upsert. In add mode a
+    negative correction that would take the counted quantity below zero
+    is not applied and is reported against the material's last row.
+    """
+    session = _lock_open(db, count_id, _SESSION_SHARE_SQL)
+    items = list(items)
+    errors, error_count = [], 0
+
+    def report(row, message: str) -> None:
+        nonlocal error_count
+        error_count += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"row": row, "error": message})
+
+    ids = [i for _, i, _, _ in items if i is not None]
+    codes = [c for _, i, c, _ in items if i is None and c]
+    by_id, by_code, categories = set(), {}, {}
+    if ids or codes:
+        for material_id, code, category_id in db.execute(_RESOLVE_SQL, {"ids": ids, "codes": codes}):
+            by_id.add(material_id)
+            by_code[code] = material_id
+            categories[material_id] = category_id
+
+    # кілька рядків одного матеріалу в пакеті: add — сума, set — останній
+    totals, last_row = {}, {}
+    for row, material_id, code, qty in items:
+        if material_id is None and not code:
+            report(row, "material_id or code is required")
+            continue
+        if material_id is not None:
+            resolved = material_id if material_id in by_id else None
+        else:
+            resolved = by_code.get(code)
+        if resolved is None:
+            report(row, f"material {material_id if material_id is not None else code!r} not found")
+            continue
+        if session.category_id is not None and categories[resolved] != session.category_id:
+            report(row, f"material {resolved} is not in category {session.category_id} of this stock count")
+            continue
+        try:
+            qty_u = qty_units(qty)
+        except (InvalidOperation, TypeError, ValueError, OverflowError):
+            report(row, f"qty: invalid number {qty!r}")
+            continue
+        if qty_u < 0 and not add:
+            report(row, "qty: counted quantity cannot be negative")
+            continue
+        totals[resolved] = totals.get(resolved, 0) + qty_u if add else qty_u
+        last_row[resolved] = row
+
+    written = set()
+    if totals:
+        keys = sorted(totals)
+        written = set(db.execute(_RECORD_SQL, {
+            "count_id": count_id,
+            "warehouse_id": session.warehouse_id,
+            "material_ids": keys,
+            "qtys": [qty_decimal(totals[k]) for k in keys],
+            "add": add,
+        }).scalars())
+        for k in keys:
+            if k not in written:
+                report(last_row[k], f"qty: counted quantity of material {k} cannot go below zero")
+    return {"accepted": len(written), "error_count": error_count, "errors": errors}
+
+
+def items_from_file(upload: UploadFile) -> list:
+    """Рядки (row, material_id, code, qty) з CSV/XLSX: колонки code або material_id, і qty (або counted_qty)."""
+    header, rows = read_rows(upload)
+    qty_column = "qty" if "qty" in header else "counted_qty"
+    if qty_column not in header or not ({"code", "material_id"} & set(header)):
+        raise HTTPException(status_code=400, detail="File needs columns code or material_id, and qty")
+
+    items = []
+    for row_no, raw in enumerate(rows, start=2):
+        values = dict(zip(header, raw))
+        if all(v is None or str(v).strip() == "" for v in values.values()):
+            continue
+        material_id = values.get("material_id")
+        try:
+            material_id = int(material_id) if material_id not in (None, "") else None
+        except (TypeError, ValueError):
+            material_id = -1  # не знайдеться — піде в звіт помилок
+        code = str(values.get("code") or "").strip() or None
+        items.append((row_no, material_id, code, values.get(qty_column)))
+    return items
+
+
+def summary(db: Session, count_id: int) -> dict:
+    return dict(db.execute(_SUMMARY_SQL, {"count_id": count_id}).mappings().one())
+
+
+def variances(
+    db: Session,
+    count: StockCount,
+    zero_uncounted: bool = False,
+    only_diff: bool = True,
+    skip: int = 0,
+    limit: int = 100,
+) -> list:
+    """Різниці (counted - expected) з вартістю за середньою собівартістю; у кожному рядку total."""
+    return db.execute(_VARIANCE_SQL, {
+        "count_id": count.id,
+        "warehouse_id": count.warehouse_id,
+        "zero_uncounted": zero_uncounted,
+        "only_diff": only_diff,
+        "skip": skip,
+        "limit": limit,
+    }).all()
+
+
+def apply_count(db: Session, count: StockCount, zero_uncounted: bool = False) -> dict:
+    """
+    Провести всі різниці сесії однією транзакцією (виклик у транзакції роутера).
+
+    zero_uncounted=True treats lines nobody counted as counted 0 (a full
+    count). By default they are left as they are.
+    """
+    _lock_open(db, count.id, _LOCK_SESSION_SQL)
+    posted = [
+        (material_id, qty_units(qty))
+        for material_id, qty in db.execute(_POST_VARIANCES_SQL, {"count_id": count.id, "zero_uncounted": zero_uncounted})
+    ]
+    moves = sorted((m, q) for m, q in posted if q != 0)
+
+    values = []
+    if moves:
+        # нестача не може зробити доступний залишок від'ємним — тоді 400 і rollback усієї сесії
+        apply_movements(db, [(count.warehouse_id, m, q) for m, q in moves])
+        values = post_costs(db, [(count.warehouse_id, m, q, None) for m, q in moves])
+
+    db.add_all([
+        StockLedger(
+            warehouse_id=count.warehouse_id,
+            material_id=material_id,
+            movement_type=StockMovementType.adjustment,
+            qty_change=qty_decimal(qty_u),
+            unit_price=money_decimal(div_half_up(value_u * QTY_SCALE, abs(qty_u))) if value_u is not None else None,
+            currency="UAH",
+            total_price=money_decimal(value_u if qty_u > 0 else -value_u) if value_u is not None else None,
+            reference_doc_type="StockCount",
+            reference_doc_id=count.id,
+            remarks=f"Stock count #{count.id}",
+        )
+        for (material_id, qty_u), value_u in zip(moves, values)
+    ])
+
+    count.status = APPLIED
+    count.applied_at = func.now()
+    surplus = sum(q for _, q in moves if q > 0)
+    shortage = -sum(q for _, q in moves if q < 0)
+    return {
+        "lines": len(posted),
+        "adjusted": len(moves),
+        "surplus_qty": qty_decimal(surplus),
+        "shortage_qty": qty_decimal(shortage),
+        "value": money_decimal(sum(v if q > 0 else -v for (_, q), v in zip(moves, values) if v is not None)),
+    }
@@ -0,0 +1,305 @@
+"""
+Зміна залишків stock_current одним атомарним запитом.
+
+Every router that changes stock goes through apply_movements(). Lines
+carry quantities in integer units of 0.0001 (utils.qty_units) and are netted per (warehouse_id, material_id). The rows are locked in key order,
+which avoids deadlocks between documents that share SKUs. One guarded
+UPDATE ... RETURNING then applies all deltas: a decrease only matches
+while quantity - reserved_quantity stays >= 0. A negative line without a
+match fails the whole document with 400, so overselling is impossible no
+matter how requests interleave. Positive lines for pairs that have no row
+yet are inserted under an advisory lock per pair (stock_current has no
+unique key).
+
+Ledger rows stay ORM objects in the routers (live feed relies on flush).
+
+Журнал для гарячих SKU (STOCK_JOURNAL_MATERIAL_IDS / _WAREHOUSE_IDS):
+receive_stock() appends receipt quantities to stock_deltas without
+touching the stock_current row. DeltaFolder folds them in batches in the
+background. A decrease on a journaled pair first takes that pair's
+pending deltas inside its own transaction, so the guard always sees the
+full balance. Reads add pending deltas through current_quantity().
+
+A journaled receipt does not touch stock_costs either. The delta row
+carries its UAH value (cost_pending), and the value is posted to
+stock_costs when the delta is folded or taken by a decrease. This keeps
+hot SKUs free of row locks on both tables.
+"""
+import logging
+import threading
+from decimal import Decimal
+from typing import Iterable, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .costing import CostLine, post_costs
+from .db import SessionLocal
+from .ledger_rollup import merge_pending
+from .models import StockCurrent, StockDelta
+from .utils import money_decimal, money_units, qty_units, qty_decimal
+
+log = logging.getLogger(__name__)
+
+Line = Tuple[Optional[int], int, int]  # (warehouse_id, material_id, ±qty units)
+
+_REQUEST_CTE = """
+    WITH req AS (
+        SELECT * FROM unnest(
+            CAST(:warehouse_ids AS integer[]),
+            CAST(:material_ids AS integer[]),
+            CAST(:deltas AS numeric[])
+        ) AS r(warehouse_id, material_id, delta)
+    )
+"""
+
+_APPLY_SQL = text(_REQUEST_CTE + """
+    , locked AS (
+        SELECT sc.id, req.delta
+        FROM stock_current sc
+        JOIN req ON sc.warehouse_id = req.warehouse_id AND sc.material_id = req.material_id
+        ORDER BY sc.warehouse_id, sc.material_id
+        FOR UPDATE OF sc
+    )
+    UPDATE stock_current sc
+    SET quantity = sc.quantity + locked.delta,
+        last_updated = now(),
+        last_movement_at = now()
+    FROM locked
+    WHERE sc.id = locked.id
+      AND (locked.delta >= 0 OR sc.quantity - sc.reserved_quantity + locked.delta >= 0)
+    RETURNING sc.warehouse_id, sc.material_id
+""")
+
+_ADVISORY_LOCK_SQL = text(_REQUEST_CTE + """
+    SELECT pg_advisory_xact_lock(k.warehouse_id, k.material_id)
+    FROM (SELECT warehouse_id, material_id FROM req ORDER BY warehouse_id, material_id) k
+""")
+
+_AVAILABLE_SQL = text(_REQUEST_CTE + """
+    SELECT sc.warehouse_id, sc.material_id, SUM(sc.quantity - sc.reserved_quantity)
+    FROM stock_current sc
+    JOIN req ON sc.warehouse_id = req.warehouse_id AND sc.material_id = req.material_id
+    GROUP BY sc.warehouse_id, sc.material_id
+""")
+
+_TAKE_PENDING_SQL = text(_REQUEST_CTE + """
+    DELETE FROM stock_deltas d USING req
+    WHERE d.warehouse_id = req.warehouse_id AND d.material_id = req.material_id
+    RETURNING d.id, d.warehouse_id, d.material_id, d.delta, d.value, d.cost_pending
+""")
+
+_FOLD_BATCH_SQL = text("""
+    DELETE FROM stock_deltas WHERE id IN (
+        SELECT id FROM stock_deltas ORDER BY id LIMIT :batch FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, warehouse_id, material_id, delta, value, cost_pending
+""")
+
+
+def _ids(value: str) -> frozenset:
+    return frozenset(int(v) for v in value.split(",") if v.strip())
+
+
+JOURNAL_MATERIALS = _ids(settings.STOCK_JOURNAL_MATERIAL_IDS)
+JOURNAL_WAREHOUSES = _ids(settings.STOCK_JOURNAL_WAREHOUSE_IDS)
+
+
+def journal_enabled() -> bool:
+    return bool(JOURNAL_MATERIALS or JOURNAL_WAREHOUSES)
+
+
+def journaled(warehouse_id: Optional[int], material_id: int) -> bool:
+    return warehouse_id is not None and (
+        material_id in JOURNAL_MATERIALS or warehouse_id in JOURNAL_WAREHOUSES
+    )
+
+
+def _net(lines: Iterable[Line]) -> dict:
+    totals = {}
+    for warehouse_id, material_id, delta in lines:
+        key = (warehouse_id, material_id)
+        totals[key] = totals.get(key, 0) + delta
+    return {k: v for k, v in totals.items() if v != 0}
+
+
+def _params(deltas: dict) -> dict:
+    keys = list(deltas)
+    return {
+        "warehouse_ids": [w for w, _ in keys],
+        "material_ids": [m for _, m in keys],
+        "deltas": [qty_decimal(deltas[k]) for k in keys],
+    }
+
+
+def _apply(db: Session, deltas: dict) -> set:
+    return {tuple(r) for r in db.execute(_APPLY_SQL, _params(deltas))}
+
+
+def _shortage(db: Session, deltas: dict) -> HTTPException:
+    available = {(r[0], r[1]): r[2] for r in db.execute(_AVAILABLE_SQL, _params(deltas))}
+    (warehouse_id, material_id), delta = next(iter(deltas.items()))
+    if (warehouse_id, material_id) not in available:
+        return HTTPException(
+            status_code=400,
+            detail=f"Material {material_id} not available in warehouse {warehouse_id}"
+        )
+    return HTTPException(
+        status_code=400,
+        detail=f"Insufficient stock for material {material_id}. "
+               f"Available: {available[(warehouse_id, material_id)]}, Requested: {qty_decimal(-delta)}"
+    )
+
+
+def apply_movements(db: Session, lines: Iterable[Line]) -> None:
+    """
+    Застосувати рухи (warehouse_id, material_id, ±qty у одиницях 0.0001) до stock_current.
+
+    Викликається в транзакції роутера; при нестачі кидає HTTPException(400),
+    роутер робить rollback усього документа.
+    """
+    deltas = _net(lines)
+    if not deltas:
+        return
+
+    taken = []
+    hot = {k: v for k, v in deltas.items() if v < 0 and journaled(*k)}
+    if hot:
+        # забираємо незгорнуті дельти цих пар у свою транзакцію, щоб guard бачив повний залишок
+        for row in db.execute(_TAKE_PENDING_SQL, _params(hot)):
+            deltas[(row.warehouse_id, row.material_id)] += qty_units(row.delta)
+            taken.append(row)
+        deltas = {k: v for k, v in deltas.items() if v != 0}
+
+    if deltas:
+        _apply_deltas(db, deltas)
+    # собівартість забраних надходжень — раніше за власні рядки документа (post_costs роутера)
+    _post_delta_costs(db, taken)
+
+
+def _apply_deltas(db: Session, deltas: dict) -> None:
+    matched = _apply(db, deltas)
+    missing = {k: v for k, v in deltas.items() if k not in matched}
+    shortages = {k: v for k, v in missing.items() if v < 0}
+    if shortages:
+        raise _shortage(db, shortages)
+    if not missing:
+        return
+
+    # Нові пари: серіалізуємо вставку advisory-локом і перевіряємо ще раз —
+    # паралельний документ міг створити рядок, поки ми чекали
+    db.execute(_ADVISORY_LOCK_SQL, _params(missing))
+    matched = _apply(db, missing)
+    rows = [
+        {"warehouse_id": w, "material_id": m, "quantity": qty_decimal(delta), "reserved_quantity": Decimal("0.0000")}
+        for (w, m), delta in missing.items() if (w, m) not in matched
+    ]
+    if rows:
+        db.execute(insert(StockCurrent).values(last_movement_at=func.now()), rows)
+
+
+def _post_delta_costs(db: Session, rows: list) -> None:
+    """Провести собівартість згорнутих/забраних дельт у порядку id (після локів stock_current)."""
+    lines = [
+        (r.warehouse_id, r.material_id, qty_units(r.delta), money_units(r.value) if r.value is not None else None)
+        for r in sorted(rows, key=lambda r: r.id) if r.cost_pending
+    ]
+    if lines:
+        post_costs(db, lines)
+
+
+def receive_stock(db: Session, lines: Iterable[CostLine]) -> list:
+    """
+    Надходження (warehouse_id, material_id, qty units, value units UAH або None).
+
+    Hot pairs go to the journal without locking their rows, and their cost
+    is posted on fold. The remaining lines go through apply_movements().
+    Returns those direct lines for the router to pass to post_costs().
+    """
+    direct, journal = [], []
+    for warehouse_id, material_id, qty, value in lines:
+        if qty > 0 and journaled(warehouse_id, material_id):
+            journal.append({
+                "warehouse_id": warehouse_id, "material_id": material_id, "delta": qty_decimal(qty),
+                "value": money_decimal(value) if value is not None else None, "cost_pending": True,
+            })
+        else:
+            direct.append((warehouse_id, material_id, qty, value))
+    if journal:
+        db.execute(insert(StockDelta), journal)
+    apply_movements(db, [(w, m, q) for w, m, q, _ in direct])
+    return direct
+
+
+def current_quantity():
+    """StockCurrent.quantity плюс незгорнуті дельти журналу (для читання)."""
+    if not journal_enabled():
+        return StockCurrent.quantity
+    pending = (
+        select(func.coalesce(func.sum(StockDelta.delta), 0))
+        .where(
+            StockDelta.warehouse_id == StockCurrent.warehouse_id,
+            StockDelta.material_id == StockCurrent.material_id,
+        )
+        .correlate(StockCurrent)
+        .scalar_subquery()
+    )
+    return StockCurrent.quantity + pending
+
+
+def fold_pending(db: Session, batch: int) -> int:
+    """Згорнути до batch найстаріших дельт у stock_current і stock_costs; повертає кількість."""
+    rows = db.execute(_FOLD_BATCH_SQL, {"batch": batch}).all()
+    apply_movements(db, [(r.warehouse_id, r.material_id, qty_units(r.delta)) for r in rows])
+    _post_delta_costs(db, rows)
+    return len(rows)
+
+
+class DeltaFolder:
+    """
+    Фоновий потік, що згортає stock_deltas у stock_current.
+
+    Runs in every worker. SKIP LOCKED lets several folders share the
+    backlog without waiting on each other. Runs even with the journal
+    switched off, so deltas left over after a config change are still applied.
+    The same loop merges the trigger's stock_ledger_monthly_deltas into
+    the monthly rollups (ledger_rollup.merge_pending).
+    """
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="stock-delta-folder", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        batch = settings.STOCK_JOURNAL_FOLD_BATCH
+        while not self._stop.is_set():
+            folded = 0
+            try:
+                with SessionLocal() as db:
+                    folded = fold_pending(db, batch)
+                    db.commit()
+                with SessionLocal() as db:
+                    folded = max(folded, merge_pending(db, batch))
+                    db.commit()
+            except Exception as e:
+                log.warning("Stock journal fold failed: %s", e)
+            # повний батч — одразу наступний, інакше чекаємо інтервал
+            if folded < batch:
+                self._stop.wait(settings.STOCK_JOURNAL_FOLD_INTERVAL_SECONDS)
+
+
+folder = DeltaFolder()
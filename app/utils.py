@@ -3,6 +3,26 @@ from decimal import Decimal, ROUND_HALF_UP, getcontext
 # Set precision for all Decimal operations
 getcontext().prec = 28
 
+# Фіксовані курси для перерахунку у гривню (дашборд, аналітика)
+EXCHANGE_RATES_UAH = {
+    "UAH": Decimal("1.0"),
+    "USD": Decimal("41.5"),
+    "EUR": Decimal("44.8"),
+    "PLN": Decimal("10.2"),
+    "GBP": Decimal("52.3"),
+    "CHF": Decimal("47.5"),
+    "CZK": Decimal("1.73"),
+    "HUF": Decimal("0.11"),
+    "RON": Decimal("9.0"),
+    "TRY": Decimal("1.2"),
+    "SEK": Decimal("3.8"),
+    "NOK": Decimal("3.7"),
+    "JPY": Decimal("0.27"),
+    "CNY": Decimal("5.7"),
+    "AUD": Decimal("26.5"),
+    "CAD": Decimal("29.8"),
+}
+
 
 def to_decimal(value, quant_str=None):
     """
@@ -18,4 +38,56 @@ def to_decimal(value, quant_str=None):
     d = Decimal(str(value))
     if quant_str:
         return d.quantize(Decimal(quant_str), rounding=ROUND_HALF_UP)
-    return d
\ No newline at end of file
+    return d
+
+# ---------- fixed-point integer units ----------
+# Кількість зберігається як ціле число одиниць 0.0001, гроші — одиниць 0.01.
+# Decimal з'являється лише на межах (API-вхід, ORM-колонки Numeric), усередині — int.
+QTY_SCALE = 10_000
+MONEY_SCALE = 100
+
+
+def to_units(value, scale: int) -> int:
+    """
+    Convert value to integer units of 1/scale (ROUND_HALF_UP, as to_decimal)
+
+    Args:
+        value: Value to convert (int, float, str, Decimal)
+        scale: Units per 1 (QTY_SCALE or MONEY_SCALE)
+
+    Returns:
+        int: Number of units
+    """
+    if isinstance(value, int):
+        return value * scale
+    d = value if isinstance(value, Decimal) else Decimal(str(value))
+    return int((d * scale).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def qty_units(value) -> int:
+    return to_units(value, QTY_SCALE)
+
+
+def money_units(value) -> int:
+    return to_units(value, MONEY_SCALE)
+
+
+def div_half_up(n: int, d: int) -> int:
+    """Integer n / d rounded half away from zero (same as Decimal ROUND_HALF_UP)."""
+    q, r = divmod(abs(n), d)
+    if 2 * r >= d:
+        q += 1
+    return q if n >= 0 else -q
+
+
+def line_total_units(qty_u: int, price_u: int) -> int:
+    """qty (0.0001) x price (0.01) -> total in money units (0.01)."""
+    return div_half_up(qty_u * price_u, QTY_SCALE)
+
+
+def qty_decimal(units: int) -> Decimal:
+    return Decimal(units).scaleb(-4)
+
+
+def money_decimal(units: int) -> Decimal:
+    return Decimal(units).scaleb(-2)
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Numeric, ForeignKey, Boolean, Text, DateTime, Enum as PgEnum
-from sqlalchemy.orm import relationship, declarative_base
-from sqlalchemy.sql import func
+from sqlalchemy import BigInteger, Column, Integer, String, Numeric, ForeignKey, Boolean, Text, Date, DateTime, LargeBinary, Enum as PgEnum, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import deferred, relationship, declarative_base
+from sqlalchemy.sql import func, false
 import enum
 
 Base = declarative_base()
@@ -106,11 +107,60 @@ class StockCurrent(Base):
     material_id = Column(Integer, ForeignKey("materials.id", ondelete="CASCADE"), nullable=False)
     quantity = Column(Numeric(18, 4), nullable=False, default=0)
     reserved_quantity = Column(Numeric(18, 4), nullable=False, default=0)
+    # (quantity - reserved_quantity) < materials.min_stock; підтримується тригерами БД
+    below_min = Column(Boolean, nullable=False, server_default=false())
     last_updated = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    # час останнього руху залишку (stock_service); NULL — рухів не було з часу міграції
+    last_movement_at = Column(DateTime(timezone=True))
     
     warehouse = relationship("Warehouse", back_populates="stock_current")
     material = relationship("Material", back_populates="stock_current")
 
+    __table_args__ = (
+        Index(
+            "ix_stock_current_below_min",
+            "warehouse_id", "material_id",
+            postgresql_where=below_min,
+        ),
+        Index("ix_stock_current_last_movement_at", "last_movement_at"),
+    )
+
+# STOCK DELTAS
+class StockDelta(Base):
+    """Незгорнуті прирости залишку (журнал надходжень для гарячих SKU)."""
+    __tablename__ = "stock_deltas"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id", ondelete="CASCADE"), nullable=False)
+    material_id = Column(Integer, ForeignKey("materials.id", ondelete="CASCADE"), nullable=False)
+    delta = Column(Numeric(18, 4), nullable=False)
+    # вартість надходження в UAH; cost_pending — ще не проведена в stock_costs (проведе folder)
+    value = Column(Numeric(18, 4))
+    cost_pending = Column(Boolean, nullable=False, default=False, server_default=false())
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_stock_deltas_warehouse_material", "warehouse_id", "material_id"),
+    )
+
+# STOCK COSTS
+class StockCost(Base):
+    """Ковзна середня собівартість залишку по парі (склад, матеріал), у гривні."""
+    __tablename__ = "stock_costs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id", ondelete="CASCADE"), nullable=False)
+    material_id = Column(Integer, ForeignKey("materials.id", ondelete="CASCADE"), nullable=False)
+    quantity = Column(Numeric(18, 4), nullable=False, default=0)
+    value = Column(Numeric(18, 4), nullable=False, default=0)
+    # остання середня ціна одиниці; лишається, коли кількість падає до нуля
+    avg_cost = Column(Numeric(18, 6), nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("warehouse_id", "material_id", name="uq_stock_costs_warehouse_material"),
+    )
+
 # STOCK LEDGER
 class StockLedger(Base):
     __tablename__ = "stock_ledger"
@@ -118,7 +168,7 @@ class StockLedger(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     warehouse_id = Column(Integer, ForeignKey("warehouses.id", ondelete="SET NULL"))
     material_id = Column(Integer, ForeignKey("materials.id", ondelete="SET NULL"))
-    date_time = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    date_time = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
     movement_type = Column(PgEnum(StockMovementType, name="stock_movement_type"), nullable=False)
     qty_change = Column(Numeric(18, 4), nullable=False)
     unit_price = Column(Numeric(14, 2))
@@ -128,13 +178,47 @@ class StockLedger(Base):
     reference_doc_id = Column(Integer)
     remarks = Column(Text)
 
+# STOCK LEDGER MONTHLY
+class StockLedgerMonthly(Base):
+    """Місячні підсумки stock_ledger по (склад, матеріал, тип руху); веде тригер БД."""
+    __tablename__ = "stock_ledger_monthly"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    month = Column(Date, nullable=False)  # перше число місяця, UTC
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id", ondelete="CASCADE"), nullable=False)
+    material_id = Column(Integer, ForeignKey("materials.id", ondelete="CASCADE"), nullable=False)
+    movement_type = Column(PgEnum(StockMovementType, name="stock_movement_type"), nullable=False)
+    qty = Column(Numeric(18, 4), nullable=False, default=0)
+    value = Column(Numeric(18, 4), nullable=False, default=0)
+    moves = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint(
+            "month", "warehouse_id", "material_id", "movement_type", name="uq_stock_ledger_monthly_key"
+        ),
+    )
+
+# STOCK LEDGER MONTHLY DELTAS
+class StockLedgerMonthlyDelta(Base):
+    """Прирости до stock_ledger_monthly, які пише тригер (append-only, без локу рядка підсумку)."""
+    __tablename__ = "stock_ledger_monthly_deltas"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    month = Column(Date, nullable=False)
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id", ondelete="CASCADE"), nullable=False)
+    material_id = Column(Integer, ForeignKey("materials.id", ondelete="CASCADE"), nullable=False)
+    movement_type = Column(PgEnum(StockMovementType, name="stock_movement_type"), nullable=False)
+    qty = Column(Numeric(18, 4), nullable=False)
+    value = Column(Numeric(18, 4), nullable=False)
+    moves = Column(Integer, nullable=False)
+
 # RECEIPTS
 class Receipt(Base):
     __tablename__ = "receipts"
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     document_number = Column(String(100), nullable=False, unique=True)
-    date = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    date = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
     supplier_id = Column(Integer, ForeignKey("suppliers.id", ondelete="SET NULL"))
     created_by_user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"))
     currency = Column(String(3), nullable=False, default="UAH")
@@ -168,7 +252,7 @@ class Issue(Base):
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     document_number = Column(String(100), nullable=False, unique=True)
-    date = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    date = Column(DateTime(timezone=True), nullable=False, server_default=func.now(), index=True)
     client_id = Column(Integer, ForeignKey("clients.id", ondelete="SET NULL"))
     created_by_user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"))
     currency = Column(String(3), nullable=False, default="UAH")
@@ -193,5 +277,72 @@ class IssueItem(Base):
     total_price = Column(Numeric(18, 4), nullable=False)
     weight = Column(Numeric(18, 6))
     notes = Column(Text)
+    # собівартість позиції у гривні за ковзною середньою на момент видачі (app/costing.py)
+    cogs = Column(Numeric(18, 4))
     
-    issue = relationship("Issue", back_populates="items")
\ No newline at end of file
+    issue = relationship("Issue", back_populates="items")
+
+# JOBS
+class Job(Base):
+    """Фонова задача (app/jobs.py): параметри, стан, прогрес і результат."""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_type = Column(String(64), nullable=False)
+    status = Column(String(16), nullable=False, default="queued")  # queued/running/succeeded/failed/cancelled
+    params = Column(JSONB, nullable=False, default=dict)
+    progress_done = Column(BigInteger, nullable=False, default=0)
+    progress_total = Column(BigInteger)
+    message = Column(Text)
+    error = Column(Text)
+    cancel_requested = Column(Boolean, nullable=False, default=False, server_default=false())
+    # вхідний файл (імпорт) і результат — великі, тому deferred: список задач їх не читає
+    input_filename = Column(String(255))
+    input_data = deferred(Column(LargeBinary))
+    result_filename = Column(String(255))
+    result_content_type = Column(String(100))
+    result = deferred(Column(LargeBinary))
+    created_by = Column(String(255))
+    worker = Column(String(128))
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    heartbeat_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        Index("ix_jobs_status_type", "status", "job_type", "id"),
+    )
+
+# STOCK COUNTS
+class StockCount(Base):
+    """Інвентаризація складу: заморожені очікувані залишки, підраховані кількості, проведення різниць."""
+    __tablename__ = "stock_counts"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id", ondelete="CASCADE"), nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id", ondelete="SET NULL"))  # None — увесь склад
+    status = Column(String(16), nullable=False, default="open")  # open/applied/cancelled
+    notes = Column(Text)
+    created_by = Column(String(255))
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    applied_at = Column(DateTime(timezone=True))
+
+    lines = relationship("StockCountLine", back_populates="count", cascade="all, delete-orphan")
+
+# STOCK COUNT LINES
+class StockCountLine(Base):
+    __tablename__ = "stock_count_lines"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    count_id = Column(Integer, ForeignKey("stock_counts.id", ondelete="CASCADE"), nullable=False)
+    material_id = Column(Integer, ForeignKey("materials.id", ondelete="RESTRICT"), nullable=False)
+    expected_qty = Column(Numeric(18, 4), nullable=False, default=0)  # залишок на момент створення
+    counted_qty = Column(Numeric(18, 4))  # None — ще не підраховано
+    counted_at = Column(DateTime(timezone=True))
+    posted_qty = Column(Numeric(18, 4))  # проведене коригування (counted - expected)
+
+    count = relationship("StockCount", back_populates="lines")
+
+    __table_args__ = (
+        UniqueConstraint("count_id", "material_id", name="uq_stock_count_lines_count_material"),
+    )
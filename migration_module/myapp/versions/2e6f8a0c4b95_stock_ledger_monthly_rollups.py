@@ -0,0 +1,86 @@
+"""stock_ledger monthly rollups
+
+Revision ID: 2e6f8a0c4b95
+Revises: 9d3b5f7a2c18
+Create Date: 2026-10-19 18:05:12.640931
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2e6f8a0c4b95'
+down_revision: Union[str, Sequence[str], None] = '9d3b5f7a2c18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('stock_ledger_monthly',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('warehouse_id', sa.Integer(), nullable=False),
+    sa.Column('material_id', sa.Integer(), nullable=False),
+    sa.Column('movement_type', postgresql.ENUM(name='stock_movement_type', create_type=False), nullable=False),
+    sa.Column('qty', sa.Numeric(precision=18, scale=4), nullable=False),
+    sa.Column('value', sa.Numeric(precision=18, scale=4), nullable=False),
+    sa.Column('moves', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['material_id'], ['materials.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['warehouse_id'], ['warehouses.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('month', 'warehouse_id', 'material_id', 'movement_type', name='uq_stock_ledger_monthly_key')
+    )
+    op.create_index(op.f('ix_stock_ledger_date_time'), 'stock_ledger', ['date_time'], unique=False)
+
+    # Рядки журналу додаються до місячних підсумків у тій самій транзакції.
+    # Statement-level тригер: один upsert на INSERT/COPY, ключі в стабільному порядку.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION stock_ledger_rollup() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO stock_ledger_monthly AS r
+                   (month, warehouse_id, material_id, movement_type, qty, value, moves)
+            SELECT date_trunc('month', date_time AT TIME ZONE 'UTC')::date,
+                   warehouse_id, material_id, movement_type,
+                   SUM(qty_change), SUM(COALESCE(total_price, 0)), COUNT(*)
+            FROM new_rows
+            WHERE warehouse_id IS NOT NULL AND material_id IS NOT NULL
+            GROUP BY 1, 2, 3, 4
+            ORDER BY 2, 3, 1, 4
+            ON CONFLICT (month, warehouse_id, material_id, movement_type) DO UPDATE
+            SET qty = r.qty + EXCLUDED.qty,
+                value = r.value + EXCLUDED.value,
+                moves = r.moves + EXCLUDED.moves;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+        CREATE TRIGGER trg_stock_ledger_rollup
+        AFTER INSERT ON stock_ledger
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION stock_ledger_rollup()
+    """)
+
+    # Початкове наповнення; пізніше перерахунок місяців — python -m tools.rollup
+    op.execute("""
+        INSERT INTO stock_ledger_monthly (month, warehouse_id, material_id, movement_type, qty, value, moves)
+        SELECT date_trunc('month', date_time AT TIME ZONE 'UTC')::date,
+               warehouse_id, material_id, movement_type,
+               SUM(qty_change), SUM(COALESCE(total_price, 0)), COUNT(*)
+        FROM stock_ledger
+        WHERE warehouse_id IS NOT NULL AND material_id IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS trg_stock_ledger_rollup ON stock_ledger")
+    op.execute("DROP FUNCTION IF EXISTS stock_ledger_rollup()")
+    op.drop_index(op.f('ix_stock_ledger_date_time'), table_name='stock_ledger')
+    op.drop_table('stock_ledger_monthly')
@@ -0,0 +1,30 @@
+"""receipts/issues date index
+
+Revision ID: 3f1c9a7d2e54
+Revises: ab30b24b9c76
+Create Date: 2026-10-19 10:12:04.318220
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c9a7d2e54'
+down_revision: Union[str, Sequence[str], None] = 'ab30b24b9c76'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_receipts_date'), 'receipts', ['date'], unique=False)
+    op.create_index(op.f('ix_issues_date'), 'issues', ['date'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_issues_date'), table_name='issues')
+    op.drop_index(op.f('ix_receipts_date'), table_name='receipts')
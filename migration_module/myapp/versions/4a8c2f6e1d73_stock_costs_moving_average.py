@@ -0,0 +1,90 @@
+"""stock_costs moving average and issue_items.cogs
+
+Revision ID: 4a8c2f6e1d73
+Revises: c5d7e1f3a209
+Create Date: 2026-10-19 16:02:44.915203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4a8c2f6e1d73'
+down_revision: Union[str, Sequence[str], None] = 'c5d7e1f3a209'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('stock_costs',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('warehouse_id', sa.Integer(), nullable=False),
+    sa.Column('material_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Numeric(precision=18, scale=4), nullable=False),
+    sa.Column('value', sa.Numeric(precision=18, scale=4), nullable=False),
+    sa.Column('avg_cost', sa.Numeric(precision=18, scale=6), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['material_id'], ['materials.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['warehouse_id'], ['warehouses.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('warehouse_id', 'material_id', name='uq_stock_costs_warehouse_material')
+    )
+    op.add_column('issue_items', sa.Column('cogs', sa.Numeric(precision=18, scale=4), nullable=True))
+
+    # Початкова собівартість наявного залишку: остання ціна надходження на цей склад,
+    # інакше ціна з довідника; у гривні за курсами utils.EXCHANGE_RATES_UAH
+    op.execute("""
+        WITH fx(code, rate) AS (VALUES
+            ('UAH', 1.0),
+            ('USD', 41.5),
+            ('EUR', 44.8),
+            ('PLN', 10.2),
+            ('GBP', 52.3),
+            ('CHF', 47.5),
+            ('CZK', 1.73),
+            ('HUF', 0.11),
+            ('RON', 9.0),
+            ('TRY', 1.2),
+            ('SEK', 3.8),
+            ('NOK', 3.7),
+            ('JPY', 0.27),
+            ('CNY', 5.7),
+            ('AUD', 26.5),
+            ('CAD', 29.8)
+        ),
+        last_price AS (
+            SELECT DISTINCT ON (ri.warehouse_id, ri.material_id)
+                   ri.warehouse_id, ri.material_id, ri.unit_price * COALESCE(fx.rate, 1) AS cost
+            FROM receipt_items ri
+            JOIN receipts r ON r.id = ri.receipt_id
+            LEFT JOIN fx ON fx.code = ri.currency
+            WHERE ri.warehouse_id IS NOT NULL
+            ORDER BY ri.warehouse_id, ri.material_id, r.date DESC, r.id DESC
+        ),
+        stock AS (
+            SELECT warehouse_id, material_id, SUM(quantity) AS quantity
+            FROM (SELECT warehouse_id, material_id, quantity FROM stock_current
+                  UNION ALL
+                  SELECT warehouse_id, material_id, delta FROM stock_deltas) s
+            GROUP BY warehouse_id, material_id
+        )
+        INSERT INTO stock_costs (warehouse_id, material_id, quantity, value, avg_cost)
+        SELECT s.warehouse_id, s.material_id, s.quantity,
+               CASE WHEN s.quantity > 0 THEN ROUND(s.quantity * c.cost, 2) ELSE 0 END,
+               ROUND(c.cost, 6)
+        FROM stock s
+        JOIN materials m ON m.id = s.material_id
+        LEFT JOIN last_price lp ON lp.warehouse_id = s.warehouse_id AND lp.material_id = s.material_id
+        LEFT JOIN fx ON fx.code = m.currency
+        CROSS JOIN LATERAL (SELECT COALESCE(lp.cost, m.price * COALESCE(fx.rate, 1)) AS cost) c
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('issue_items', 'cogs')
+    op.drop_table('stock_costs')
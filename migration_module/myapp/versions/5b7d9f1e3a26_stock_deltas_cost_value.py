@@ -0,0 +1,31 @@
+"""stock_deltas cost value
+
+Revision ID: 5b7d9f1e3a26
+Revises: d8f2a4c6e913
+Create Date: 2026-10-20 10:14:52.307618
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7d9f1e3a26'
+down_revision: Union[str, Sequence[str], None] = 'd8f2a4c6e913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('stock_deltas', sa.Column('value', sa.Numeric(precision=18, scale=4), nullable=True))
+    # Наявні дельти вже проведені в stock_costs у момент надходження — cost_pending = false
+    op.add_column('stock_deltas', sa.Column('cost_pending', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('stock_deltas', 'cost_pending')
+    op.drop_column('stock_deltas', 'value')
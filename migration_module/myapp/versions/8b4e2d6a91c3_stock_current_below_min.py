@@ -0,0 +1,78 @@
+"""stock_current below_min flag
+
+Revision ID: 8b4e2d6a91c3
+Revises: 3f1c9a7d2e54
+Create Date: 2026-10-19 11:02:47.551903
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b4e2d6a91c3'
+down_revision: Union[str, Sequence[str], None] = '3f1c9a7d2e54'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('stock_current', sa.Column('below_min', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+
+    # below_min = (quantity - reserved_quantity) < materials.min_stock.
+    # Keep it in the database so every write path (ORM, bulk UPDATE, COPY) maintains it.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION stock_current_set_below_min() RETURNS trigger AS $$
+        BEGIN
+            NEW.below_min := (NEW.quantity - NEW.reserved_quantity) <
+                COALESCE((SELECT min_stock FROM materials WHERE id = NEW.material_id), 0);
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER trg_stock_current_below_min
+        BEFORE INSERT OR UPDATE OF quantity, reserved_quantity, material_id ON stock_current
+        FOR EACH ROW EXECUTE FUNCTION stock_current_set_below_min()
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION materials_refresh_below_min() RETURNS trigger AS $$
+        BEGIN
+            UPDATE stock_current
+               SET below_min = (quantity - reserved_quantity) < NEW.min_stock
+             WHERE material_id = NEW.id
+               AND below_min IS DISTINCT FROM ((quantity - reserved_quantity) < NEW.min_stock);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER trg_materials_below_min
+        AFTER UPDATE OF min_stock ON materials
+        FOR EACH ROW WHEN (OLD.min_stock IS DISTINCT FROM NEW.min_stock)
+        EXECUTE FUNCTION materials_refresh_below_min()
+    """)
+
+    op.execute("""
+        UPDATE stock_current sc
+           SET below_min = (sc.quantity - sc.reserved_quantity) < m.min_stock
+          FROM materials m
+         WHERE m.id = sc.material_id
+    """)
+    op.create_index(
+        'ix_stock_current_below_min', 'stock_current', ['warehouse_id', 'material_id'],
+        unique=False, postgresql_where=sa.text('below_min'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_stock_current_below_min', table_name='stock_current')
+    op.execute("DROP TRIGGER IF EXISTS trg_materials_below_min ON materials")
+    op.execute("DROP FUNCTION IF EXISTS materials_refresh_below_min()")
+    op.execute("DROP TRIGGER IF EXISTS trg_stock_current_below_min ON stock_current")
+    op.execute("DROP FUNCTION IF EXISTS stock_current_set_below_min()")
+    op.drop_column('stock_current', 'below_min')
@@ -0,0 +1,40 @@
+"""stock_current last_movement_at
+
+Revision ID: 9d3b5f7a2c18
+Revises: 4a8c2f6e1d73
+Create Date: 2026-10-19 17:11:37.402816
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d3b5f7a2c18'
+down_revision: Union[str, Sequence[str], None] = '4a8c2f6e1d73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('stock_current', sa.Column('last_movement_at', sa.DateTime(timezone=True), nullable=True))
+    # Одноразовий прохід по журналу; далі поле веде stock_service.apply_movements
+    op.execute("""
+        UPDATE stock_current sc
+        SET last_movement_at = l.last_at
+        FROM (SELECT warehouse_id, material_id, MAX(date_time) AS last_at
+              FROM stock_ledger
+              WHERE warehouse_id IS NOT NULL AND material_id IS NOT NULL
+              GROUP BY warehouse_id, material_id) l
+        WHERE sc.warehouse_id = l.warehouse_id AND sc.material_id = l.material_id
+    """)
+    op.create_index('ix_stock_current_last_movement_at', 'stock_current', ['last_movement_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_stock_current_last_movement_at', table_name='stock_current')
+    op.drop_column('stock_current', 'last_movement_at')
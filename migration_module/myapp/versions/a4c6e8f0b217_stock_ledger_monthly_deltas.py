@@ -0,0 +1,89 @@
+"""stock_ledger monthly rollup deltas
+
+Revision ID: a4c6e8f0b217
+Revises: 5b7d9f1e3a26
+Create Date: 2026-10-20 10:52:18.940263
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c6e8f0b217'
+down_revision: Union[str, Sequence[str], None] = '5b7d9f1e3a26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('stock_ledger_monthly_deltas',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('warehouse_id', sa.Integer(), nullable=False),
+    sa.Column('material_id', sa.Integer(), nullable=False),
+    sa.Column('movement_type', postgresql.ENUM(name='stock_movement_type', create_type=False), nullable=False),
+    sa.Column('qty', sa.Numeric(precision=18, scale=4), nullable=False),
+    sa.Column('value', sa.Numeric(precision=18, scale=4), nullable=False),
+    sa.Column('moves', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['material_id'], ['materials.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['warehouse_id'], ['warehouses.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # Тригер більше не робить upsert у stock_ledger_monthly (лок рядка підсумку до commit
+    # серіалізував би журнальні надходження гарячого SKU) — лише дописує прирости;
+    # їх зливає ledger_rollup.merge_pending() з потоку DeltaFolder.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION stock_ledger_rollup() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO stock_ledger_monthly_deltas
+                   (month, warehouse_id, material_id, movement_type, qty, value, moves)
+            SELECT date_trunc('month', date_time AT TIME ZONE 'UTC')::date,
+                   warehouse_id, material_id, movement_type,
+                   SUM(qty_change), SUM(COALESCE(total_price, 0)), COUNT(*)
+            FROM new_rows
+            WHERE warehouse_id IS NOT NULL AND material_id IS NOT NULL
+            GROUP BY 1, 2, 3, 4;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("""
+        CREATE OR REPLACE FUNCTION stock_ledger_rollup() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO stock_ledger_monthly AS r
+                   (month, warehouse_id, material_id, movement_type, qty, value, moves)
+            SELECT date_trunc('month', date_time AT TIME ZONE 'UTC')::date,
+                   warehouse_id, material_id, movement_type,
+                   SUM(qty_change), SUM(COALESCE(total_price, 0)), COUNT(*)
+            FROM new_rows
+            WHERE warehouse_id IS NOT NULL AND material_id IS NOT NULL
+            GROUP BY 1, 2, 3, 4
+            ORDER BY 2, 3, 1, 4
+            ON CONFLICT (month, warehouse_id, material_id, movement_type) DO UPDATE
+            SET qty = r.qty + EXCLUDED.qty,
+                value = r.value + EXCLUDED.value,
+                moves = r.moves + EXCLUDED.moves;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """)
+    # незлиті прирости — у підсумки, перш ніж таблиця зникне
+    op.execute("""
+        INSERT INTO stock_ledger_monthly AS r (month, warehouse_id, material_id, movement_type, qty, value, moves)
+        SELECT month, warehouse_id, material_id, movement_type, SUM(qty), SUM(value), SUM(moves)
+        FROM stock_ledger_monthly_deltas
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (month, warehouse_id, material_id, movement_type) DO UPDATE
+        SET qty = r.qty + EXCLUDED.qty, value = r.value + EXCLUDED.value, moves = r.moves + EXCLUDED.moves
+    """)
+    op.drop_table('stock_ledger_monthly_deltas')
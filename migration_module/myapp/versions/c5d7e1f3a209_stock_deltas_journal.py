@@ -0,0 +1,47 @@
+"""stock_deltas journal
+
+Revision ID: c5d7e1f3a209
+Revises: 8b4e2d6a91c3
+Create Date: 2026-10-19 14:21:09.318447
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d7e1f3a209'
+down_revision: Union[str, Sequence[str], None] = '8b4e2d6a91c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('stock_deltas',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('warehouse_id', sa.Integer(), nullable=False),
+    sa.Column('material_id', sa.Integer(), nullable=False),
+    sa.Column('delta', sa.Numeric(precision=18, scale=4), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['material_id'], ['materials.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['warehouse_id'], ['warehouses.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stock_deltas_warehouse_material', 'stock_deltas', ['warehouse_id', 'material_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # незгорнуті дельти не губимо
+    op.execute("""
+        UPDATE stock_current sc
+        SET quantity = sc.quantity + d.delta
+        FROM (SELECT warehouse_id, material_id, SUM(delta) AS delta
+              FROM stock_deltas GROUP BY warehouse_id, material_id) d
+        WHERE sc.warehouse_id = d.warehouse_id AND sc.material_id = d.material_id
+    """)
+    op.drop_index('ix_stock_deltas_warehouse_material', table_name='stock_deltas')
+    op.drop_table('stock_deltas')
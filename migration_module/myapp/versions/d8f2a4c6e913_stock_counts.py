@@ -0,0 +1,54 @@
+"""stock counts
+
+Revision ID: d8f2a4c6e913
+Revises: 7c1e9b3d5a60
+Create Date: 2026-10-19 19:48:21.530774
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8f2a4c6e913'
+down_revision: Union[str, Sequence[str], None] = '7c1e9b3d5a60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('stock_counts',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('warehouse_id', sa.Integer(), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=True),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('notes', sa.Text(), nullable=True),
+    sa.Column('created_by', sa.String(length=255), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('applied_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['warehouse_id'], ['warehouses.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('stock_count_lines',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('count_id', sa.Integer(), nullable=False),
+    sa.Column('material_id', sa.Integer(), nullable=False),
+    sa.Column('expected_qty', sa.Numeric(precision=18, scale=4), nullable=False),
+    sa.Column('counted_qty', sa.Numeric(precision=18, scale=4), nullable=True),
+    sa.Column('counted_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('posted_qty', sa.Numeric(precision=18, scale=4), nullable=True),
+    sa.ForeignKeyConstraint(['count_id'], ['stock_counts.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['material_id'], ['materials.id'], ondelete='RESTRICT'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('count_id', 'material_id', name='uq_stock_count_lines_count_material')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('stock_count_lines')
+    op.drop_table('stock_counts')
@@ -0,0 +1,400 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the hot API endpoints against a real server and database.
+
+For every scenario x concurrency level the harness keeps N keep-alive
+clients busy for --duration seconds and reports throughput and
+p50/p95/p99 latency. Results are written as JSON (with git commit and
+dataset size) so runs can be compared between commits.
+
+By default a uvicorn server is started against DATABASE_URL with real
+JWT auth. The harness generates a throwaway RSA key, serves its JWKS on
+localhost (AUTH0_JWKS_URL for the server only), and signs a
+storekeeper+admin token with the configured audience and issuer. Pass
+--base-url to hit a running server instead, with --token (or
+BENCH_TOKEN) holding a token that server accepts. With --sizes the
+database is re-seeded with tools.datagen before each dataset size.
+
+Usage:
+    python -m tools.bench --concurrency 1,8,32 --duration 15
+    python -m tools.bench --sizes 100000,1000000 --scenarios create_issue,list_ledger
+    python -m tools.bench --compare bench_results/a.json bench_results/b.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+from sqlalchemy import text
+
+from app.config import settings
+from app.db import engine
+from tools import datagen
+
+
+# ---------- HTTP ----------
+class Client:
+    """One keep-alive HTTP/1.1 connection; not thread-safe, use one per worker."""
+
+    def __init__(self, base_url: str, token: str = None, timeout: float = 30.0):
+        u = urlsplit(base_url)
+        self.host, self.port = u.hostname, u.port or 80
+        self.token = token
+        self.timeout = timeout
+        self._conn = None
+
+    def request(self, method: str, path: str, body=None):
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        for attempt in (0, 1):
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self._conn.request(method, path, body=payload, headers=headers)
+                resp = self._conn.getresponse()
+                data = resp.read()
+                return resp.status, data
+            except (http.client.HTTPException, ConnectionError):
+                self._conn.close()
+                self._conn = None
+                if attempt:
+                    raise
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def run_load(base_url: str, token: str, make_request, concurrency: int, duration: float,
+             warmup: float = 1.0) -> dict:
+    """Closed-loop load: each worker sends the next request as soon as the previous one returns."""
+    latencies, errors, statuses = [], [0], {}
+    lock = threading.Lock()
+    deadline_warm = time.perf_counter() + warmup
+    deadline = deadline_warm + duration
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        client = Client(base_url, token)
+        local, local_err, local_status = [], 0, {}
+        try:
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                method, path, body = make_request(rng)
+                start = time.perf_counter()
+                try:
+                    status, _ = client.request(method, path, body)
+                except Exception:
+                    status = 0
+                elapsed = time.perf_counter() - start
+                if start < deadline_warm:
+                    continue
+                local_status[status] = local_status.get(status, 0) + 1
+                if 200 <= status < 300:
+                    local.append(elapsed)
+                else:
+                    local_err += 1
+        finally:
+            client.close()
+            with lock:
+                latencies.extend(local)
+                errors[0] += local_err
+                for k, v in local_status.items():
+                    statuses[k] = statuses.get(k, 0) + v
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    ok = len(latencies)
+    ms = [v * 1000 for v in latencies]
+    return {
+        "requests": ok + errors[0],
+        "errors": errors[0],
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "throughput_rps": round(ok / duration, 2),
+        "mean_ms": round(sum(ms) / ok, 3) if ok else None,
+        "p50_ms": round(percentile(ms, 50), 3) if ok else None,
+        "p95_ms": round(percentile(ms, 95), 3) if ok else None,
+        "p99_ms": round(percentile(ms, 99), 3) if ok else None,
+        "max_ms": round(ms[-1], 3) if ok else None,
+    }
+
+
+# ---------- scenarios ----------
+class Fixtures:
+    """Ids sampled from the database so requests hit real rows."""
+
+    def __init__(self):
+        with engine.connect() as conn:
+            self.warehouses = [r[0] for r in conn.execute(text("SELECT id FROM warehouses ORDER BY id LIMIT 1000"))]
+            self.materials = [r[0] for r in conn.execute(text("SELECT id FROM materials ORDER BY random() LIMIT 5000"))]
+            self.stocked = [tuple(r) for r in conn.execute(text(
+                "SELECT warehouse_id, material_id FROM stock_current "
+                "WHERE quantity - reserved_quantity > 100 ORDER BY random() LIMIT 5000"
+            ))]
+            self.size = {t: conn.execute(text(f"SELECT count(*) FROM {t}")).scalar()
+                         for t in ("materials", "warehouses", "stock_current", "stock_ledger", "receipts", "issues")}
+        if not self.warehouses or not self.materials:
+            raise SystemExit("Database is empty: seed it first (python -m tools.datagen)")
+
+
+def _doc_number(prefix: str) -> str:
+    return f"{prefix}-{uuid.uuid4().hex[:16]}"
+
+
+def build_scenarios(fx: Fixtures) -> dict:
+    def create_receipt(rng):
+        items = [{
+            "material_id": rng.choice(fx.materials),
+            "warehouse_id": rng.choice(fx.warehouses),
+            "qty": str(rng.randint(1, 100)),
+            "unit_price": f"{rng.uniform(1, 500):.2f}",
+        } for _ in range(rng.randint(1, 8))]
+        return "POST", "/api/receipts", {"document_number": _doc_number("BENCH-R"), "items": items}
+
+    def create_issue(rng):
+        picks = rng.sample(fx.stocked, k=min(len(fx.stocked), rng.randint(1, 5)))
+        items = [{"material_id": m, "warehouse_id": w, "qty": "1", "unit_price": "10.00"} for w, m in picks]
+        return "POST", "/api/issues", {"document_number": _doc_number("BENCH-I"), "items": items}
+
+    def list_ledger(rng):
+        qs = rng.choice([
+            "",
+            f"?warehouse_id={rng.choice(fx.warehouses)}",
+            f"?material_id={rng.choice(fx.materials)}",
+            "?movement_type=issue",
+        ])
+        return "GET", "/api/stock-ledger" + qs, None
+
+    def get_current_stock(rng):
+        return "GET", f"/api/stock/current?warehouse_id={rng.choice(fx.warehouses)}", None
+
+    def dashboard(path):
+        return lambda rng: ("GET", "/api/dashboard/" + path, None)
+
+    scenarios = {
+        "create_receipt": create_receipt,
+        "create_issue": create_issue,
+        "list_ledger": list_ledger,
+        "get_current_stock": get_current_stock,
+        "dashboard_summary": dashboard("summary"),
+        "dashboard_warehouse_stats": dashboard("warehouse-stats"),
+        "dashboard_low_stock_alert": dashboard("low-stock-alert"),
+        "dashboard_recent_activities": dashboard("recent-activities"),
+        "dashboard_timeline_day": dashboard("receipts-issues-timeline?days=365"),
+        "dashboard_timeline_month": dashboard("receipts-issues-timeline?days=365&granularity=month"),
+        "dashboard_top_materials": dashboard("top-materials"),
+        "dashboard_counterparty_clients": dashboard("counterparty-report?type=clients"),
+        "dashboard_counterparty_suppliers": dashboard("counterparty-report?type=suppliers"),
+    }
+    if not fx.stocked:
+        scenarios.pop("create_issue")
+    return scenarios
+
+
+# ---------- auth ----------
+class BenchAuth:
+    """Throwaway RSA key: JWKS served on localhost and a token signed with it."""
+
+    KID = "bench"
+
+    def __init__(self, ttl: float):
+        pem = rsa.generate_private_key(public_exponent=65537, key_size=2048).private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        )
+        public = jwk.construct(pem, algorithm="RS256").public_key().to_dict()
+        self.jwks = json.dumps({"keys": [dict(public, kid=self.KID, use="sig")]}).encode()
+        now = int(time.time())
+        self.token = jwt.encode(
+            {
+                "sub": "bench|1",
+                "aud": settings.AUTH0_AUDIENCE,
+                "iss": f"https://{settings.AUTH0_DOMAIN}/",
+                "iat": now,
+                "exp": now + int(ttl),
+                settings.AUTH0_NAMESPACE + "roles": ["storekeeper", "admin"],
+            },
+            pem.decode(), algorithm="RS256", headers={"kid": self.KID},
+        )
+        self._server = None
+
+    def serve(self) -> str:
+        """Start the JWKS endpoint; returns its URL."""
+        jwks = self.jwks
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(jwks)))
+                self.end_headers()
+                self.wfile.write(jwks)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, name="bench-jwks", daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_port}/.well-known/jwks.json"
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+
+
+# ---------- server ----------
+def start_server(port: int, workers: int, jwks_url: str) -> subprocess.Popen:
+    env = dict(os.environ, AUTH0_JWKS_URL=jwks_url)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        env=env,
+    )
+    client = Client(f"http://127.0.0.1:{port}")
+    for _ in range(100):
+        try:
+            if client.request("GET", "/api/health")[0] == 200:
+                client.close()
+                return proc
+        except OSError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("uvicorn did not start")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(old_path: str, new_path: str) -> None:
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    key = lambda r: (r["dataset_ledger_rows"], r["scenario"], r["concurrency"])
+    before = {key(r): r for r in old["results"]}
+    print(f"{'scenario':34} {'conc':>4} {'rps':>18} {'p95 ms':>20} {'p99 ms':>20}")
+    for r in new["results"]:
+        b = before.get(key(r))
+        if not b:
+            continue
+
+        def delta(field):
+            if not b[field] or r[field] is None:
+                return f"{r[field]}"
+            return f"{b[field]:.1f}->{r[field]:.1f} ({(r[field] / b[field] - 1) * 100:+.0f}%)"
+
+        print(f"{r['scenario']:34} {r['concurrency']:>4} {delta('throughput_rps'):>18} "
+              f"{delta('p95_ms'):>20} {delta('p99_ms'):>20}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark hot API endpoints")
+    p.add_argument("--base-url", help="use a running server instead of starting uvicorn")
+    p.add_argument("--token", default=os.environ.get("BENCH_TOKEN"),
+                   help="bearer token for --base-url (default: $BENCH_TOKEN)")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--workers", type=int, default=1, help="uvicorn workers when the harness starts the server")
+    p.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    p.add_argument("--duration", type=float, default=10.0, help="seconds per scenario and level")
+    p.add_argument("--scenarios", help="comma-separated subset (default: all)")
+    p.add_argument("--sizes", help="comma-separated ledger sizes; re-seeds the DB with tools.datagen --truncate")
+    p.add_argument("--out", default="bench_results", help="directory for result JSON")
+    p.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    args = p.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    levels = [int(c) for c in args.concurrency.split(",")]
+    sizes = [int(s) for s in args.sizes.split(",")] if args.sizes else [None]
+    auth = None
+    if args.base_url:
+        if not args.token:
+            raise SystemExit("--base-url needs --token or BENCH_TOKEN")
+        token, proc = args.token, None
+    else:
+        # токен живе весь прогін: розміри x сценарії x рівні, з запасом
+        auth = BenchAuth(ttl=24 * 3600)
+        token, proc = auth.token, start_server(args.port, args.workers, auth.serve())
+    base_url = args.base_url or f"http://127.0.0.1:{args.port}"
+
+    results = []
+    try:
+        for size in sizes:
+            if size is not None:
+                datagen.generate(datagen.build_parser().parse_args(["--ledger-rows", str(size), "--truncate"]))
+            fx = Fixtures()
+            scenarios = build_scenarios(fx)
+            wanted = args.scenarios.split(",") if args.scenarios else list(scenarios)
+            for name in wanted:
+                if name not in scenarios:
+                    raise SystemExit(f"Unknown scenario: {name}")
+                for c in levels:
+                    r = run_load(base_url, token, scenarios[name], c, args.duration)
+                    r.update(scenario=name, concurrency=c, dataset_ledger_rows=fx.size["stock_ledger"])
+                    results.append(r)
+                    print(f"{name:34} c={c:<4} {r['throughput_rps']:>9.1f} rps  "
+                          f"p50={r['p50_ms']}ms p95={r['p95_ms']}ms p99={r['p99_ms']}ms errors={r['errors']}")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+        if auth is not None:
+            auth.close()
+
+    os.makedirs(args.out, exist_ok=True)
+    commit = git_commit()
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(args.out, f"{stamp}-{commit}.json")
+    with open(path, "w") as f:
+        json.dump({
+            "meta": {
+                "commit": commit,
+                "timestamp": stamp,
+                "python": platform.python_version(),
+                "host": platform.node(),
+                "base_url": base_url,
+                "workers": None if args.base_url else args.workers,
+                "duration_s": args.duration,
+            },
+            "results": results,
+        }, f, indent=2)
+    print(f"results: {path}")
+
+
+if __name__ == "__main__":
+    main()
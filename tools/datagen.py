@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Synthetic production-scale dataset for the warehouse schema.
+
+Creates categories, materials, warehouses, clients and suppliers, then a
+dated stream of receipts and issues with their items, stock_ledger rows
+and the matching stock_current balances. Everything is bulk loaded with
+COPY in batches.
+
+- material popularity follows a Zipf law (--zipf), so a few SKUs take
+  most of the movements
+- document dates are seasonal (yearly wave, quieter weekends)
+- issues never oversell: running balances are tracked while generating,
+  so stock_current always equals the ledger sum
+
+Generated rows get fresh ids above the current max and new master data,
+so the tool can append to a non-empty database; --truncate wipes it first.
+
+Usage (from the project root, DATABASE_URL as for the API):
+    python -m tools.datagen --materials 50000 --ledger-rows 10000000 --truncate
+"""
+import argparse
+import csv
+import io
+import math
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.db import engine
+
+MASTER_TABLES = ["categories", "suppliers", "clients", "warehouses", "materials"]
+DOC_TABLES = ["receipts", "receipt_items", "issues", "issue_items", "stock_ledger", "stock_current"]
+
+COLUMNS = {
+    "categories": ["id", "name", "description"],
+    "suppliers": ["id", "name", "contact_info"],
+    "clients": ["id", "name", "contact_info"],
+    "warehouses": ["id", "name", "address", "manager_name", "capacity", "capacity_unit"],
+    "materials": ["id", "code", "name", "unit", "weight_per_unit", "description", "price",
+                  "currency", "min_stock", "category_id", "is_active"],
+    "receipts": ["id", "document_number", "date", "supplier_id", "currency", "total_amount", "created_at", "notes"],
+    "receipt_items": ["id", "receipt_id", "material_id", "warehouse_id", "qty", "unit_price",
+                      "currency", "total_price"],
+    "issues": ["id", "document_number", "date", "client_id", "currency", "total_amount", "created_at", "notes"],
+    "issue_items": ["id", "issue_id", "material_id", "warehouse_id", "qty", "unit_price",
+                    "currency", "total_price"],
+    "stock_ledger": ["id", "warehouse_id", "material_id", "date_time", "movement_type", "qty_change",
+                     "unit_price", "currency", "total_price", "reference_doc_type", "reference_doc_id", "remarks"],
+    "stock_current": ["id", "warehouse_id", "material_id", "quantity", "reserved_quantity", "last_updated"],
+}
+
+UNITS = ["pcs", "kg", "m", "l", "box", "pack"]
+
+
+def money(cents: int) -> str:
+    sign = "-" if cents < 0 else ""
+    cents = abs(cents)
+    return f"{sign}{cents // 100}.{cents % 100:02d}"
+
+
+class CopyBatch:
+    """CSV buffers per table, flushed with COPY in FK order."""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self._reset()
+
+    def _reset(self):
+        self.buffers = {t: io.StringIO() for t in self.tables}
+        self.writers = {t: csv.writer(self.buffers[t], lineterminator="\n") for t in self.tables}
+        self.rows = 0
+
+    def add(self, table, row):
+        self.writers[table].writerow(row)
+        self.rows += 1
+
+    def flush(self, cur):
+        for t in self.tables:
+            buf = self.buffers[t]
+            if buf.tell() == 0:
+                continue
+            buf.seek(0)
+            cur.copy_expert(f"COPY {t} ({', '.join(COLUMNS[t])}) FROM STDIN WITH (FORMAT csv)", buf)
+        self._reset()
+
+
+def next_ids(cur) -> dict:
+    ids = {}
+    for t in MASTER_TABLES + DOC_TABLES:
+        cur.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {t}")
+        ids[t] = cur.fetchone()[0]
+    return ids
+
+
+def seasonal_timestamps(rng: random.Random, n: int, start: datetime, days: int) -> list:
+    """n sorted epoch seconds over [start, start+days) with yearly and weekly seasonality."""
+    weights = []
+    for d in range(days):
+        day = start + timedelta(days=d)
+        season = 1.0 + 0.35 * math.sin(2 * math.pi * (day.timetuple().tm_yday - 80) / 365.25)
+        weekday = 0.3 if day.weekday() >= 5 else 1.0
+        weights.append(season * weekday)
+    cum, acc = [], 0.0
+    for w in weights:
+        acc += w
+        cum.append(acc)
+    base = int(start.timestamp())
+    picked = rng.choices(range(days), cum_weights=cum, k=n)
+    # робочий день 07:00–21:00
+    out = [base + d * 86400 + rng.randint(7 * 3600, 21 * 3600) for d in picked]
+    out.sort()
+    return out
+
+
+def iso(ts: int) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+def generate(args):
+    rng = random.Random(args.seed)
+    raw = engine.raw_connection()
+    cur = raw.cursor()
+    t0 = time.perf_counter()
+
+    if args.truncate:
+        cur.execute("TRUNCATE " + ", ".join(DOC_TABLES + MASTER_TABLES) + " RESTART IDENTITY CASCADE")
+        raw.commit()
+
+    ids = next_ids(cur)
+
+    # ---------- master data ----------
+    master = CopyBatch(MASTER_TABLES)
+    category_ids = list(range(ids["categories"], ids["categories"] + args.categories))
+    for cid in category_ids:
+        master.add("categories", [cid, f"GEN Category {cid}", None])
+    supplier_ids = list(range(ids["suppliers"], ids["suppliers"] + args.suppliers))
+    for sid in supplier_ids:
+        master.add("suppliers", [sid, f"GEN Supplier {sid}", f"supplier{sid}@example.com"])
+    client_ids = list(range(ids["clients"], ids["clients"] + args.clients))
+    for cid in client_ids:
+        master.add("clients", [cid, f"GEN Client {cid}", f"client{cid}@example.com"])
+    warehouse_ids = list(range(ids["warehouses"], ids["warehouses"] + args.warehouses))
+    for wid in warehouse_ids:
+        master.add("warehouses", [wid, f"GEN Warehouse {wid}", f"Street {wid}", None, "100000.0000", "m3"])
+
+    material_ids = list(range(ids["materials"], ids["materials"] + args.materials))
+    price_cents = {}
+    for mid in material_ids:
+        cents = max(50, int(rng.lognormvariate(6.5, 1.2)))
+        price_cents[mid] = cents
+        master.add("materials", [
+            mid, f"GEN-{mid:07d}", f"Generated material {mid}", rng.choice(UNITS),
+            f"{rng.uniform(0.01, 25):.6f}", None, money(cents), "UAH",
+            f"{rng.choice([0, 0, 5, 10, 20, 50])}.0000", rng.choice(category_ids) if category_ids else None, "true",
+        ])
+    master.flush(cur)
+    raw.commit()
+    print(f"master data: {args.materials} materials, {args.warehouses} warehouses "
+          f"({time.perf_counter() - t0:.1f}s)")
+
+    # ---------- documents ----------
+    # Zipf: ранг r отримує вагу 1/r^s; ранги перемішані, щоб популярність не залежала від id
+    ranked = material_ids[:]
+    rng.shuffle(ranked)
+    cum, acc = [], 0.0
+    for r in range(1, len(ranked) + 1):
+        acc += 1.0 / (r ** args.zipf)
+        cum.append(acc)
+
+    avg_lines = (1 + args.max_lines) / 2
+    n_docs = int(args.ledger_rows / avg_lines * 1.3) + 1
+    start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=args.days)
+    stamps = seasonal_timestamps(rng, n_docs, start, args.days)
+
+    stock = {}          # (warehouse_id, material_id) -> qty
+    last_move = {}      # (warehouse_id, material_id) -> ts
+    by_warehouse = {w: [] for w in warehouse_ids}  # (w, m) that ever had stock, for issue picking
+    rid, riid = ids["receipts"], ids["receipt_items"]
+    iid, iiid = ids["issues"], ids["issue_items"]
+    lid = ids["stock_ledger"]
+    ledger_rows = 0
+    batch = CopyBatch(["receipts", "receipt_items", "issues", "issue_items", "stock_ledger"])
+
+    for ts in stamps:
+        if ledger_rows >= args.ledger_rows:
+            break
+        when = iso(ts)
+        n_lines = rng.randint(1, args.max_lines)
+        if rng.random() >= args.issue_share:
+            doc_id, rid = rid, rid + 1
+            total = 0
+            for mid in rng.choices(ranked, cum_weights=cum, k=n_lines):
+                wid = rng.choice(warehouse_ids)
+                qty = rng.randint(20, 200)
+                up = int(price_cents[mid] * rng.uniform(0.7, 0.9))
+                line = qty * up
+                total += line
+                batch.add("receipt_items", [riid, doc_id, mid, wid, qty, money(up), "UAH", money(line)])
+                batch.add("stock_ledger", [lid, wid, mid, when, "receipt", qty, money(up), "UAH", money(line),
+                                           "Receipt", doc_id, f"Receipt GEN-R-{doc_id}"])
+                riid, lid, ledger_rows = riid + 1, lid + 1, ledger_rows + 1
+                key = (wid, mid)
+                if key not in stock:
+                    stock[key] = 0
+                    by_warehouse[wid].append(key)
+                stock[key] += qty
+                last_move[key] = ts
+            batch.add("receipts", [doc_id, f"GEN-R-{doc_id}", when, rng.choice(supplier_ids) if supplier_ids else None,
+                                   "UAH", money(total), when, None])
+        else:
+            wid = rng.choice(warehouse_ids)
+            candidates = by_warehouse[wid]
+            if not candidates:
+                continue
+            lines = []
+            for key in {rng.choice(candidates) for _ in range(n_lines)}:
+                if stock[key] <= 0:
+                    continue
+                qty = min(stock[key], rng.randint(1, 30))
+                stock[key] -= qty
+                last_move[key] = ts
+                lines.append((key, qty))
+            if not lines:
+                continue
+            doc_id, iid = iid, iid + 1
+            total = 0
+            for (w, mid), qty in lines:
+                up = price_cents[mid]
+                line = qty * up
+                total += line
+                batch.add("issue_items", [iiid, doc_id, mid, w, qty, money(up), "UAH", money(line)])
+                batch.add("stock_ledger", [lid, w, mid, when, "issue", -qty, money(up), "UAH", money(line),
+                                           "Issue", doc_id, f"Issue GEN-I-{doc_id}"])
+                iiid, lid, ledger_rows = iiid + 1, lid + 1, ledger_rows + 1
+            batch.add("issues", [doc_id, f"GEN-I-{doc_id}", when, rng.choice(client_ids) if client_ids else None,
+                                 "UAH", money(total), when, None])
+
+        if batch.rows >= args.batch_rows:
+            batch.flush(cur)
+            raw.commit()
+            rate = ledger_rows / (time.perf_counter() - t0)
+            print(f"ledger rows: {ledger_rows:,} ({rate:,.0f}/s)")
+
+    batch.flush(cur)
+
+    # ---------- balances ----------
+    balances = CopyBatch(["stock_current"])
+    scid = ids["stock_current"]
+    for (wid, mid), qty in stock.items():
+        balances.add("stock_current", [scid, wid, mid, qty, 0, iso(last_move[(wid, mid)])])
+        scid += 1
+    balances.flush(cur)
+
+    for t in MASTER_TABLES + DOC_TABLES:
+        cur.execute(f"SELECT setval(pg_get_serial_sequence('{t}', 'id'), GREATEST((SELECT MAX(id) FROM {t}), 1))")
+    raw.commit()
+
+    # свіжа статистика, інакше планувальник бачить порожні таблиці
+    for t in MASTER_TABLES + DOC_TABLES:
+        cur.execute(f"ANALYZE {t}")
+    raw.commit()
+    cur.close()
+    raw.close()
+
+    print(f"done: {ledger_rows:,} ledger rows, {rid - ids['receipts']:,} receipts, "
+          f"{iid - ids['issues']:,} issues, {len(stock):,} stock rows in {time.perf_counter() - t0:.1f}s")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(description="Generate a large synthetic warehouse dataset")
+    p.add_argument("--categories", type=int, default=50)
+    p.add_argument("--materials", type=int, default=10000)
+    p.add_argument("--warehouses", type=int, default=10)
+    p.add_argument("--clients", type=int, default=2000)
+    p.add_argument("--suppliers", type=int, default=300)
+    p.add_argument("--ledger-rows", type=int, default=1_000_000, help="target number of stock_ledger rows")
+    p.add_argument("--days", type=int, default=730, help="history length")
+    p.add_argument("--max-lines", type=int, default=8, help="max items per document")
+    p.add_argument("--issue-share", type=float, default=0.6, help="fraction of documents that are issues")
+    p.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent of material popularity")
+    p.add_argument("--batch-rows", type=int, default=200_000, help="rows buffered per COPY batch")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--truncate", action="store_true", help="wipe all warehouse tables first")
+    return p
+
+
+def main():
+    generate(build_parser().parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Backfill / repair of the monthly stock_ledger rollups (stock_ledger_monthly).
+
+The trigger appends new ledger rows to stock_ledger_monthly_deltas and
+the API's fold thread merges them; --check counts unmerged deltas too,
+and --merge folds the whole backlog (e.g. with the API stopped). This tool
+recomputes whole months from stock_ledger. Use it after bulk fixes to
+old ledger rows, after restoring data with the trigger disabled, or to
+verify the rollups. Each month is rebuilt in its own transaction under
+a short SHARE lock on stock_ledger. Postings wait for the lock and are
+never lost.
+
+Usage (from the project root, DATABASE_URL as for the API):
+    python -m tools.rollup                        # every month present in the ledger
+    python -m tools.rollup --from 2024-01 --to 2024-06
+    python -m tools.rollup --check                # compare only, change nothing
+    python -m tools.rollup --merge                # merge pending deltas only
+"""
+import argparse
+import time
+from datetime import date
+
+from sqlalchemy import text
+
+from app.db import SessionLocal
+from app.ledger_rollup import ledger_months, merge_pending, month_bounds, next_month, rebuild_month
+
+_DIFF_SQL = text("""
+    WITH fresh AS (
+        SELECT warehouse_id, material_id, movement_type, SUM(qty_change) AS qty, COUNT(*) AS moves
+        FROM stock_ledger
+        WHERE warehouse_id IS NOT NULL AND material_id IS NOT NULL
+          AND date_time >= :start AND date_time < :end
+        GROUP BY 1, 2, 3
+    ),
+    stored AS (
+        SELECT warehouse_id, material_id, movement_type, SUM(qty) AS qty, SUM(moves) AS moves
+        FROM (
+            SELECT warehouse_id, material_id, movement_type, qty, moves
+            FROM stock_ledger_monthly WHERE month = :month
+            UNION ALL
+            SELECT warehouse_id, material_id, movement_type, qty, moves
+            FROM stock_ledger_monthly_deltas WHERE month = :month
+        ) r
+        GROUP BY 1, 2, 3
+    )
+    SELECT count(*) FROM fresh FULL JOIN stored USING (warehouse_id, material_id, movement_type)
+    WHERE fresh.qty IS DISTINCT FROM stored.qty OR fresh.moves IS DISTINCT FROM stored.moves
+""")
+
+
+def parse_month(value: str) -> date:
+    year, month = value.split("-")[:2]
+    return date(int(year), int(month), 1)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Rebuild monthly stock_ledger rollups")
+    p.add_argument("--from", dest="month_from", type=parse_month, help="first month, YYYY-MM")
+    p.add_argument("--to", dest="month_to", type=parse_month, help="last month (inclusive), YYYY-MM")
+    p.add_argument("--check", action="store_true", help="report months that differ, change nothing")
+    p.add_argument("--merge", action="store_true", help="merge pending rollup deltas and exit")
+    args = p.parse_args()
+
+    if args.merge:
+        merged = 0
+        while True:
+            with SessionLocal() as db:
+                n = merge_pending(db)
+                db.commit()
+            merged += n
+            if not n:
+                break
+        print(f"merged {merged} deltas")
+        return
+
+    with SessionLocal() as db:
+        first, last = ledger_months(db)
+    if first is None:
+        print("stock_ledger is empty")
+        return
+    month, last = args.month_from or first, args.month_to or last
+
+    mismatched = 0
+    while month <= last:
+        started = time.perf_counter()
+        with SessionLocal() as db:
+            if args.check:
+                start, end = month_bounds(month)
+                diff = db.execute(_DIFF_SQL, {"start": start, "end": end, "month": month}).scalar()
+                mismatched += bool(diff)
+                status = f"{diff} mismatched keys" if diff else "ok"
+            else:
+                rebuild_month(db, month)
+                db.commit()
+                status = "rebuilt"
+        print(f"{month:%Y-%m}  {status}  {time.perf_counter() - started:.2f}s")
+        month = next_month(month)
+
+    if args.check and mismatched:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
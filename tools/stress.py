@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress test for stock posting.
+
+Many workers hammer the same few hot (warehouse, material) pairs with a
+mix of create_issue, update_issue_full, create_receipt and adjust_stock
+calls. The tool records throughput, latency, lock waits (sampled from
+pg_locks), deadlocks (pg_stat_database) and serialization failures. It
+then checks the invariants on the hot pairs:
+
+- no negative available stock (quantity - reserved_quantity >= 0)
+- stock_current.quantity == SUM(stock_ledger.qty_change); compared as a
+  delta against the pre-run difference, so legacy data does not count
+
+Exits with status 1 if an invariant is broken, so it can gate a fix.
+A run in which no request succeeded, or any request got 401/403, also
+exits with status 1. Otherwise the invariants would hold trivially.
+
+Usage:
+    python -m tools.stress --workers 64 --duration 30 --hot-pairs 4
+    python -m tools.stress --mix create_issue=6,update_issue=1,create_receipt=2,adjust=1
+    BENCH_TOKEN=... python -m tools.stress --base-url http://host:8000
+
+The started server trusts a throwaway signing key, see tools.bench.BenchAuth.
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+from app.db import engine
+from tools.bench import BenchAuth, Client, percentile, start_server, git_commit
+
+DEFAULT_MIX = "create_issue=5,update_issue=1,create_receipt=2,adjust=1"
+
+
+def pick_hot_pairs(n: int, min_qty: int) -> list:
+    with engine.connect() as conn:
+        rows = conn.execute(text("""
+            SELECT warehouse_id, material_id FROM stock_current
+            WHERE quantity - reserved_quantity >= :q
+            ORDER BY quantity DESC LIMIT :n
+        """), {"q": min_qty, "n": n}).all()
+    if not rows:
+        raise SystemExit("No stocked pairs found: seed the database first (python -m tools.datagen)")
+    return [tuple(r) for r in rows]
+
+
+def pair_state(pairs: list) -> dict:
+    """(warehouse_id, material_id) -> available, quantity - ledger_sum ("drift") and row count.
+
+    Quantity includes unfolded stock_deltas, so journaled receipts are not counted as drift.
+    """
+    out = {}
+    with engine.connect() as conn:
+        for w, m in pairs:
+            row = conn.execute(text("""
+                WITH pending AS (
+                    SELECT COALESCE(SUM(delta), 0) AS q FROM stock_deltas
+                    WHERE warehouse_id = :w AND material_id = :m
+                )
+                SELECT sc.quantity + pending.q - sc.reserved_quantity,
+                       sc.quantity + pending.q - COALESCE((SELECT SUM(qty_change) FROM stock_ledger
+                                                           WHERE warehouse_id = :w AND material_id = :m), 0)
+                FROM stock_current sc, pending WHERE sc.warehouse_id = :w AND sc.material_id = :m
+            """), {"w": w, "m": m}).first()
+            rows = conn.execute(text(
+                "SELECT count(*) FROM stock_current WHERE warehouse_id = :w AND material_id = :m"
+            ), {"w": w, "m": m}).scalar()
+            out[(w, m)] = {"available": row[0], "drift": row[1], "rows": rows}
+    return out
+
+
+def deadlock_count() -> int:
+    with engine.connect() as conn:
+        return conn.execute(text(
+            "SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()"
+        )).scalar() or 0
+
+
+class LockSampler(threading.Thread):
+    """Samples ungranted locks every interval; waiting-seconds ~= sum(waiters) * interval."""
+
+    def __init__(self, interval: float = 0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = 0
+        self.waiter_samples = 0
+        self.max_waiters = 0
+        self._stop_evt = threading.Event()
+
+    def run(self):
+        with engine.connect() as conn:
+            while not self._stop_evt.is_set():
+                n = conn.execute(text("SELECT count(*) FROM pg_locks WHERE NOT granted")).scalar() or 0
+                conn.rollback()
+                self.samples += 1
+                self.waiter_samples += n
+                self.max_waiters = max(self.max_waiters, n)
+                self._stop_evt.wait(self.interval)
+
+    def stop(self) -> dict:
+        self._stop_evt.set()
+        self.join()
+        return {
+            "lock_wait_seconds_est": round(self.waiter_samples * self.interval, 3),
+            "avg_waiters": round(self.waiter_samples / self.samples, 3) if self.samples else 0,
+            "max_waiters": self.max_waiters,
+        }
+
+
+def classify(status: int, body: bytes) -> str:
+    if 200 <= status < 300:
+        return "ok"
+    text_ = body.decode(errors="replace").lower()
+    if "deadlock detected" in text_:
+        return "deadlock"
+    if "could not serialize" in text_:
+        return "serialization"
+    if "lock timeout" in text_ or "canceling statement due to lock timeout" in text_:
+        return "lock_timeout"
+    if status == 400 and "insufficient stock" in text_:
+        return "insufficient_stock"
+    if status == 0:
+        return "transport"
+    return f"http_{status}"
+
+
+def run(args):
+    pairs = pick_hot_pairs(args.hot_pairs, args.min_qty)
+    mix = {}
+    for part in args.mix.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    ops, weights = list(mix), list(mix.values())
+
+    before = pair_state(pairs)
+    deadlocks_before = deadlock_count()
+    issue_ids, issue_lock = [], threading.Lock()
+    stats = {op: {"latencies": [], "outcomes": {}} for op in ops}
+    stats_lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def items(rng, max_qty):
+        picks = rng.sample(pairs, k=rng.randint(1, min(3, len(pairs))))
+        return [{"warehouse_id": w, "material_id": m, "qty": str(rng.randint(1, max_qty)),
+                 "unit_price": "10.00"} for w, m in picks]
+
+    def request_for(op, rng):
+        if op == "create_issue":
+            return "POST", "/api/issues", {"document_number": f"STRESS-I-{uuid.uuid4().hex[:16]}",
+                                           "items": items(rng, args.issue_qty)}
+        if op == "update_issue":
+            with issue_lock:
+                iid = rng.choice(issue_ids) if issue_ids else None
+            if iid is None:
+                return request_for("create_issue", rng)
+            return "PUT", f"/api/issues/{iid}", {"items": items(rng, args.issue_qty)}
+        if op == "create_receipt":
+            return "POST", "/api/receipts", {"document_number": f"STRESS-R-{uuid.uuid4().hex[:16]}",
+                                             "items": items(rng, args.receipt_qty)}
+        if op == "adjust":
+            w, m = rng.choice(pairs)
+            return "POST", "/api/stock/adjust", {"warehouse_id": w, "material_id": m,
+                                                 "qty_delta": str(rng.randint(-args.issue_qty, args.receipt_qty))}
+        raise SystemExit(f"Unknown operation: {op}")
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = Client(args.base_url, args.token)
+        try:
+            while time.perf_counter() < deadline:
+                op = rng.choices(ops, weights=weights)[0]
+                method, path, body = request_for(op, rng)
+                start = time.perf_counter()
+                try:
+                    status, data = client.request(method, path, body)
+                except Exception:
+                    status, data = 0, b""
+                elapsed = time.perf_counter() - start
+                outcome = classify(status, data)
+                if outcome == "ok" and method == "POST" and path == "/api/issues":
+                    with issue_lock:
+                        issue_ids.append(json.loads(data)["id"])
+                with stats_lock:
+                    s = stats[op]
+                    s["latencies"].append(elapsed * 1000)
+                    s["outcomes"][outcome] = s["outcomes"].get(outcome, 0) + 1
+        finally:
+            client.close()
+
+    sampler = LockSampler()
+    sampler.start()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.workers)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    locks = sampler.stop()
+
+    after = pair_state(pairs)
+    violations = []
+    for key in pairs:
+        b, a = before[key], after[key]
+        if a["available"] is not None and a["available"] < 0:
+            violations.append({"pair": key, "invariant": "available >= 0", "available": str(a["available"])})
+        if a["drift"] != b["drift"]:
+            violations.append({"pair": key, "invariant": "quantity == ledger sum",
+                               "drift_before": str(b["drift"]), "drift_after": str(a["drift"])})
+        if a["rows"] != 1:
+            violations.append({"pair": key, "invariant": "one stock_current row", "rows": a["rows"]})
+
+    report = {"operations": {}, "wall_seconds": round(wall, 3), "workers": args.workers,
+              "hot_pairs": [list(p) for p in pairs], "locks": locks,
+              "deadlocks": deadlock_count() - deadlocks_before, "violations": violations}
+    total_ok = 0
+    for op, s in stats.items():
+        lat = sorted(s["latencies"])
+        ok = s["outcomes"].get("ok", 0)
+        total_ok += ok
+        report["operations"][op] = {
+            "requests": len(lat),
+            "ok_per_s": round(ok / wall, 2),
+            "outcomes": s["outcomes"],
+            "p50_ms": round(percentile(lat, 50), 3),
+            "p95_ms": round(percentile(lat, 95), 3),
+            "p99_ms": round(percentile(lat, 99), 3),
+        }
+    report["ok_per_s"] = round(total_ok / wall, 2)
+    report["ok_total"] = total_ok
+    report["auth_errors"] = sum(s["outcomes"].get(k, 0) for s in stats.values() for k in ("http_401", "http_403"))
+    report["serialization_errors"] = sum(s["outcomes"].get("serialization", 0) for s in stats.values())
+    return report
+
+
+def main():
+    p = argparse.ArgumentParser(description="Stress concurrent stock posting on hot SKUs")
+    p.add_argument("--base-url", help="use a running server instead of starting uvicorn")
+    p.add_argument("--token", default=os.environ.get("BENCH_TOKEN"),
+                   help="bearer token for --base-url (default: $BENCH_TOKEN)")
+    p.add_argument("--port", type=int, default=8766)
+    p.add_argument("--server-workers", type=int, default=4)
+    p.add_argument("--workers", type=int, default=32, help="concurrent clients")
+    p.add_argument("--duration", type=float, default=20.0)
+    p.add_argument("--hot-pairs", type=int, default=3)
+    p.add_argument("--min-qty", type=int, default=50, help="min available qty of a hot pair at start")
+    p.add_argument("--issue-qty", type=int, default=5, help="max qty per issue line")
+    p.add_argument("--receipt-qty", type=int, default=5, help="max qty per receipt line")
+    p.add_argument("--mix", default=DEFAULT_MIX, help="operation weights")
+    p.add_argument("--out", default="stress_results")
+    args = p.parse_args()
+
+    proc = auth = None
+    if args.base_url:
+        if not args.token:
+            raise SystemExit("--base-url needs --token or BENCH_TOKEN")
+    else:
+        auth = BenchAuth(ttl=args.duration + 3600)
+        args.token = auth.token
+        proc = start_server(args.port, args.server_workers, auth.serve())
+        args.base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        report = run(args)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+        if auth is not None:
+            auth.close()
+
+    for op, r in report["operations"].items():
+        print(f"{op:16} ok/s={r['ok_per_s']:>8}  p95={r['p95_ms']}ms p99={r['p99_ms']}ms  {r['outcomes']}")
+    print(f"deadlocks={report['deadlocks']} serialization={report['serialization_errors']} locks={report['locks']}")
+
+    os.makedirs(args.out, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(args.out, f"{stamp}-{git_commit()}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"results: {path}")
+
+    if report["violations"]:
+        print("INVARIANTS VIOLATED:")
+        for v in report["violations"]:
+            print(f"  {v}")
+        raise SystemExit(1)
+    # без успішних записів інваріанти нічого не доводять
+    if report["auth_errors"]:
+        print(f"RUN INVALID: {report['auth_errors']} requests rejected with 401/403")
+        raise SystemExit(1)
+    if not report["ok_total"]:
+        print("RUN INVALID: no request succeeded")
+        raise SystemExit(1)
+    print("invariants hold")
+
+
+if __name__ == "__main__":
+    main()